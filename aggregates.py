@@ -0,0 +1,79 @@
+import datastore
+from constants import EXPENSES_PATH, PLANS_PATH
+
+# 各計畫彙總索引
+# 一次掃過 expenses / plans 即建立 計畫 -> (已花、預計、各分類已花)，
+# 之後每筆新增、修改、刪除只調整受影響的計畫，不必重新掃描整份帳本。
+
+def _new_entry():
+    return {"spent": 0.0, "planned": 0.0, "by_category": {}}
+
+class ProjectTotals(datastore.DerivedIndex):
+    def __init__(self, store, expenses_path=EXPENSES_PATH, plans_path=PLANS_PATH):
+        self.expenses_key = store.key(expenses_path)
+        self.plans_key = store.key(plans_path)
+        self._projects = {}
+        super().__init__(store, (expenses_path, plans_path))
+
+    def _entry(self, project):
+        entry = self._projects.get(project)
+        if entry is None:
+            entry = self._projects[project] = _new_entry()
+        return entry
+
+    def _apply_expense(self, e, sign):
+        amount = float(e["amount"]) * sign
+        entry = self._entry(e["project"])
+        entry["spent"] += amount
+        cats = entry["by_category"]
+        cats[e["category"]] = cats.get(e["category"], 0.0) + amount
+
+    def _apply_plan(self, p, sign):
+        self._entry(p["project"])["planned"] += float(p["amount"]) * sign
+
+    def _rebuild(self, key, rows):
+        if key == self.expenses_key:
+            for entry in self._projects.values():
+                entry["spent"] = 0.0
+                entry["by_category"] = {}
+            for e in rows:
+                self._apply_expense(e, 1)
+        else:
+            for entry in self._projects.values():
+                entry["planned"] = 0.0
+            for p in rows:
+                self._apply_plan(p, 1)
+
+    def _update(self, key, op, index, old, new):
+        apply = self._apply_expense if key == self.expenses_key else self._apply_plan
+        if old is not None:
+            apply(old, -1)
+        if new is not None:
+            apply(new, 1)
+
+    def get(self, project):
+        self.refresh()
+        with self._lock:
+            entry = self._projects.get(project)
+            if entry is None:
+                return _new_entry()
+            return {"spent": entry["spent"], "planned": entry["planned"],
+                    "by_category": dict(entry["by_category"])}
+
+    def spent(self, project):
+        return self.get(project)["spent"]
+
+    def planned(self, project):
+        return self.get(project)["planned"]
+
+    def by_category(self, project):
+        return self.get(project)["by_category"]
+
+    def all(self):
+        self.refresh()
+        with self._lock:
+            return {name: {"spent": e["spent"], "planned": e["planned"],
+                           "by_category": dict(e["by_category"])}
+                    for name, e in self._projects.items()}
+
+totals = ProjectTotals(datastore.store)
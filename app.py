@@ -2,48 +2,148 @@ import streamlit as st
 import json
 import os
 from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import datastore
+import aggregates
+import balances
+import consistency
+import forecast
+import journal
+import ledger
+import metrics
+import rollups
+import search
+import timeline
+from constants import CATEGORIES
+
+# reports 與 bulk_edit 會載入 pandas（約 0.5 秒），只在打開報表或批次編輯時才匯入
 
 # 全局常量
-CATEGORIES = [
-    "人事費", "業務費", "行政管理費", "雜支費",
-    "設備費", "國外差旅費", "國內旅費", "資本門", "經常門"
-]
+LOGIN_LOG_KEEP = 1000
+PAGE_SIZES = [10, 20, 50, 100]
+SEARCH_LIMIT = 50
+# 管理面板最多列出的不一致項目數
+ISSUE_LIMIT = 20
 
 # 輔助函數
 def ensure_file(path, default):
-    if not os.path.exists(path):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(default, f, ensure_ascii=False, indent=2)
+    datastore.ensure(path, default)
 
 def load_json(path, default):
+    metrics.count(path, "loads")
+    try:
+        ensure_file(path, default)
+        return datastore.load(path)
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取 {path}: {str(e)}")
+        return default
+
+# 唯讀版本：直接回傳所有工作階段共用的快照，不複製，呼叫端不可修改
+def read_json(path, default):
+    metrics.count(path, "loads")
     try:
         ensure_file(path, default)
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return datastore.pinned(path)
     except (json.JSONDecodeError, IOError) as e:
         st.error(f"無法讀取 {path}: {str(e)}")
         return default
 
 def save_json(path, data):
+    metrics.count(path, "saves")
+    try:
+        datastore.save(path, data)
+    except IOError as e:
+        st.error(f"無法寫入 {path}: {str(e)}")
+
+# 呼叫會寫入資料的函式；寫入失敗時顯示錯誤並回傳 False
+def write_ok(fn, *args):
+    try:
+        fn(*args)
+        return True
+    except IOError as e:
+        st.error(f"無法寫入資料: {str(e)}")
+        return False
+
+# 沒有 ID 的紀錄（例如補 ID 時所在的資料檔讀取失敗）無法以 ID 修改或刪除，清單中略過
+def has_id(record):
+    return isinstance(record, dict) and bool(record.get("id"))
+
+# 清單篩選與分頁：只有目前這一頁的紀錄會建立元件，重繪時間取決於每頁筆數而非帳本大小
+# 依名稱 / 分類 / 日期區間篩選，回傳 (原始索引, 紀錄)，最新的在前；日期為 YYYY-MM-DD 字串，可直接比較
+def filter_records(records, name=None, category=None, start=None, end=None, name_field="project"):
+    # 欄式帳本直接比對代碼與整數日期，只展開分頁後實際顯示的紀錄
+    if isinstance(records, ledger.Ledger) and name_field == "project":
+        return ledger.Rows(records, records.select(name, category, start, end)[::-1])
+    result = []
+    for idx in range(len(records) - 1, -1, -1):
+        r = records[idx]
+        if name and r.get(name_field) != name:
+            continue
+        if category and r.get("category") != category:
+            continue
+        d = r.get("date", "")
+        if start and d < start:
+            continue
+        if end and d > end:
+            continue
+        result.append((idx, r))
+    return result
+
+def record_filters(key, names, label="計畫", categories=None):
+    cols = st.columns(3 if categories else 2)
+    name = cols[0].selectbox(label, ["全部"] + names, key=f"{key}_filter_name")
+    category = "全部"
+    if categories:
+        category = cols[1].selectbox("分類", ["全部"] + categories, key=f"{key}_filter_category")
+    dates = cols[-1].date_input("日期區間", value=(), key=f"{key}_filter_dates")
+    dates = [d.strftime("%Y-%m-%d") for d in dates]
+    return {
+        "name": None if name == "全部" else name,
+        "category": None if category == "全部" else category,
+        "start": dates[0] if dates else None,
+        "end": dates[1] if len(dates) > 1 else None,
+    }
+
+def paginate(items, key):
+    col1, col2, col3 = st.columns([1, 1, 2])
+    size = col1.selectbox("每頁筆數", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    pages = max(1, (len(items) + size - 1) // size)
+    # 篩選後頁數變少時，把停留的頁碼拉回範圍內
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = col2.number_input("頁數", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page")
+    col3.caption(f"共 {len(items)} 筆，第 {page} / {pages} 頁")
+    return items[(page - 1) * size:page * size]
+
+# 逐筆寫入：只更新單筆紀錄，衍生索引隨之增量更新；修改與刪除以紀錄 ID 指定
+def append_record(path, record):
+    metrics.count(path, "saves")
+    try:
+        datastore.append(path, record)
+    except IOError as e:
+        st.error(f"無法寫入 {path}: {str(e)}")
+
+def update_record(path, rid, record):
+    metrics.count(path, "saves")
+    try:
+        datastore.update_by_id(path, rid, record)
+    except IOError as e:
+        st.error(f"無法寫入 {path}: {str(e)}")
+
+def delete_record(path, rid):
+    metrics.count(path, "saves")
     try:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        datastore.delete_by_id(path, rid)
     except IOError as e:
         st.error(f"無法寫入 {path}: {str(e)}")
 
+# 建立缺少的資料檔並替舊資料補上紀錄 ID；每個行程只實際執行一次，之後的 rerun 直接返回
 def load_data():
-    os.makedirs("data", exist_ok=True)
-    ensure_file("data/budgets.json", [])
-    ensure_file("data/expenses.json", [])
-    ensure_file("data/plans.json", [])
-    ensure_file("data/students.json", [])
-    ensure_file("data/lab_cash.json", [])
-    ensure_file("data/student_cash_log.json", [])
-    ensure_file("data/vendors.json", [])
-    ensure_file("data/notes.json", [])
-    ensure_file("data/login_log.json", [])
+    try:
+        datastore.bootstrap()
+    except IOError as e:
+        st.error(f"無法建立資料檔: {str(e)}")
 
 # 身份驗證
 def authenticate():
@@ -59,46 +159,153 @@ def authenticate():
             st.session_state.jarvis_authenticated = True
             st.session_state.jarvis_username = "admin"
             login_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            login_log = load_json("data/login_log.json", [])
-            login_log.append({"username": st.session_state.jarvis_username, "login_time": login_time})
-            save_json("data/login_log.json", login_log)
+            ensure_file("data/login_log.json", [])
+            append_record("data/login_log.json", {"username": st.session_state.jarvis_username, "login_time": login_time})
+            journal.rotate(datastore.store, "data/login_log.json", LOGIN_LOG_KEEP)
             st.rerun()
         else:
             st.error("密碼錯誤，請再試一次")
 
-# 主應用
+# 本次 rerun 目前已建立的元件數（Streamlit 內部的元件 ID 集合，不同版本的位置不同）
+def widget_count():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return 0
+    ids = getattr(getattr(ctx, "shared", ctx), "widget_ids_this_run", None)
+    if ids is None:
+        return 0
+    return len(ids.snapshot() if hasattr(ids, "snapshot") else ids)
+
+def run_view(view):
+    with metrics.view(view.__name__, widget_count):
+        view()
+
+# 主應用：每次 rerun 記錄各畫面耗時、讀寫量與元件數（見 metrics.py）
 def main():
+    ctx = get_script_run_ctx()
+    metrics.recorder.begin_run(ctx.session_id if ctx is not None else None)
+    try:
+        render_main()
+    finally:
+        metrics.recorder.end_run(widget_count())
+
+def render_main():
     import os
-    load_data()
+    # 本次 rerun 讀到的資料固定為同一版快照，其他工作階段的寫入下次 rerun 才會看到
+    datastore.begin_view()
+    with metrics.view("load_data"):
+        load_data()
     st.set_page_config("Lab Budget System", layout="wide")
     st.write("Running main function")
     st.markdown("<h1 style='font-size:3.2em;margin-bottom:0;'>ANG</h1>", unsafe_allow_html=True)
     st.markdown("<p style='font-size:1em;color:gray;margin-top:0;'>Animal Nutrigenomics Lab</p>", unsafe_allow_html=True)
     st.markdown(f"**使用者**: {st.session_state.jarvis_username}")
-    login_log = load_json("data/login_log.json", [])
+    try:
+        login_log = datastore.tail("data/login_log.json", 1)
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取 data/login_log.json: {str(e)}")
+        login_log = []
     if login_log:
         last_login = login_log[-1]["login_time"]
         st.markdown(f"**最近登入時間**: {last_login}")
-    tabs = st.tabs(["📊 預算總覽", "💸 經費紀錄 / 規劃", "🌀 代墊永動機", "📁 計畫管理", "🏢 廠商紀錄", "📒 經費規劃筆記"])
-    with tabs[0]: overview_view()
-    with tabs[1]: finance_view()
-    with tabs[2]: funds_view()
-    with tabs[3]: project_view()
-    with tabs[4]: vendor_view()
-    with tabs[5]: notes_view()
+    views = {
+        "📊 預算總覽": overview_view,
+        "💸 經費紀錄 / 規劃": finance_view,
+        "🌀 代墊永動機": funds_view,
+        "📁 計畫管理": project_view,
+        "🏢 廠商紀錄": vendor_view,
+        "📒 經費規劃筆記": notes_view,
+        "📅 月 / 季統計": rollup_view,
+        "🔎 搜尋": search_view,
+    }
+    if os.environ.get("LAB_BUDGET_NAV") == "tabs":
+        # 舊的分頁模式：st.tabs 只是切換顯示，每次 rerun 六個畫面都會執行
+        tabs = st.tabs(list(views))
+        for tab, view in zip(tabs, views.values()):
+            with tab:
+                run_view(view)
+    else:
+        # 預設只執行選取的畫面；其他畫面用到的彙總、預測與報表都快取在各自的模組中，
+        # 切換回來時不必重算，每次互動的耗時只取決於目前這個畫面
+        selected = st.radio("功能", list(views), horizontal=True, key="main_nav", label_visibility="collapsed")
+        run_view(views[selected])
+    if st.session_state.jarvis_username == "admin":
+        with st.sidebar:
+            admin_view()
+
+# 管理面板：顯示的是已完成的 rerun，不含正在執行的這一次
+def admin_view():
+    with st.expander("🛠️ 效能監測"):
+        runs = metrics.recorder.recent()
+        if runs:
+            last = runs[-1]
+            st.caption(f"最近一次 rerun：{last['seconds'] * 1000:.0f} ms，{last['widgets']} 個元件（共記錄 {len(runs)} 次）")
+        # st.dataframe 會載入 pandas，需要時才顯示表格
+        if st.toggle("顯示明細", key="admin_metrics_tables"):
+            st.markdown("**各畫面耗時（ms）**")
+            st.dataframe(metrics.recorder.view_summary(), hide_index=True)
+            st.markdown("**檔案讀寫（本行程累計）**")
+            st.dataframe(metrics.recorder.io_summary(), hide_index=True)
+        cache = datastore.stats()
+        st.caption(f"快取命中 {cache['hits']} / 未命中 {cache['misses']}（{cache['hit_rate']:.0%}）")
+        col1, col2 = st.columns(2)
+        if col1.button("匯出 JSON Lines", key="admin_metrics_dump"):
+            try:
+                n = metrics.recorder.dump(path=metrics.METRICS_PATH)
+                st.success(f"已寫入 {n} 筆到 {metrics.METRICS_PATH}")
+            except IOError as e:
+                st.error(f"無法寫入 {metrics.METRICS_PATH}: {str(e)}")
+        if col2.button("清除紀錄", key="admin_metrics_reset"):
+            metrics.recorder.reset()
+            st.rerun()
+    with st.expander("🩺 資料一致性"):
+        consistency_panel()
+
+# 跨檔一致性：計數已隨每次寫入增量更新，每次 rerun 檢查只需數毫秒
+def consistency_panel():
+    try:
+        issues = consistency.checker.check()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法檢查資料: {str(e)}")
+        return
+    message = st.session_state.pop("consistency_result", None)
+    if message:
+        st.success(message)
+    if not issues:
+        st.caption("✅ 資料一致")
+        return
+    st.warning(f"發現 {len(issues)} 項不一致")
+    for issue in issues[:ISSUE_LIMIT]:
+        st.text(consistency.describe(issue))
+    if len(issues) > ISSUE_LIMIT:
+        st.caption(f"另有 {len(issues) - ISSUE_LIMIT} 項未列出，完整清單請執行 python consistency.py verify")
+    names = [b["name"] for b in read_json("data/budgets.json", [])]
+    renames = {}
+    for orphan in sorted({i["name"] for i in issues if i["kind"] == "orphan_project"}, key=str):
+        target = st.selectbox(f"「{orphan}」的紀錄改到", ["（不處理）"] + names, key=f"consistency_rename_{orphan}")
+        if target != "（不處理）":
+            renames[orphan] = target
+    drop = st.checkbox("重複的支出 / 規劃只保留第一筆", key="consistency_drop_duplicates")
+    if st.button("🔧 修復", key="consistency_repair"):
+        try:
+            fixed = consistency.checker.repair(renames, drop)
+        except IOError as e:
+            st.error(f"無法寫入資料: {str(e)}")
+            return
+        st.session_state["consistency_result"] = (
+            f"補上 ID {fixed['ids']} 筆、重建餘額 {fixed['balances']} 項、"
+            f"改到既有計畫 {fixed['renamed']} 筆、移除重複紀錄 {fixed['removed']} 筆")
+        st.rerun()
 
 # 預算總覽
 def get_spending(project_name):
-    expenses = load_json("data/expenses.json", [])
-    return sum(e["amount"] for e in expenses if e["project"] == project_name)
+    return aggregates.totals.spent(project_name)
 
 def get_planned(project_name):
-    plans = load_json("data/plans.json", [])
-    return sum(p["amount"] for p in plans if p["project"] == project_name)
+    return aggregates.totals.planned(project_name)
 
 def get_cash_total():
-    cash = load_json("data/lab_cash.json", [])
-    return sum(c["amount"] if c["type"] == "inflow" else -c["amount"] for c in cash)
+    return balances.engine.lab_balance()
 
 def render_multicolor_bar(percent_spent, percent_plan):
     green_width = int(percent_spent * 100)
@@ -114,25 +321,39 @@ def overview_view():
     st.markdown("<p style='font-size: 0.8em; color: gray;'>made by YuCheng Xu</p>", unsafe_allow_html=True)
     st.markdown("## 📊 預算總覽")
 
-    budgets = load_json("data/budgets.json", [])
-
     st.subheader("💰 實驗室金庫總額")
-    st.metric("目前餘額", f"${get_cash_total():,.0f}")
+    try:
+        cash = get_cash_total()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取金庫餘額: {str(e)}")
+        cash = 0.0
+    st.metric("目前餘額", f"${cash:,.0f}")
 
     st.subheader("📁 各計畫執行情況")
-    def get_sort_key(p):
-        end = p.get("end_date", "")
-        try:
-            return datetime.strptime(end, "%Y-%m-%d")
-        except:
-            return datetime.max
-    budgets.sort(key=get_sort_key)
-    for proj in budgets:
+    # 依結束日排序、距結束月份數都在 timeline 中預先算好，不必每次 rerun 解析日期
+    try:
+        entries = timeline.timeline.ordered()
+        groups = timeline.timeline.buckets()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取 data/budgets.json: {str(e)}")
+        entries, groups = [], {}
+    ending = [f"{label} {len(groups[m])} 個" for m, label in [(0, "本月結束"), (1, "下個月結束"), (2, "兩個月後結束")]
+              if groups.get(m)]
+    if ending:
+        st.caption("⏰ " + "、".join(ending))
+    # 彙總與預測索引直接讀取資料檔；支出或規劃無法解析時顯示錯誤，各計畫以 0 顯示
+    try:
+        forecasts = forecast.forecaster.forecast_all()
+        totals = {e.name: (get_spending(e.name), get_planned(e.name)) for e in entries}
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取支出 / 規劃紀錄: {str(e)}")
+        forecasts, totals = {}, {}
+    for entry in entries:
+        proj = entry.record
         name = proj["name"]
         cat = proj.get("categories", {})
         total_budget = sum(cat.values())
-        spent = get_spending(name)
-        planned = get_planned(name)
+        spent, planned = totals.get(name, (0.0, 0.0))
         remaining = total_budget - spent - planned
 
         percent_spent = spent / total_budget if total_budget > 0 else 0
@@ -142,46 +363,84 @@ def overview_view():
             percent_plan = 1 - percent_spent
             percent_total = 1
 
-        end_date_str = proj.get("end_date", "")
-        expiry_note = ""
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-                today = datetime.today()
-                months_left = (end_date.year - today.year) * 12 + (end_date.month - today.month)
-                if 0 <= months_left <= 2:
-                    expiry_note = " ⚠️" * (3 - months_left)
-            except:
-                pass
-        st.markdown(f"### {name}{expiry_note}")
+        st.markdown(f"### {name}{entry.warning}")
 
         st.markdown(render_multicolor_bar(percent_spent, percent_plan), unsafe_allow_html=True)
         st.text(f"實際執行率：{percent_spent*100:.1f}%")
         st.text(f"預計執行率：{percent_plan*100:.1f}%")
         st.text(f"總執行率：{percent_total*100:.1f}%")
         st.text(f"預算：${total_budget:.0f} ｜ 已花：${spent:.0f} ｜ 預計：${planned:.0f} ｜ 剩餘：${remaining:.0f}")
+        outlook = forecasts.get(name)
+        if outlook and outlook["depletes"]:
+            message = f"近 {forecast.forecaster.window} 個月平均每月支出 ${outlook['burn']:,.0f}，預計 {outlook['depletes']} 用罄"
+            if outlook["before_end"]:
+                st.warning(f"🔥 {message}（早於結束月份 {outlook['end_month']}）")
+            else:
+                st.text(f"🔥 {message}")
+
+    # 報表需要 pandas，打開時才匯入與計算（expander 收合時內容仍會執行）
+    if st.toggle("📈 執行率報表", key="overview_reports"):
+        reports_view(forecasts)
 
     st.subheader("📝 規劃支出清單")
-    plans = load_json("data/plans.json", [])
-    for i, plan in enumerate(plans[::-1]):
-        index = len(plans) - 1 - i
+    plans = read_json("data/plans.json", [])
+    for _, plan in paginate(filter_records(plans), "overview_plans"):
+        if not has_id(plan):
+            continue
         st.markdown(f"- **{plan['project']}** | {plan['category']} | ${plan['amount']:.0f} | {plan['note']} | {plan['date']}")
-        if st.button("✅ 已報銷", key=f"overview_convert_{i}"):
-            expenses = load_json("data/expenses.json", [])
-            expenses.append(plan)
-            save_json("data/expenses.json", expenses)
-            del plans[index]
-            save_json("data/plans.json", plans)
-            st.success("已轉為實際支出")
-            st.rerun()
+        if st.button("✅ 已報銷", key=f"overview_convert_{plan['id']}"):
+            # transaction 只負責上鎖，不會回復；支出寫入成功才刪除規劃，避免寫入失敗時規劃消失
+            metrics.count("data/expenses.json", "saves")
+            with datastore.transaction("data/expenses.json", "data/plans.json"):
+                moved = write_ok(datastore.append, "data/expenses.json", plan)
+                if moved:
+                    metrics.count("data/plans.json", "saves")
+                    moved = write_ok(datastore.delete_by_id, "data/plans.json", plan["id"])
+            if moved:
+                st.success("已轉為實際支出")
+                st.rerun()
+
+# 執行率報表；資料檔無法解析時只顯示錯誤，總覽其餘部分照常顯示
+def reports_view(forecasts):
+    import reports
+
+    try:
+        project_rates = reports.current_project_rates()
+        execution_rates = reports.current_execution_rates()
+        burn = reports.current_monthly_burn()
+        remaining = reports.current_remaining_by_category()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法產生報表: {str(e)}")
+        return
+    report_tabs = st.tabs(["各計畫", "各分類", "每月支出", "分類剩餘額度", "用罄預測"])
+    with report_tabs[0]:
+        st.dataframe(project_rates.rename(columns={
+            "project": "計畫", "allocated": "預算", "spent": "已花", "planned": "預計",
+            "spent_rate": "實際執行率", "planned_rate": "預計執行率", "remaining": "剩餘"}), hide_index=True)
+    with report_tabs[1]:
+        st.dataframe(execution_rates.rename(columns={
+            "project": "計畫", "category": "分類", "allocated": "預算", "spent": "已花", "planned": "預計",
+            "spent_rate": "實際執行率", "planned_rate": "預計執行率", "total_rate": "總執行率"}), hide_index=True)
+    with report_tabs[2]:
+        burn.columns = burn.columns.astype(str)
+        st.dataframe(burn)
+    with report_tabs[3]:
+        st.dataframe(remaining)
+    with report_tabs[4]:
+        st.dataframe([
+            {"計畫": name, "分類": cat, "預算": f["allocated"], "已花": f["spent"], "每月支出": f["burn"],
+             "預計用罄": f["depletes"] or "-", "早於結束": "⚠️" if f["before_end"] else ""}
+            for name, outlook in forecasts.items()
+            for cat, f in outlook["categories"].items()
+        ], hide_index=True)
 
 # 經費紀錄與規劃
 def finance_view():
     st.header("💸 經費紀錄 / 規劃")
 
-    expenses = load_json("data/expenses.json", [])
-    plans = load_json("data/plans.json", [])
-    budgets = load_json("data/budgets.json", [])
+    expenses = read_json("data/expenses.json", [])
+    plans = read_json("data/plans.json", [])
+    budgets = read_json("data/budgets.json", [])
     project_names = [b["name"] for b in budgets]
 
     st.subheader("✅ 實際支出")
@@ -192,11 +451,10 @@ def finance_view():
         note1 = st.text_input("備註", key="finance_en1")
         d1 = st.date_input("日期", value=datetime.today(), key="finance_ed1")
         if st.form_submit_button("新增支出"):
-            expenses.append({
+            append_record("data/expenses.json", {
                 "project": p1, "category": c1, "amount": a1,
                 "note": note1, "date": d1.strftime("%Y-%m-%d")
             })
-            save_json("data/expenses.json", expenses)
             st.success("已新增支出")
             st.rerun()
 
@@ -208,77 +466,189 @@ def finance_view():
         note2 = st.text_input("備註", key="finance_pn2")
         d2 = st.date_input("預計日期", value=datetime.today(), key="finance_pd2")
         if st.form_submit_button("新增規劃"):
-            plans.append({
+            append_record("data/plans.json", {
                 "project": p2, "category": c2, "amount": a2,
                 "note": note2, "date": d2.strftime("%Y-%m-%d")
             })
-            save_json("data/plans.json", plans)
             st.success("已新增規劃")
             st.rerun()
 
     st.divider()
+    if st.toggle("📥 批次匯入 CSV / Excel", key="finance_import_mode"):
+        import_view(project_names)
+    if st.toggle("🧮 批次編輯模式", key="finance_bulk_mode"):
+        bulk_edit_view("data/expenses.json", expenses, "finance_bulk_exp", "📋 支出紀錄", project_names)
+        bulk_edit_view("data/plans.json", plans, "finance_bulk_plan", "📋 規劃列表", project_names)
+        return
+
     st.subheader("📋 支出紀錄")
-    for i, e in enumerate(expenses[::-1]):
-        uid = f"exp_{i}_{e['project']}_{e['category']}"
+    filters = record_filters("finance_exp", project_names, categories=CATEGORIES)
+    for i, e in paginate(filter_records(expenses, **filters), "finance_exp"):
+        if not has_id(e):
+            continue
+        uid = f"exp_{e['id']}"
         with st.expander(f"{e['project']} - {e['category']} - ${e['amount']:.0f}"):
             with st.form(f"finance_edit_{uid}"):
                 amt = st.number_input("金額", value=e["amount"], key=f"finance_ea_{uid}")
                 note = st.text_input("備註", value=e["note"], key=f"finance_en_{uid}")
-                date = st.date_input("日期", value=datetime.strptime(e["date"], "%Y-%m-%d"), key=f"finance_ed_{uid}")
+                date = st.date_input("日期", value=ledger.record_date(expenses, i), key=f"finance_ed_{uid}")
                 if st.form_submit_button("更新"):
-                    expenses[len(expenses) - 1 - i]["amount"] = amt
-                    expenses[len(expenses) - 1 - i]["note"] = note
-                    expenses[len(expenses) - 1 - i]["date"] = date.strftime("%Y-%m-%d")
-                    save_json("data/expenses.json", expenses)
+                    update_record("data/expenses.json", e["id"],
+                                  dict(e, amount=amt, note=note, date=date.strftime("%Y-%m-%d")))
                     st.success("已更新")
                     st.rerun()
             if st.button("❌ 刪除", key=f"finance_del_{uid}"):
-                del expenses[len(expenses) - 1 - i]
-                save_json("data/expenses.json", expenses)
+                delete_record("data/expenses.json", e["id"])
                 st.warning("已刪除")
                 st.rerun()
 
     st.subheader("📋 規劃列表")
-    for i, p in enumerate(plans[::-1]):
-        uid = f"plan_{i}_{p['project']}_{p['category']}"
+    filters = record_filters("finance_plan", project_names, categories=CATEGORIES)
+    for i, p in paginate(filter_records(plans, **filters), "finance_plan"):
+        if not has_id(p):
+            continue
+        uid = f"plan_{p['id']}"
         with st.expander(f"{p['project']} - {p['category']} - ${p['amount']:.0f}"):
             with st.form(f"finance_edit_{uid}"):
                 amt = st.number_input("金額", value=p["amount"], key=f"finance_pa_{uid}")
                 note = st.text_input("備註", value=p["note"], key=f"finance_pn_{uid}")
-                date = st.date_input("日期", value=datetime.strptime(p["date"], "%Y-%m-%d"), key=f"finance_pd_{uid}")
+                date = st.date_input("日期", value=ledger.record_date(plans, i), key=f"finance_pd_{uid}")
                 if st.form_submit_button("更新"):
-                    plans[len(plans) - 1 - i]["amount"] = amt
-                    plans[len(plans) - 1 - i]["note"] = note
-                    plans[len(plans) - 1 - i]["date"] = date.strftime("%Y-%m-%d")
-                    save_json("data/plans.json", plans)
+                    update_record("data/plans.json", p["id"],
+                                  dict(p, amount=amt, note=note, date=date.strftime("%Y-%m-%d")))
                     st.success("已更新")
                     st.rerun()
             if st.button("❌ 刪除", key=f"finance_del_{uid}"):
-                del plans[len(plans) - 1 - i]
-                save_json("data/plans.json", plans)
+                delete_record("data/plans.json", p["id"])
                 st.warning("已刪除")
                 st.rerun()
 
+# 批次編輯：整張表格在 form 內編輯，送出時只比對差異、寫入一次、重新整理一次
+def bulk_edit_view(path, records, key, title, project_names):
+    import bulk_edit
+
+    st.subheader(title)
+    message = st.session_state.pop(f"{key}_result", None)
+    if message:
+        st.success(message)
+    filters = record_filters(key, project_names, categories=CATEGORIES)
+    rows = filter_records(records, **filters)
+    frame = bulk_edit.to_frame(rows)
+    # data_editor 的編輯依列的位置保存；表格中的紀錄（被其他工作階段新增、刪除或換了篩選）改變時，
+    # 換一個元件 key 讓編輯重新開始，已送出的表格若不是目前這些紀錄則拒絕套用，不會套到別筆
+    ids = tuple(frame["_id"])
+    shown = st.session_state.get(f"{key}_ids", ids)
+    st.session_state[f"{key}_ids"] = ids
+    with st.form(f"{key}_form"):
+        edited = st.data_editor(
+            frame, key=f"{key}_editor_{hash(ids) & 0xffffffff:x}", num_rows="dynamic",
+            hide_index=True, width="stretch",
+            column_config={
+                "_id": None,
+                "project": st.column_config.SelectboxColumn("計畫", options=project_names, required=True),
+                "category": st.column_config.SelectboxColumn("分類", options=CATEGORIES, required=True),
+                "amount": st.column_config.NumberColumn("金額", min_value=0.0, format="%.0f", required=True),
+                "note": st.column_config.TextColumn("備註"),
+                "date": st.column_config.DateColumn("日期", format="YYYY-MM-DD", required=True),
+            })
+        if st.form_submit_button("💾 儲存變更"):
+            if shown != ids:
+                st.error("資料已被其他人修改，請重新編輯")
+                return
+            ops, errors = bulk_edit.diff_frame(rows, edited, project_names, CATEGORIES)
+            for error in errors:
+                st.error(error)
+            if errors:
+                return
+            if not ops:
+                st.info("沒有變更")
+                return
+            # 在該檔的鎖內以 ID 找出目前的位置；已被刪除的紀錄會使整批不寫入
+            if write_ok(datastore.batch_by_id, path, ops):
+                st.session_state[f"{key}_result"] = f"已套用 {len(ops)} 筆變更"
+                st.rerun()
+
+# 批次匯入：上傳後先預覽每一列的驗證結果，確認後一次寫入；有任何錯誤的列時整批不匯入
+def import_view(project_names):
+    import importer
+
+    st.subheader("📥 批次匯入")
+    message = st.session_state.pop("finance_import_result", None)
+    if message:
+        st.success(message)
+    target = st.radio("匯入到", ["實際支出", "經費規劃"], horizontal=True, key="finance_import_target")
+    path = "data/expenses.json" if target == "實際支出" else "data/plans.json"
+    st.caption("表頭需有「計畫」「分類」「金額」「日期」欄（表頭上方的標題列會略過），「備註」可省略；"
+               "日期可為 2024-05-01、2024/5/1 或民國 113/05/01")
+    # 匯入完成後換一個 key，清掉已上傳的檔案
+    round_no = st.session_state.get("finance_import_round", 0)
+    upload = st.file_uploader("選擇檔案", type=["csv", "xlsx"], key=f"finance_import_file_{round_no}")
+    if upload is None:
+        return
+    try:
+        rows = importer.parse(upload.getvalue(), upload.name, path, project_names, CATEGORIES)
+    except importer.ImportFormatError as e:
+        st.error(str(e))
+        return
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取 {path}: {str(e)}")
+        return
+    counts = {status: sum(1 for r in rows if r["status"] == status)
+              for status in (importer.OK, importer.DUPLICATE, importer.ERROR)}
+    st.caption(f"共 {len(rows)} 列：可匯入 {counts[importer.OK]} 筆、重複 {counts[importer.DUPLICATE]} 筆、"
+               f"錯誤 {counts[importer.ERROR]} 筆")
+    labels = {importer.OK: "✅ 匯入", importer.DUPLICATE: "⚠️ 重複", importer.ERROR: "❌ 錯誤"}
+    st.dataframe([{
+        "列": r["line"],
+        "狀態": labels[r["status"]],
+        "計畫": (r["record"] or {}).get("project", ""),
+        "分類": (r["record"] or {}).get("category", ""),
+        "金額": (r["record"] or {}).get("amount"),
+        "日期": (r["record"] or {}).get("date", ""),
+        "備註": (r["record"] or {}).get("note", ""),
+        "說明": r["message"],
+    } for r in rows], hide_index=True)
+    if counts[importer.ERROR]:
+        st.error("請修正檔案中標示錯誤的列後重新上傳")
+        return
+    include = st.checkbox("重複的列也匯入", key="finance_import_dups")
+    total = counts[importer.OK] + (counts[importer.DUPLICATE] if include else 0)
+    if st.button(f"✅ 確認匯入 {total} 筆", key="finance_import_commit", disabled=total == 0):
+        try:
+            added, skipped = importer.commit(path, rows, include)
+        except IOError as e:
+            st.error(f"無法寫入 {path}: {str(e)}")
+            return
+        metrics.count(path, "saves")
+        result = f"已匯入 {added} 筆到{target}"
+        if skipped:
+            result += f"，略過 {skipped} 筆在預覽後才出現的重複紀錄"
+        st.session_state["finance_import_result"] = result
+        st.session_state["finance_import_round"] = round_no + 1
+        st.rerun()
+
 # 代墊永動機（已調整順序並新增移除功能）
 def funds_view():
-    lab_cash = load_json("data/lab_cash.json", [])
-    lab_total = sum(c["amount"] if c["type"] == "inflow" else -c["amount"] for c in lab_cash)
+    try:
+        lab_total = get_cash_total()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取金庫餘額: {str(e)}")
+        lab_total = 0.0
     st.header("🌀 代墊永動機")
     st.metric("實驗室金庫總額", f"${lab_total:,.0f}")
 
     # 學生帳戶餘額
-    students = load_json("data/students.json", [])
+    students = read_json("data/students.json", [])
     st.subheader("💰 學生帳戶餘額")
-    for i, s in enumerate(students):
+    for s in students:
         col1, col2 = st.columns([3, 1])
         with col1:
             st.markdown(f"<div style='font-size:1.3em'><b>{s['name']}</b>：${s['balance']:.0f}</div>", unsafe_allow_html=True)
         with col2:
-            if st.button("🗑️ 移除", key=f"funds_remove_student_{i}_{s['name']}"):
-                del students[i]
-                save_json("data/students.json", students)
-                st.success(f"已移除學生 {s['name']}")
-                st.rerun()
+            if has_id(s) and st.button("🗑️ 移除", key=f"funds_remove_student_{s['id']}"):
+                if write_ok(balances.engine.remove_student, s["id"]):
+                    st.success(f"已移除學生 {s['name']}")
+                    st.rerun()
 
     # 新增學生
     with st.expander("➕ 新增學生"):
@@ -286,27 +656,25 @@ def funds_view():
             new_name = st.text_input("學生姓名", key="funds_new_name")
             new_balance = st.number_input("初始餘額", step=100.0, value=0.0, key="funds_new_balance")
             if st.form_submit_button("新增"):
-                students.append({"name": new_name, "balance": new_balance})
-                save_json("data/students.json", students)
-                st.success("已新增學生")
-                st.rerun()
+                if write_ok(balances.engine.add_student, new_name, new_balance, datetime.today().strftime("%Y-%m-%d")):
+                    st.success("已新增學生")
+                    st.rerun()
 
     # 資金異動紀錄
-    records = load_json("data/student_cash_log.json", [])
+    records = read_json("data/student_cash_log.json", [])
     st.subheader("📄 資金異動紀錄")
-    for i, r in enumerate(records[::-1]):
-        idx = len(records) - 1 - i
+    filters = record_filters("funds_log", [s["name"] for s in students] + [balances.LAB_LOG_NAME], label="學生")
+    for _, r in paginate(filter_records(records, name_field="name", **filters), "funds_log"):
         with st.expander(f"{r.get('date', '-')}: {r.get('name', '-')} - {r.get('action', '-')} - ${r.get('amount', 0):.0f}"):
             st.markdown(f"**學生**: {r.get('name', '-')}")
             st.markdown(f"**動作**: {r.get('action', '-')}")
             st.markdown(f"**金額**: ${r.get('amount', 0):.0f}")
             st.markdown(f"**備註**: {r.get('note', '-')}")
             st.markdown(f"**日期**: {r.get('date', '-')}")
-            if st.button("🗑️ 刪除", key=f"funds_del_{i}_{r.get('name', '')}_{r.get('note', '')}"):
-                del records[idx]
-                save_json("data/student_cash_log.json", records)
-                st.success("已刪除紀錄")
-                st.rerun()
+            if has_id(r) and st.button("🗑️ 刪除", key=f"funds_del_{r['id']}"):
+                if write_ok(balances.engine.delete_log, r["id"]):
+                    st.success("已刪除紀錄")
+                    st.rerun()
 
     # 學生資金異動
     st.subheader("🎓 學生資金異動")
@@ -319,64 +687,13 @@ def funds_view():
 
     if st.button("執行異動", key="funds_execute"):
         if selected and selected != "尚無學生":
-            if action == "報銷" and lab_total < amount:
-                st.error("金庫餘額不足，無法報銷")
+            try:
+                error = balances.engine.student_action(selected, action, amount, note, date.strftime("%Y-%m-%d"))
+            except IOError as e:
+                error = f"無法寫入資料: {str(e)}"
+            if error:
+                st.error(error)
             else:
-                for s in students:
-                    if s["name"] == selected:
-                        if action == "代墊":
-                            s["balance"] -= amount
-                            records.append({
-                                "name": selected,
-                                "action": action,
-                                "amount": -amount,
-                                "note": note,
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                        elif action == "報銷":
-                            s["balance"] += amount
-                            records.append({
-                                "name": selected,
-                                "action": action,
-                                "amount": amount,
-                                "note": note,
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                            lab_cash.append({
-                                "amount": amount,
-                                "type": "outflow",
-                                "note": f"報銷給 {selected}",
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                            save_json("data/lab_cash.json", lab_cash)
-                        elif action == "發獎金":
-                            s["balance"] += amount
-                            records.append({
-                                "name": selected,
-                                "action": action,
-                                "amount": amount,
-                                "note": note,
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                            lab_cash.append({
-                                "amount": amount,
-                                "type": "outflow",
-                                "note": f"發獎金給 {selected}",
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                            save_json("data/lab_cash.json", lab_cash)
-                        elif action == "手動調整":
-                            s["balance"] = amount
-                            records.append({
-                                "name": selected,
-                                "action": action,
-                                "amount": amount,
-                                "note": note,
-                                "date": date.strftime("%Y-%m-%d")
-                            })
-                        break
-                save_json("data/students.json", students)
-                save_json("data/student_cash_log.json", records)
                 st.success("資金異動完成")
                 st.rerun()
 
@@ -386,16 +703,14 @@ def funds_view():
     selected_student = st.selectbox("選擇學生", student_names if student_names else ["尚無學生"], key="funds_edit_student")
     if selected_student and selected_student != "尚無學生":
         for s in students:
-            if s["name"] == selected_student:
-                with st.form(f"funds_edit_student_{selected_student}_{s['name']}"):
-                    new_student_name = st.text_input("學生姓名", value=s["name"], key=f"funds_edit_name_{selected_student}_{s['name']}")
-                    new_student_balance = st.number_input("餘額", value=s["balance"], step=100.0, key=f"funds_edit_balance_{selected_student}_{s['name']}")
+            if s["name"] == selected_student and has_id(s):
+                with st.form(f"funds_edit_student_{s['id']}"):
+                    new_student_name = st.text_input("學生姓名", value=s["name"], key=f"funds_edit_name_{s['id']}")
+                    new_student_balance = st.number_input("餘額", value=s["balance"], step=100.0, key=f"funds_edit_balance_{s['id']}")
                     if st.form_submit_button("儲存修改"):
-                        s["name"] = new_student_name
-                        s["balance"] = new_student_balance
-                        save_json("data/students.json", students)
-                        st.success("已更新學生資訊")
-                        st.rerun()
+                        if write_ok(balances.engine.edit_student, s["id"], new_student_name, new_student_balance, datetime.today().strftime("%Y-%m-%d")):
+                            st.success("已更新學生資訊")
+                            st.rerun()
                 break
 
     # 手動調整金庫餘額
@@ -407,44 +722,60 @@ def funds_view():
             cash_date = st.date_input("日期", value=datetime.today(), key="funds_cash_date")
             if st.form_submit_button("新增紀錄"):
                 if cash_note.strip():
-                    lab_cash.append({
-                        "amount": cash_amount,
-                        "type": cash_type,
-                        "note": cash_note,
-                        "date": cash_date.strftime("%Y-%m-%d")
-                    })
-                    save_json("data/lab_cash.json", lab_cash)
-                    records.append({
-                        "name": "Lab Cash",
-                        "action": "Adjustment",
-                        "amount": cash_amount if cash_type == "inflow" else -cash_amount,
-                        "note": cash_note,
-                        "date": cash_date.strftime("%Y-%m-%d")
-                    })
-                    save_json("data/student_cash_log.json", records)
-                    st.success("已更新金庫")
-                    st.rerun()
+                    if write_ok(balances.engine.adjust_lab_cash, cash_amount, cash_type, cash_note, cash_date.strftime("%Y-%m-%d")):
+                        st.success("已更新金庫")
+                        st.rerun()
                 else:
                     st.error("備註欄位不能為空")
 
+    # 核對餘額
+    with st.expander("🔍 核對餘額"):
+        st.caption("重播金庫與學生資金異動紀錄，與目前餘額比對")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("核對", key="funds_verify"):
+                issues = balances.engine.verify()
+                if not issues:
+                    st.success("餘額與紀錄一致")
+                for issue in issues:
+                    if issue["kind"] == "orphan_log":
+                        st.warning(f"紀錄無對應學生：{issue['name']}（重播餘額 ${issue['replayed']:,.0f}）")
+                    else:
+                        st.warning(f"{issue['name']}：目前 ${issue['stored']:,.0f}，依紀錄應為 ${issue['replayed']:,.0f}")
+        with col2:
+            if st.button("依紀錄重建餘額", key="funds_rebuild"):
+                if write_ok(balances.engine.rebuild):
+                    st.success("已重建餘額")
+                    st.rerun()
+
 # 計畫管理
 def calc_total_spending(project_name):
-    expenses = load_json("data/expenses.json", [])
-    return sum(float(e["amount"]) for e in expenses if e["project"] == project_name)
+    return aggregates.totals.spent(project_name)
 
 def project_view():
     st.header("📁 計畫清單")
 
-    budgets = load_json("data/budgets.json", [])
+    budgets = read_json("data/budgets.json", [])
+    try:
+        spending = {b["name"]: calc_total_spending(b["name"]) for b in budgets}
+        refs = consistency.checker.references()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取支出 / 規劃紀錄: {str(e)}")
+        spending, refs = {}, {}
 
     st.subheader("📊 現有計畫")
-    for idx, proj in enumerate(budgets):
+    for proj in budgets:
+        if not has_id(proj):
+            continue
+        idx = proj["id"]
         name = proj["name"]
         categories = proj.get("categories", {})
         start = proj.get("start_date", "")
         end = proj.get("end_date", "")
+        # 日期已在 timeline 中解析；其他工作階段剛刪除的計畫查不到時以今天代替
+        entry = timeline.timeline.entry(idx)
         total_budget = sum(categories.values())
-        spent = calc_total_spending(name)
+        spent = spending.get(name, 0.0)
         remaining = total_budget - spent
         percent = min(int(spent / total_budget * 100), 100) if total_budget > 0 else 0
 
@@ -456,27 +787,35 @@ def project_view():
 
             with st.form(f"project_edit_{idx}"):
                 new_name = st.text_input("計畫名稱", value=name, key=f"project_name_{idx}")
-                new_start = st.date_input("開始日期", value=datetime.strptime(start, "%Y-%m-%d") if start else datetime.today(), key=f"project_start_{idx}")
-                new_end = st.date_input("結束日期", value=datetime.strptime(end, "%Y-%m-%d") if end else datetime.today(), key=f"project_end_{idx}")
+                new_start = st.date_input("開始日期", value=(entry and entry.start) or datetime.today(), key=f"project_start_{idx}")
+                new_end = st.date_input("結束日期", value=(entry and entry.end) or datetime.today(), key=f"project_end_{idx}")
                 new_cats = {}
                 for cat in CATEGORIES:
                     amt = categories.get(cat, 0)
                     new_cats[cat] = st.number_input(f"{cat}", value=amt, min_value=0.0, format="%.0f", key=f"project_{cat}_{idx}")
                 submit = st.form_submit_button("更新")
                 if submit:
-                    budgets[idx] = {
-                        "name": new_name,
-                        "start_date": new_start.strftime("%Y-%m-%d"),
-                        "end_date": new_end.strftime("%Y-%m-%d"),
-                        "categories": new_cats
-                    }
-                    save_json("data/budgets.json", budgets)
-                    st.success("已更新")
-                    st.rerun()
+                    # 改名時支出與規劃在同一個 transaction 內跟著改，不會留下找不到計畫的紀錄
+                    metrics.count("data/budgets.json", "saves")
+                    try:
+                        moved = consistency.checker.update_project(idx, {
+                            "name": new_name,
+                            "start_date": new_start.strftime("%Y-%m-%d"),
+                            "end_date": new_end.strftime("%Y-%m-%d"),
+                            "categories": new_cats
+                        })
+                    except consistency.ProjectNameError as e:
+                        st.error(str(e))
+                    except IOError as e:
+                        st.error(f"無法寫入 data/budgets.json: {str(e)}")
+                    else:
+                        st.success(f"已更新，{moved} 筆支出 / 規劃一併改名" if moved else "已更新")
+                        st.rerun()
 
+            if refs.get(name):
+                st.caption(f"此計畫有 {refs[name]} 筆支出 / 規劃，刪除後這些紀錄會找不到計畫")
             if st.button("❌ 刪除", key=f"project_del_{idx}"):
-                del budgets[idx]
-                save_json("data/budgets.json", budgets)
+                delete_record("data/budgets.json", idx)
                 st.warning("已刪除")
                 st.rerun()
 
@@ -490,26 +829,34 @@ def project_view():
             cats[cat] = st.number_input(f"{cat}", min_value=0.0, format="%.0f", key=f"project_new_{cat}")
         submit = st.form_submit_button("新增")
         if submit:
-            budgets.append({
+            append_record("data/budgets.json", {
                 "name": pname,
                 "start_date": start.strftime("%Y-%m-%d"),
                 "end_date": end.strftime("%Y-%m-%d"),
                 "categories": cats
             })
-            save_json("data/budgets.json", budgets)
             st.success("計畫已新增")
             st.rerun()
 
 # 廠商管理
 def vendor_view():
     st.header("🏢 廠商資料與寄款管理")
-    vendors = load_json("data/vendors.json", [])
+    vendors = read_json("data/vendors.json", [])
 
     st.subheader("📋 廠商列表")
     total = sum(v["deposit"] for v in vendors)
     st.metric("總寄放金額", f"${total:,.0f}")
 
-    for i, v in enumerate(vendors):
+    keyword = st.text_input("搜尋廠商（名稱、統編、業務、備註）", key="vendor_search")
+    shown = vendors
+    if keyword.strip():
+        try:
+            ids = search.index.ids(keyword, "vendors")
+        except (json.JSONDecodeError, IOError) as e:
+            st.error(f"無法建立搜尋索引: {str(e)}")
+            ids = set()
+        shown = [v for v in vendors if v.get("id") in ids]
+    for v in paginate(shown, "vendor"):
         with st.expander(f"{v['name']} - ${v['deposit']:.0f}"):
             st.markdown(f"📇 統編：{v['vat']}")
             st.markdown(f"🏠 地址：{v['address']}")
@@ -519,11 +866,12 @@ def vendor_view():
             st.markdown(f"👤 業務：{v['representative']}")
             st.markdown(f"📝 備註：{v['note']}")
 
-            with st.form(f"vendor_edit_{i}_{v['name']}"):
-                new_deposit = st.number_input("更新寄放金額", value=v["deposit"], min_value=0.0, format="%.0f", key=f"vendor_dep_{i}_{v['name']}")
+            if not has_id(v):
+                continue
+            with st.form(f"vendor_edit_{v['id']}"):
+                new_deposit = st.number_input("更新寄放金額", value=v["deposit"], min_value=0.0, format="%.0f", key=f"vendor_dep_{v['id']}")
                 if st.form_submit_button("儲存修改"):
-                    vendors[i]["deposit"] = new_deposit
-                    save_json("data/vendors.json", vendors)
+                    update_record("data/vendors.json", v["id"], dict(v, deposit=new_deposit))
                     st.success("已更新金額")
                     st.rerun()
 
@@ -539,7 +887,7 @@ def vendor_view():
         note = st.text_area("備註", key="vendor_note")
         deposit = st.number_input("目前寄放金額", min_value=0.0, format="%.0f", key="vendor_deposit")
         if st.form_submit_button("新增"):
-            vendors.append({
+            append_record("data/vendors.json", {
                 "name": name,
                 "vat": vat,
                 "address": addr,
@@ -550,14 +898,13 @@ def vendor_view():
                 "note": note,
                 "deposit": deposit
             })
-            save_json("data/vendors.json", vendors)
             st.success("已新增廠商")
             st.rerun()
 
 # 經費規劃筆記
 def notes_view():
     st.header("📒 經費規劃筆記")
-    notes = load_json("data/notes.json", [])
+    notes = read_json("data/notes.json", [])
 
     st.subheader("➕ 新增筆記")
     with st.form("notes_add_note"):
@@ -565,20 +912,30 @@ def notes_view():
         note_content = st.text_area("筆記內容", key="notes_content")
         if st.form_submit_button("新增"):
             if note_content.strip():
-                notes.append({
+                append_record("data/notes.json", {
                     "date": note_date.strftime("%Y-%m-%d"),
                     "content": note_content,
                     "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 })
-                save_json("data/notes.json", notes)
                 st.success("已新增筆記")
                 st.rerun()
             else:
                 st.error("筆記內容不能為空")
 
     st.subheader("📋 歷史筆記")
-    for i, note in enumerate(notes[::-1]):
-        idx = len(notes) - 1 - i
+    keyword = st.text_input("搜尋筆記內容", key="notes_search")
+    shown = list(reversed(notes))
+    if keyword.strip():
+        try:
+            ids = search.index.ids(keyword, "notes")
+        except (json.JSONDecodeError, IOError) as e:
+            st.error(f"無法建立搜尋索引: {str(e)}")
+            ids = set()
+        shown = [n for n in shown if n.get("id") in ids]
+    for note in paginate(shown, "notes"):
+        if not has_id(note):
+            continue
+        idx = note["id"]
         with st.expander(f"{note['date']} - {note['content'][:30]}..."):
             st.markdown(f"**日期**: {note['date']}")
             st.markdown(f"**內容**: {note['content']}")
@@ -588,18 +945,91 @@ def notes_view():
                 new_date = st.date_input("日期", value=datetime.strptime(note["date"], "%Y-%m-%d"), key=f"notes_date_{idx}")
                 new_content = st.text_area("筆記內容", value=note["content"], key=f"notes_content_{idx}")
                 if st.form_submit_button("更新"):
-                    notes[idx]["date"] = new_date.strftime("%Y-%m-%d")
-                    notes[idx]["content"] = new_content
-                    save_json("data/notes.json", notes)
+                    update_record("data/notes.json", idx, dict(note, date=new_date.strftime("%Y-%m-%d"), content=new_content))
                     st.success("已更新筆記")
                     st.rerun()
 
             if st.button("❌ 刪除", key=f"notes_del_{idx}"):
-                del notes[idx]
-                save_json("data/notes.json", notes)
+                delete_record("data/notes.json", idx)
                 st.warning("已刪除筆記")
                 st.rerun()
 
+# 月 / 季支出統計：直接取 rollups 預先加總的月份桶，不掃描紀錄
+def rollup_view():
+    st.header("📅 月 / 季支出統計")
+    budgets = read_json("data/budgets.json", [])
+    cols = st.columns(3)
+    name = cols[0].selectbox("計畫", ["全部"] + [b["name"] for b in budgets], key="rollup_project")
+    category = cols[1].selectbox("分類", ["全部"] + CATEGORIES, key="rollup_category")
+    period = cols[2].radio("彙總", ["月", "季"], horizontal=True, key="rollup_period")
+    project = None if name == "全部" else name
+    category = None if category == "全部" else category
+    store = rollups.rollups
+    try:
+        # 月份選項取全部資料的範圍，切換計畫或分類時已選的區間仍然有效
+        bounds = store.bounds()
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法讀取支出紀錄: {str(e)}")
+        return
+    if bounds is None:
+        st.info("尚無支出或規劃紀錄")
+        return
+    months = [rollups.month_label(m) for m in range(bounds[0], bounds[1] + 1)]
+    if len(months) > 1:
+        start, end = st.select_slider("月份區間", options=months, value=(months[0], months[-1]), key="rollup_range")
+    else:
+        start = end = months[0]
+
+    col1, col2 = st.columns(2)
+    col1.metric("區間實際支出", f"${store.total('data/expenses.json', project, category, start, end):,.0f}")
+    col2.metric("區間規劃支出", f"${store.total('data/plans.json', project, category, start, end):,.0f}")
+    fetch = store.monthly if period == "月" else store.quarterly
+    spent = fetch(start, end, "data/expenses.json", project, category)
+    planned = fetch(start, end, "data/plans.json", project, category)
+    chart = {"期間": [label for label, _ in spent],
+             "實際支出": [v for _, v in spent],
+             "規劃支出": [v for _, v in planned]}
+    st.bar_chart(chart, x="期間", y=["實際支出", "規劃支出"])
+    if st.toggle("顯示數字", key="rollup_table"):
+        st.dataframe(chart, hide_index=True)
+
+# 全文搜尋：筆記、支出 / 規劃備註與廠商，依計畫、分類與日期縮小範圍
+def search_label(source, r):
+    if source == "notes":
+        return f"📒 {r.get('date', '')}｜{r.get('content', '')[:80]}"
+    if source == "vendors":
+        return f"🏢 {r.get('name', '')}（統編 {r.get('vat', '')}）｜業務：{r.get('representative', '')}｜{r.get('note', '')}"
+    icon = "💸" if source == "expenses" else "🗓️"
+    return f"{icon} {r.get('date', '')}｜{r.get('project', '')}｜{r.get('category', '')}｜${float(r.get('amount', 0)):,.0f}｜{r.get('note', '')}"
+
+def search_view():
+    st.header("🔎 搜尋")
+    budgets = read_json("data/budgets.json", [])
+    query = st.text_input("關鍵字（以空白分隔多個關鍵字，須全部符合）", key="search_query")
+    sources = st.multiselect("來源", list(search.SOURCE_LABELS), format_func=search.SOURCE_LABELS.get,
+                             key="search_sources", placeholder="全部")
+    filters = record_filters("search", [b["name"] for b in budgets], categories=CATEGORIES)
+    if not query.strip() and not any(filters.values()):
+        st.info("請輸入關鍵字或選擇篩選條件")
+        return
+    try:
+        result = search.index.search(query, sources=sources or None, project=filters["name"],
+                                     category=filters["category"], start=filters["start"],
+                                     end=filters["end"], limit=SEARCH_LIMIT)
+    except (json.JSONDecodeError, IOError) as e:
+        st.error(f"無法建立搜尋索引: {str(e)}")
+        return
+    st.caption(f"共 {result['total']} 筆符合，依日期顯示最新的 {len(result['hits'])} 筆")
+    facets = result["facets"]
+    cols = st.columns(4)
+    for col, (name, title) in zip(cols, [("source", "來源"), ("project", "計畫"), ("category", "分類"), ("month", "月份")]):
+        counts = list(facets[name].items())[:5]
+        if name == "source":
+            counts = [(search.SOURCE_LABELS[k], v) for k, v in counts]
+        col.markdown(f"**{title}**" + "".join(f"\n- {k}：{v}" for k, v in counts))
+    for hit in result["hits"]:
+        st.markdown(search_label(hit["source"], hit["record"]))
+
 if __name__ == "__main__":
     if "jarvis_authenticated" not in st.session_state:
         st.session_state.jarvis_authenticated = False
@@ -0,0 +1,511 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableSequence
+
+import metrics
+from journal import JOURNALED_FILES, Journal
+
+# 儲存後端
+# DataStore 只透過以下介面存取資料，JSON 檔與 SQLite 可互相替換：
+#   exists / stamp / read / write        整份讀寫
+#   append / update / delete             逐筆異動（data 為異動後的完整串列）
+#   apply                                一次套用多筆異動（ops 為依序的 append / update / delete）
+#   tail                                 讀最後幾筆（選用，無法快速讀取時回傳 None）
+#   iter_records                         逐筆串流讀取（選用），不必先建立整份串列
+# stamp 回傳的值只要內容變動就會改變，DataStore 用它判斷快取是否過期。
+
+class StorageError(IOError):
+    pass
+
+# 其他行程已修改同一份資料，快取中的位置對不上
+class StaleDataError(StorageError):
+    pass
+
+# 以 ID 指定的紀錄不存在（可能已被其他工作階段刪除）
+class RecordNotFoundError(StorageError):
+    pass
+
+# 檔案內容無法解析；為避免以空資料覆蓋掉原本的帳本，修復前拒絕寫入
+class CorruptDataError(StorageError):
+    pass
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _write_tmp(tmp, data):
+    with open(tmp, "w", encoding="utf-8") as f:
+        # 欄式帳本（ledger.Ledger）逐筆展開成 JSON 陣列
+        json.dump(data, f, ensure_ascii=False, indent=2, default=list)
+        f.flush()
+        os.fsync(f.fileno())
+        return os.fstat(f.fileno()).st_size
+
+# 以增量方式解析最上層為陣列的 JSON 檔：每次讀入 chunk_size 個字元，
+# 解析出完整的一筆就交出去並丟掉已解析的部分，記憶體只需容納一個區塊加一筆紀錄
+def iter_json_array(f, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    started = after_value = after_comma = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("JSON 陣列未結束" if started else "檔案是空的")
+            chunk = f.read(chunk_size)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError("最上層不是陣列")
+            started = True
+            pos += 1
+            continue
+        if ch == "]" and not after_comma:
+            return
+        if after_value:
+            if ch != ",":
+                raise ValueError(f"位置 {pos} 缺少逗號")
+            after_value, after_comma = False, True
+            pos += 1
+            continue
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # 紀錄被區塊切斷：多讀一塊再試；已到檔尾則是真的損毀
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        # 數字可能剛好被切在區塊邊界（如 "-15" | "00.0"），必須確認後面接的是分隔字元
+        if not eof and (end == len(buf) or buf[end] not in " \t\r\n,]"):
+            chunk = f.read(chunk_size)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        yield record
+        pos = end
+        after_value, after_comma = True, False
+
+# journaled 中列出的檔名改用 X.json + X.jsonl 日誌（見 journal.py），逐筆異動只寫一行
+class JsonFileBackend:
+    name = "json"
+
+    def __init__(self, journaled=(), compact_every=1000):
+        self.journaled = set(journaled)
+        self.compact_every = compact_every
+        self._journals = {}
+
+    def _journal(self, path):
+        if os.path.basename(path) not in self.journaled:
+            return None
+        key = os.path.normpath(path)
+        journal = self._journals.get(key)
+        if journal is None:
+            journal = self._journals[key] = Journal(path, compact_every=self.compact_every)
+        return journal
+
+    def exists(self, path):
+        journal = self._journal(path)
+        return os.path.exists(path) or (journal is not None and journal.exists())
+
+    def stamp(self, path):
+        journal = self._journal(path)
+        if journal is None:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        try:
+            st = os.stat(path)
+            base = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            if not journal.exists():
+                raise
+            base = None
+        return (base, journal.stamp())
+
+    # 呼叫端（DataStore）需持有該檔的鎖，中斷的壓縮才能安全地復原
+    def read(self, path):
+        journal = self._journal(path)
+        if journal is not None:
+            journal.recover(path)
+        if journal is not None and not os.path.exists(path):
+            return journal.replay([])
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            metrics.count(path, "bytes_read", os.fstat(f.fileno()).st_size)
+        if journal is not None:
+            journal.replay(data)
+        return data
+
+    # 原子寫入：先寫到同目錄的暫存檔並 fsync，再以 os.replace 取代正式檔，
+    # 當機時檔案只會是舊版或新版，不會是寫到一半的內容。
+    # 日誌檔的壓縮順序為 寫暫存檔 -> 日誌改名為 .old -> 取代正式檔 -> 刪除 .old，
+    # 任一步中斷都能由 Journal.recover 判斷應還原或收尾。
+    def write(self, path, data):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        metrics.count(path, "bytes_written", _write_tmp(tmp, data))
+        journal = self._journal(path)
+        if journal is not None:
+            journal.retire()
+        os.replace(tmp, path)
+        _fsync_dir(path)
+        if journal is not None:
+            journal.discard_retired()
+
+    # 非日誌檔無法只改一行，逐筆異動仍需整份重寫；日誌檔累積過多行時順便壓縮
+    def _row_op(self, path, data, log):
+        journal = self._journal(path)
+        if journal is None:
+            self.write(path, data)
+            return
+        log(journal)
+        if journal.needs_compaction():
+            self.write(path, data)
+
+    def append(self, path, data, record):
+        self._row_op(path, data, lambda j: j.append(record))
+
+    def update(self, path, data, index, record):
+        self._row_op(path, data, lambda j: j.update(index, record))
+
+    def delete(self, path, data, index):
+        self._row_op(path, data, lambda j: j.delete(index))
+
+    # 批次異動一律整份寫入一次（日誌檔則順便壓縮）
+    def apply(self, path, data, ops):
+        self.write(path, data)
+
+    def tail(self, path, n=1):
+        journal = self._journal(path)
+        if journal is None:
+            return None
+        return journal.tail(n)
+
+    # 串流讀取；日誌最多 compact_every 行，可整份讀入，
+    # 但含修改 / 刪除時位置會與正式檔交錯，改為讀取完整內容
+    def iter_records(self, path):
+        journal = self._journal(path)
+        pending = []
+        if journal is not None:
+            journal.recover(path)
+            pending = journal.entries()
+            if any(isinstance(e, dict) and "_op" in e for e in pending):
+                yield from self.read(path)
+                return
+        if journal is None or os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                metrics.count(path, "bytes_read", os.fstat(f.fileno()).st_size)
+                first = f.read(1)
+                while first.isspace():
+                    first = f.read(1)
+                f.seek(0)
+                if first != "[":
+                    # 不是陣列的檔案（如 balances.json）整份即為一筆
+                    yield json.load(f)
+                else:
+                    yield from iter_json_array(f)
+        yield from pending
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL DEFAULT 0,
+    document TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    project TEXT,
+    category TEXT,
+    date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_file ON records(file, id);
+CREATE INDEX IF NOT EXISTS records_project ON records(file, project);
+CREATE INDEX IF NOT EXISTS records_category ON records(file, category);
+CREATE INDEX IF NOT EXISTS records_date ON records(file, date);
+"""
+
+def _columns(record):
+    if not isinstance(record, dict):
+        return (None, None, None)
+    return (record.get("project"), record.get("category"), record.get("date"))
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+def _size(text):
+    return len(text.encode("utf-8"))
+
+# SQLite 後端：每個 JSON 檔對應 records 表中的一組資料列（依 id 排序），
+# 單筆新增、修改、刪除都只動一列，成本為 O(log n)。
+# 串列位置 -> rowid 的對照在讀取時建立並隨異動維護；
+# 若其他行程在期間寫入（revision 不符），異動會被拒絕而不是蓋掉對方的資料。
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, db_path="data/budget.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._rowids = {}
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        try:
+            self._conn().executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    def _name(self, path):
+        return os.path.basename(path)
+
+    def _revision(self, conn, name):
+        row = conn.execute("SELECT revision FROM files WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def exists(self, path):
+        try:
+            return self._revision(self._conn(), self._name(path)) is not None
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def stamp(self, path):
+        try:
+            revision = self._revision(self._conn(), self._name(path))
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        if revision is None:
+            raise FileNotFoundError(path)
+        return revision
+
+    def read(self, path):
+        name = self._name(path)
+        with self._tx() as conn:
+            row = conn.execute("SELECT revision, document FROM files WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(path)
+            revision, document = row
+            if document is not None:
+                metrics.count(path, "bytes_read", _size(document))
+                return json.loads(document)
+            rows = conn.execute("SELECT id, data FROM records WHERE file = ? ORDER BY id", (name,)).fetchall()
+        metrics.count(path, "bytes_read", sum(_size(r[1]) for r in rows))
+        with self._lock:
+            self._rowids[name] = (revision, [r[0] for r in rows])
+        return [json.loads(r[1]) for r in rows]
+
+    def write(self, path, data):
+        name = self._name(path)
+        with self._tx() as conn:
+            conn.execute("DELETE FROM records WHERE file = ?", (name,))
+            document = None if isinstance(data, MutableSequence) else _dumps(data)
+            conn.execute(
+                "INSERT INTO files (name, revision, document) VALUES (?, 1, ?) "
+                "ON CONFLICT(name) DO UPDATE SET revision = revision + 1, document = excluded.document",
+                (name, document))
+            ids = []
+            written = _size(document) if document is not None else 0
+            if document is None:
+                for record in data:
+                    text = _dumps(record)
+                    written += _size(text)
+                    cur = conn.execute(
+                        "INSERT INTO records (file, project, category, date, data) VALUES (?, ?, ?, ?, ?)",
+                        (name,) + _columns(record) + (text,))
+                    ids.append(cur.lastrowid)
+            revision = self._revision(conn, name)
+        metrics.count(path, "bytes_written", written)
+        with self._lock:
+            self._rowids[name] = (revision, ids)
+
+    # 確認 revision 與上次讀寫一致後才執行逐筆異動
+    def _row_op(self, path, fn):
+        name = self._name(path)
+        with self._lock:
+            known = self._rowids.get(name)
+            if known is None:
+                raise StaleDataError(f"{path} 尚未載入")
+            try:
+                with self._tx() as conn:
+                    if self._revision(conn, name) != known[0]:
+                        raise StaleDataError(f"{path} 已被其他工作階段修改，請重新整理")
+                    fn(conn, name, known[1])
+                    conn.execute("UPDATE files SET revision = revision + 1 WHERE name = ?", (name,))
+            except Exception:
+                # 對照表可能已被部分修改，下次讀取時重建
+                self._rowids.pop(name, None)
+                raise
+            self._rowids[name] = (known[0] + 1, known[1])
+
+    def append(self, path, data, record):
+        def op(conn, name, ids):
+            text = _dumps(record)
+            cur = conn.execute(
+                "INSERT INTO records (file, project, category, date, data) VALUES (?, ?, ?, ?, ?)",
+                (name,) + _columns(record) + (text,))
+            ids.append(cur.lastrowid)
+            metrics.count(path, "bytes_written", _size(text))
+        self._row_op(path, op)
+
+    def update(self, path, data, index, record):
+        def op(conn, name, ids):
+            text = _dumps(record)
+            conn.execute(
+                "UPDATE records SET project = ?, category = ?, date = ?, data = ? WHERE id = ?",
+                _columns(record) + (text, ids[index]))
+            metrics.count(path, "bytes_written", _size(text))
+        self._row_op(path, op)
+
+    def delete(self, path, data, index):
+        def op(conn, name, ids):
+            conn.execute("DELETE FROM records WHERE id = ?", (ids[index],))
+            del ids[index]
+        self._row_op(path, op)
+
+    # 多筆異動在同一個 SQLite transaction 內完成
+    def apply(self, path, data, ops):
+        def op(conn, name, ids):
+            for kind, index, record in ops:
+                if kind == "append":
+                    text = _dumps(record)
+                    cur = conn.execute(
+                        "INSERT INTO records (file, project, category, date, data) VALUES (?, ?, ?, ?, ?)",
+                        (name,) + _columns(record) + (text,))
+                    ids.append(cur.lastrowid)
+                    metrics.count(path, "bytes_written", _size(text))
+                elif kind == "update":
+                    text = _dumps(record)
+                    conn.execute(
+                        "UPDATE records SET project = ?, category = ?, date = ?, data = ? WHERE id = ?",
+                        _columns(record) + (text, ids[index]))
+                    metrics.count(path, "bytes_written", _size(text))
+                else:
+                    conn.execute("DELETE FROM records WHERE id = ?", (ids[index],))
+                    del ids[index]
+        self._row_op(path, op)
+
+    # 以游標分批取出，一次只解析 chunk_size 列
+    def iter_records(self, path, chunk_size=1000):
+        name = self._name(path)
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT document FROM files WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(path)
+            if row[0] is not None:
+                metrics.count(path, "bytes_read", _size(row[0]))
+                yield json.loads(row[0])
+                return
+            cur = conn.execute("SELECT data FROM records WHERE file = ? ORDER BY id", (name,))
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                metrics.count(path, "bytes_read", sum(_size(r[0]) for r in rows))
+                for r in rows:
+                    yield json.loads(r[0])
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def tail(self, path, n=1):
+        try:
+            rows = self._conn().execute(
+                "SELECT data FROM records WHERE file = ? ORDER BY id DESC LIMIT ?",
+                (self._name(path), n)).fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                self.conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self.conn.execute("ROLLBACK")
+                raise StorageError(str(e)) from e
+            return False
+        self.conn.execute("ROLLBACK")
+        if issubclass(exc_type, sqlite3.Error):
+            raise StorageError(str(exc)) from exc
+        return False
+
+# 依環境變數選擇後端：LAB_BUDGET_STORAGE=sqlite 時使用 LAB_BUDGET_DB（預設 data/budget.db）
+def make_backend():
+    kind = os.environ.get("LAB_BUDGET_STORAGE", "json").lower()
+    if kind == "sqlite":
+        return SqliteBackend(os.environ.get("LAB_BUDGET_DB", "data/budget.db"))
+    return JsonFileBackend(journaled=JOURNALED_FILES)
+
+# 一次性匯入 / 匯出 data/*.json
+def import_json(backend, json_dir="data"):
+    source = JsonFileBackend(journaled=JOURNALED_FILES)
+    imported = []
+    for fname in sorted(os.listdir(json_dir)):
+        if not fname.endswith(".json"):
+            continue
+        path = os.path.join(json_dir, fname)
+        backend.write(path, source.read(path))
+        imported.append(fname)
+    return imported
+
+def export_json(backend, json_dir="data"):
+    target = JsonFileBackend(journaled=JOURNALED_FILES)
+    conn = backend._conn()
+    names = [r[0] for r in conn.execute("SELECT name FROM files ORDER BY name")]
+    for name in names:
+        path = os.path.join(json_dir, name)
+        target.write(path, backend.read(path))
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 與 SQLite 儲存後端之間的資料搬移")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("--db", default="data/budget.db")
+    parser.add_argument("--dir", default="data")
+    args = parser.parse_args()
+    backend = SqliteBackend(args.db)
+    if args.command == "import":
+        names = import_json(backend, args.dir)
+        print(f"已匯入 {len(names)} 個檔案至 {args.db}: {', '.join(names)}")
+    else:
+        names = export_json(backend, args.dir)
+        print(f"已從 {args.db} 匯出 {len(names)} 個檔案至 {args.dir}: {', '.join(names)}")
+
+if __name__ == "__main__":
+    main()
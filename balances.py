@@ -0,0 +1,229 @@
+import argparse
+
+import datastore
+from constants import BALANCES_PATH, LAB_CASH_PATH, STUDENT_LOG_PATH, STUDENTS_PATH
+
+# 學生資金異動中代表金庫調整（而非學生）的紀錄
+LAB_LOG_NAME = "Lab Cash"
+# 直接設定餘額的動作；其餘動作的 amount 為增減量
+SET_ACTIONS = ("手動調整",)
+
+# 餘額引擎
+# 金庫餘額存在 data/balances.json，學生餘額存在 students.json，兩者都是物化的結果：
+# 每筆異動在同一個 transaction 內寫入紀錄並以 O(1) 調整餘額，一般讀取不必掃描歷史。
+# verify / rebuild 重播 lab_cash.json 與 student_cash_log.json，找出並修正與物化值不符之處；
+# 重播以 iter_records 逐筆走訪，尚未載入的歷史不必整份解析進記憶體。
+
+def cash_delta(entry):
+    amount = float(entry["amount"])
+    return amount if entry["type"] == "inflow" else -amount
+
+def apply_log(balance, entry):
+    if entry.get("action") in SET_ACTIONS:
+        return float(entry["amount"])
+    return balance + float(entry["amount"])
+
+def _empty_balances():
+    return {"lab_cash": {"balance": 0.0, "entries": 0}}
+
+class BalanceEngine:
+    def __init__(self, store):
+        self.store = store
+
+    def _transaction(self):
+        return self.store.transaction(STUDENTS_PATH, STUDENT_LOG_PATH, LAB_CASH_PATH, BALANCES_PATH)
+
+    def _balances(self):
+        if not self.store.exists(BALANCES_PATH):
+            # 第一次使用時由歷史紀錄建立
+            with self.store.transaction(LAB_CASH_PATH, BALANCES_PATH):
+                if not self.store.exists(BALANCES_PATH):
+                    self.store.save(BALANCES_PATH, self._replay_lab_cash())
+        return self.store.snapshot(BALANCES_PATH)
+
+    def lab_balance(self):
+        return self._balances()["lab_cash"]["balance"]
+
+    # 先取得（必要時由歷史建立）物化餘額再寫入紀錄，新紀錄才不會被重播與增量各算一次
+    def _add_lab_cash(self, entry):
+        balances = datastore.clone(self._balances())
+        self.store.append(LAB_CASH_PATH, entry)
+        balances["lab_cash"]["balance"] += cash_delta(entry)
+        balances["lab_cash"]["entries"] += 1
+        self.store.save(BALANCES_PATH, balances)
+
+    def adjust_lab_cash(self, amount, cash_type, note, date):
+        with self._transaction():
+            self._add_lab_cash({"amount": amount, "type": cash_type, "note": note, "date": date})
+            self.store.append(STUDENT_LOG_PATH, {
+                "name": LAB_LOG_NAME,
+                "action": "Adjustment",
+                "amount": amount if cash_type == "inflow" else -amount,
+                "note": note,
+                "date": date
+            })
+
+    # 學生資金異動；金庫餘額不足以報銷時回傳錯誤訊息，不寫入任何資料
+    def student_action(self, name, action, amount, note, date):
+        with self._transaction():
+            if action == "報銷" and self.lab_balance() < amount:
+                return "金庫餘額不足，無法報銷"
+            students = self.store.load(STUDENTS_PATH)
+            for s in students:
+                if s["name"] != name:
+                    continue
+                entry = {"name": name, "action": action, "amount": amount, "note": note, "date": date}
+                if action == "代墊":
+                    entry["amount"] = -amount
+                elif action in ("報銷", "發獎金"):
+                    verb = "報銷給" if action == "報銷" else "發獎金給"
+                    self._add_lab_cash({"amount": amount, "type": "outflow", "note": f"{verb} {name}", "date": date})
+                s["balance"] = apply_log(s["balance"], entry)
+                self.store.append(STUDENT_LOG_PATH, entry)
+                self.store.save(STUDENTS_PATH, students)
+                return None
+            return f"找不到學生 {name}"
+
+    # 初始餘額以「手動調整」記錄，重播時才能得到相同的結果
+    def add_student(self, name, balance, date):
+        with self._transaction():
+            students = self.store.load(STUDENTS_PATH)
+            students.append({"name": name, "balance": balance})
+            self.store.save(STUDENTS_PATH, students)
+            if balance:
+                self.store.append(STUDENT_LOG_PATH, {
+                    "name": name, "action": "手動調整", "amount": balance, "note": "初始餘額", "date": date
+                })
+
+    # 改名時一併更新歷史紀錄中的姓名；餘額有變動時記一筆手動調整
+    def edit_student(self, rid, name, balance, date):
+        with self._transaction():
+            old = self.store.get(STUDENTS_PATH, rid)
+            if name != old["name"]:
+                log = self.store.load(STUDENT_LOG_PATH)
+                renamed = False
+                for r in log:
+                    if r.get("name") == old["name"]:
+                        r["name"] = name
+                        renamed = True
+                if renamed:
+                    self.store.save(STUDENT_LOG_PATH, log)
+            if balance != old["balance"]:
+                self.store.append(STUDENT_LOG_PATH, {
+                    "name": name, "action": "手動調整", "amount": balance, "note": "編輯學生餘額", "date": date
+                })
+            self.store.update_by_id(STUDENTS_PATH, rid, dict(old, name=name, balance=balance))
+
+    def remove_student(self, rid):
+        with self._transaction():
+            self.store.delete_by_id(STUDENTS_PATH, rid)
+
+    # 該筆之後是否還有同一學生的手動調整；有的話餘額已被重設，之前的紀錄不影響目前餘額
+    def _set_after(self, index, name):
+        log = self.store.snapshot(STUDENT_LOG_PATH)
+        return any(log[i].get("name") == name and log[i].get("action") in SET_ACTIONS
+                   for i in range(index + 1, len(log)))
+
+    # 刪除一筆學生紀錄並撤銷它對餘額的影響；手動調整無法直接撤銷，
+    # 之後還有手動調整時也不能直接扣回，這兩種情況改為重播該學生的紀錄
+    def delete_log(self, rid):
+        with self._transaction():
+            index = self.store.index_of(STUDENT_LOG_PATH, rid)
+            entry = self.store.get(STUDENT_LOG_PATH, rid)
+            name = entry.get("name")
+            replay = entry.get("action") in SET_ACTIONS or self._set_after(index, name)
+            self.store.delete_by_id(STUDENT_LOG_PATH, rid)
+            students = self.store.load(STUDENTS_PATH)
+            for s in students:
+                if s["name"] != name:
+                    continue
+                if replay:
+                    s["balance"] = self._replay_student(name)
+                else:
+                    s["balance"] -= float(entry["amount"])
+                self.store.save(STUDENTS_PATH, students)
+                break
+
+    def _replay_lab_cash(self):
+        balances = _empty_balances()
+        for c in self.store.iter_records(LAB_CASH_PATH):
+            balances["lab_cash"]["balance"] += cash_delta(c)
+            balances["lab_cash"]["entries"] += 1
+        return balances
+
+    def _replay_student(self, name):
+        balance = 0.0
+        for r in self.store.iter_records(STUDENT_LOG_PATH):
+            if r.get("name") == name:
+                balance = apply_log(balance, r)
+        return balance
+
+    def _replay_students(self):
+        replayed = {}
+        for r in self.store.iter_records(STUDENT_LOG_PATH):
+            name = r.get("name")
+            if name == LAB_LOG_NAME:
+                continue
+            replayed[name] = apply_log(replayed.get(name, 0.0), r)
+        return replayed
+
+    # 重播所有紀錄並與物化值比對，回傳不一致項目的清單
+    def verify(self, tolerance=0.005):
+        issues = []
+        with self._transaction():
+            stored = self._balances()["lab_cash"]
+            replayed = self._replay_lab_cash()["lab_cash"]
+            if abs(stored["balance"] - replayed["balance"]) > tolerance or stored["entries"] != replayed["entries"]:
+                issues.append({"kind": "lab_cash", "name": "金庫",
+                               "stored": stored["balance"], "replayed": replayed["balance"]})
+            history = self._replay_students()
+            names = set()
+            for s in self.store.snapshot(STUDENTS_PATH):
+                names.add(s["name"])
+                expected = history.get(s["name"], 0.0)
+                if abs(float(s["balance"]) - expected) > tolerance:
+                    issues.append({"kind": "student", "name": s["name"],
+                                   "stored": float(s["balance"]), "replayed": expected})
+            for name in sorted(set(history) - names):
+                issues.append({"kind": "orphan_log", "name": name,
+                               "stored": None, "replayed": history[name]})
+        return issues
+
+    # 以重播結果覆寫物化餘額；沒有對應學生的紀錄只回報不處理
+    def rebuild(self):
+        with self._transaction():
+            issues = self.verify()
+            self.store.save(BALANCES_PATH, self._replay_lab_cash())
+            history = self._replay_students()
+            students = self.store.load(STUDENTS_PATH)
+            for s in students:
+                s["balance"] = history.get(s["name"], 0.0)
+            self.store.save(STUDENTS_PATH, students)
+        return issues
+
+engine = BalanceEngine(datastore.store)
+
+def _print_issues(issues):
+    if not issues:
+        print("餘額與紀錄一致")
+        return
+    for i in issues:
+        if i["kind"] == "orphan_log":
+            print(f"[紀錄無對應學生] {i['name']}：紀錄重播餘額 {i['replayed']:,.0f}")
+        else:
+            print(f"[不一致] {i['name']}：目前 {i['stored']:,.0f}，重播結果 {i['replayed']:,.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="核對或重建金庫與學生餘額")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+    if args.command == "verify":
+        issues = engine.verify()
+        _print_issues(issues)
+        raise SystemExit(1 if issues else 0)
+    issues = engine.rebuild()
+    _print_issues(issues)
+    print("已依紀錄重建餘額")
+
+if __name__ == "__main__":
+    main()
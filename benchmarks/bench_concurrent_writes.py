@@ -0,0 +1,90 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import JsonFileBackend, SqliteBackend  # noqa: E402
+from datastore import DataStore  # noqa: E402
+from journal import JOURNALED_FILES  # noqa: E402
+
+# 壓力測試：N 個行程同時寫入同一份資料，確認沒有任何一筆遺失或檔案損毀。
+# 每個寫入者對 expenses.json（整份重寫）與 lab_cash.json（日誌）各新增 rows 筆，
+# 並每 10 筆在 transaction 內對 students.json 的計數器做一次讀改寫。
+
+EXPENSES = "data/expenses.json"
+LAB_CASH = "data/lab_cash.json"
+STUDENTS = "data/students.json"
+
+def make_store(kind, compact_every):
+    if kind == "sqlite":
+        return DataStore(SqliteBackend("data/budget.db"))
+    return DataStore(JsonFileBackend(journaled=JOURNALED_FILES, compact_every=compact_every))
+
+def writer(workdir, kind, compact_every, writer_id, rows):
+    os.chdir(workdir)
+    store = make_store(kind, compact_every)
+    for seq in range(rows):
+        store.append(EXPENSES, {"project": f"P{writer_id}", "category": "業務費",
+                                "amount": 1.0, "note": f"{writer_id}:{seq}", "date": "2025-01-01"})
+        store.append(LAB_CASH, {"amount": 1.0, "type": "inflow",
+                                "note": f"{writer_id}:{seq}", "date": "2025-01-01"})
+        if seq % 10 == 0:
+            with store.transaction(STUDENTS):
+                students = store.load(STUDENTS)
+                students[0]["balance"] += 1
+                store.save(STUDENTS, students)
+
+def check(rows, name, writers, per_writer):
+    notes = [r["note"] for r in rows]
+    expected = {f"{w}:{s}" for w in range(writers) for s in range(per_writer)}
+    missing = expected - set(notes)
+    duplicated = len(notes) - len(set(notes))
+    ok = not missing and not duplicated
+    print(f"  {name:<16} {len(notes):>7} 筆  遺失 {len(missing)}  重複 {duplicated}  {'OK' if ok else 'FAIL'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="多行程同時寫入的資料遺失壓力測試")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--compact-every", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        store = make_store(args.backend, args.compact_every)
+        for path in (EXPENSES, LAB_CASH):
+            store.ensure(path, [])
+        store.ensure(STUDENTS, [{"name": "counter", "balance": 0}])
+
+        procs = [multiprocessing.Process(target=writer,
+                                         args=(workdir, args.backend, args.compact_every, w, args.rows))
+                 for w in range(args.writers)]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        store = make_store(args.backend, args.compact_every)
+        total = args.writers * args.rows
+        print(f"{args.backend} 後端：{args.writers} 個寫入者 x {args.rows} 筆，耗時 {elapsed:.2f}s"
+              f"（{2 * total / elapsed:,.0f} 筆/秒）")
+        ok = all(p.exitcode == 0 for p in procs)
+        ok &= check(store.snapshot(EXPENSES), "expenses.json", args.writers, args.rows)
+        ok &= check(store.snapshot(LAB_CASH), "lab_cash.json", args.writers, args.rows)
+        counter = store.snapshot(STUDENTS)[0]["balance"]
+        expected = args.writers * len(range(0, args.rows, 10))
+        print(f"  {'students 計數器':<16} {counter:>7}    預期 {expected}  {'OK' if counter == expected else 'FAIL'}")
+        ok &= counter == expected
+        os.chdir("/")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import CATEGORIES  # noqa: E402
+from ledger import Ledger  # noqa: E402
+
+# 欄式帳本記憶體測試：N 筆支出以 dict 串列與 Ledger 保存時的記憶體用量，
+# 以及建立、逐筆走訪、篩選的耗時。紀錄模擬 json.load 的結果（每筆字串都是獨立物件）。
+
+def synthetic(n, projects):
+    rng = random.Random(1)
+    names = [f"{1130000 + p} 智慧農業創新平台：以多重精準檢測晶片與AI為基礎的跨領域整合研究第 {p} 期"
+             for p in range(projects)]
+    return [{"project": "".join(rng.choice(names)), "category": "".join(rng.choice(CATEGORIES)),
+             "amount": float(rng.randrange(10, 50000)), "note": f"單據 {i}",
+             "date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"} for i in range(n)]
+
+# 記憶體以 tracemalloc 量測（紀錄由 build 自行產生，不與其他結構共用字串）；耗時另外量測
+def measure(label, build):
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<12} {size / 2**20:>8.1f} MiB")
+    return value
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    print(f"  {label:<12} {(time.perf_counter() - start) * 1000:>8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="欄式帳本記憶體測試")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--projects", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.rows:,} 筆支出，{args.projects} 個計畫")
+    print("記憶體")
+    rows = measure("dict 串列", lambda: synthetic(args.rows, args.projects))
+    measure("Ledger", lambda: Ledger(synthetic(args.rows, args.projects)))
+    start = time.perf_counter()
+    ledger = Ledger(rows)
+    print(f"建立 Ledger {(time.perf_counter() - start) * 1000:.0f} ms")
+    assert ledger == rows
+
+    project = rows[0]["project"]
+    print("走訪 / 篩選")
+    timed("dict 加總", lambda: sum(r["amount"] for r in rows))
+    timed("Ledger 加總", lambda: sum(ledger.amount))
+    timed("dict 篩選", lambda: [i for i, r in enumerate(rows)
+                              if r["project"] == project and "2024-03-01" <= r["date"] <= "2024-06-30"])
+    timed("Ledger 篩選", lambda: ledger.select(project, None, "2024-03-01", "2024-06-30"))
+
+if __name__ == "__main__":
+    main()
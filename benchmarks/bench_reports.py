@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reports  # noqa: E402
+from constants import CATEGORIES  # noqa: E402
+
+# 報表引擎效能測試：以 NumPy 直接產生 N 筆支出 / 規劃，量測建立 typed DataFrame
+# 與各項 groupby 統計的耗時。
+
+def synthetic(n, projects, rng):
+    days = rng.integers(0, 3 * 365, n)
+    dates = np.datetime64("2023-01-01") + days.astype("timedelta64[D]")
+    return reports.typed_frame(
+        pd.Categorical.from_codes(rng.integers(0, len(projects), n), categories=projects),
+        pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), n), categories=CATEGORIES),
+        rng.uniform(10, 50000, n).round(),
+        dates,
+        projects,
+    )
+
+def timed(label, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<24} {best * 1000:>9.1f} ms")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="報表引擎效能測試")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    projects = [f"P{i:04d} 計畫" for i in range(args.projects)]
+    budgets = reports.budget_frame([
+        {"name": p, "categories": {c: float(rng.integers(0, 10_000_000)) for c in CATEGORIES}}
+        for p in projects
+    ])
+    start = time.perf_counter()
+    expenses = synthetic(args.rows, projects, rng)
+    plans = synthetic(args.rows // 10, projects, rng)
+    print(f"{args.rows:,} 筆支出、{args.rows // 10:,} 筆規劃、{args.projects} 個計畫"
+          f"（產生資料 {time.perf_counter() - start:.2f}s，"
+          f"記憶體 {expenses.memory_usage(deep=True).sum() / 1e6:.0f} MB）")
+
+    total = 0.0
+    total += timed("execution_rates", lambda: reports.execution_rates(expenses, plans, budgets), args.repeat)
+    total += timed("project_rates", lambda: reports.project_rates(expenses, plans, budgets), args.repeat)
+    total += timed("monthly_burn", lambda: reports.monthly_burn(expenses), args.repeat)
+    total += timed("remaining_by_category", lambda: reports.remaining_by_category(expenses, plans, budgets), args.repeat)
+    print(f"  {'合計':<22} {total * 1000:>9.1f} ms")
+
+    records = [{"project": projects[i % len(projects)], "category": CATEGORIES[i % len(CATEGORIES)],
+                "amount": 100.0, "note": "", "date": "2025-01-01"} for i in range(min(args.rows, 200_000))]
+    timed(f"ledger_frame({len(records):,} dicts)", lambda: reports.ledger_frame(records, projects), 1)
+
+if __name__ == "__main__":
+    main()
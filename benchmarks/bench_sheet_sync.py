@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Google Sheets 同步測試：在暫存目錄產生資料，對本機的 FakeSpreadsheet
+# 比較完整上傳與增量同步的 API 呼叫數與寫入儲存格數，並確認同步後的工作表內容與資料一致；
+# 接著模擬網路延遲與 429，比較逐一上傳與並行上傳的總耗時。
+
+def expense(rng, n):
+    return {"project": f"計畫 {rng.randrange(20)}", "category": "業務費",
+            "amount": float(rng.randrange(10, 50000)), "note": f"#{n}", "date": "2025-01-01"}
+
+def main():
+    parser = argparse.ArgumentParser(description="Google Sheets 增量同步測試")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--changes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="模擬每次 API 呼叫的秒數")
+    parser.add_argument("--rate-limit-every", type=int, default=7, help="每 N 次呼叫回傳一次 429")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs("data")
+    import datastore
+    import data_migration
+    from fake_gspread import FakeSpreadsheet
+
+    rng = random.Random(1)
+    file_map = {"expenses.json": "expenses", "notes.json": "notes"}
+    datastore.save("data/expenses.json", [expense(rng, n) for n in range(args.rows)])
+    datastore.save("data/notes.json", [{"date": "2025-01-01", "content": "筆記"}])
+    for n in range(7):
+        file_map[f"extra_{n}.json"] = f"extra_{n}"
+        datastore.save(f"data/extra_{n}.json", [expense(rng, i) for i in range(100)])
+
+    def check(sheet):
+        for file, name in file_map.items():
+            expected = data_migration.sheet_rows(data_migration.load_json_to_df(f"data/{file}"))
+            assert sheet.sheets[name].get_all_values() == expected, f"{name} 內容不一致"
+
+    full = FakeSpreadsheet()
+    start = time.perf_counter()
+    for file, name in file_map.items():
+        data_migration.upload_to_sheet(full, name, data_migration.load_json_to_df(f"data/{file}"))
+    print(f"完整上傳    {(time.perf_counter() - start) * 1000:8.1f} ms  呼叫 {full.total_calls():3d}  儲存格 {full.cells_written}")
+
+    sheet = FakeSpreadsheet()
+    list(data_migration.sync_all(sheet, "bench", file_map, "data"))
+    check(sheet)
+
+    # 修改、刪除、新增少量紀錄後再同步一次
+    with datastore.transaction("data/expenses.json"):
+        for _ in range(args.changes):
+            datastore.update("data/expenses.json", rng.randrange(args.rows), expense(rng, -1))
+        datastore.delete("data/expenses.json", args.rows - 1)
+        datastore.append("data/expenses.json", expense(rng, args.rows))
+        datastore.append("data/expenses.json", expense(rng, args.rows + 1))
+    sheet.calls.clear()
+    sheet.cells_written = 0
+    start = time.perf_counter()
+    results = list(data_migration.sync_all(sheet, "bench", file_map, "data"))
+    elapsed = time.perf_counter() - start
+    print(f"增量同步    {elapsed * 1000:8.1f} ms  呼叫 {sheet.total_calls():3d}  儲存格 {sheet.cells_written}")
+    for r in results:
+        if r["status"] != "unchanged":
+            print(f"  {r['file']:<16} {r['status']:<10} {r['written']} 個區段")
+    check(sheet)
+
+    sheet.calls.clear()
+    list(data_migration.sync_all(sheet, "bench", file_map, "data"))
+    print(f"未變動再同步  呼叫 {sheet.total_calls()}（{dict(sheet.calls)}）")
+
+    # 退避基準縮小為 latency，避免測試太久
+    print(f"\n完整上傳 {len(file_map)} 個檔案（延遲 {args.latency}s，每 {args.rate_limit_every} 次呼叫一次 429）")
+    for workers in (1, data_migration.MAX_WORKERS, len(file_map)):
+        sheet = FakeSpreadsheet(latency=args.latency, rate_limit_every=args.rate_limit_every)
+        start = time.perf_counter()
+        results = list(data_migration.upload_all(sheet, "bench", file_map, "data",
+                                                 max_workers=workers, base_delay=args.latency))
+        elapsed = time.perf_counter() - start
+        failed = [r["file"] for r in results if r["status"] == "failed"]
+        slowest = max(r["seconds"] for r in results)
+        print(f"  {workers:2d} 個執行緒  總耗時 {elapsed:5.2f}s  最慢單檔 {slowest:5.2f}s  "
+              f"429 {sheet.rate_limited} 次  失敗 {failed or '無'}")
+        sheet.latency, sheet.rate_limit_every = 0.0, 0
+        check(sheet)
+    shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 啟動成本：每一項都在全新的子行程中量測，模組與快取都是冷的。
+#   import_app        匯入 app.py 用到的模組（不含 streamlit 本身），並列出被連帶載入的重量級套件
+#   import_migration  匯入 data_migration（Google 用戶端與 pandas 應延後到真正同步時才載入）
+#   first_run         以 streamlit.testing 無頭執行 app.py 的第一次 rerun（建立資料檔、補 ID、載入資料）
+#   rerun             之後每次 rerun 的耗時與其中 load_data 的耗時（應接近 0）
+# 用法：python benchmarks/bench_startup.py --rows 10000 --repeat 5
+
+HEAVY = ["pandas", "gspread", "oauth2client", "numpy"]
+APP_MODULES = ["datastore", "aggregates", "balances", "forecast", "journal", "ledger", "metrics", "constants"]
+
+def measure_import(modules):
+    start = time.perf_counter()
+    for name in modules:
+        __import__(name)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "heavy": [m for m in HEAVY if m in sys.modules]}
+
+def measure_app(repeat):
+    from streamlit.testing.v1 import AppTest
+
+    import metrics
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=3600)
+    at.session_state["jarvis_authenticated"] = True
+    at.session_state["jarvis_username"] = "admin"
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    first_load = metrics.recorder.recent()[-1]["views"]["load_data"]["seconds"]
+    reruns, loads = [], []
+    for _ in range(repeat):
+        at.run()
+        run = metrics.recorder.recent()[-1]
+        reruns.append(run["seconds"])
+        loads.append(run["views"]["load_data"]["seconds"])
+    return {"first_run": first, "first_load_data": first_load,
+            "rerun": min(reruns), "rerun_load_data": min(loads),
+            "heavy": [m for m in HEAVY if m in sys.modules]}
+
+def child(case, repeat):
+    if case == "import_app":
+        return measure_import(APP_MODULES)
+    if case == "import_migration":
+        return measure_import(["data_migration"])
+    return measure_app(repeat)
+
+def run_child(case, workdir, repeat):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", case, "--repeat", str(repeat)],
+                         capture_output=True, text=True, cwd=workdir)
+    if out.returncode != 0:
+        print(f"{case} 測試失敗：\n{out.stderr[-2000:]}")
+        raise SystemExit(2)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="量測冷啟動與每次 rerun 的固定成本")
+    parser.add_argument("--rows", type=int, default=10_000, help="合成資料的支出筆數；0 表示從空的資料目錄啟動")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(child(args.case, args.repeat)))
+        return
+
+    # synthetic 會匯入 app 的模組，只在父行程使用，子行程的匯入量測才是冷的
+    import synthetic
+
+    workdir = tempfile.mkdtemp()
+    try:
+        if args.rows:
+            synthetic.generate(os.path.join(workdir, "data"), args.rows)
+        results = {case: run_child(case, workdir, args.repeat)
+                   for case in ("import_app", "import_migration", "app")}
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"== 啟動成本（{args.rows:,} 筆支出）==")
+    for case in ("import_app", "import_migration"):
+        r = results[case]
+        print(f"  {case:<20} {r['seconds'] * 1000:>9.1f} ms  連帶載入：{', '.join(r['heavy']) or '無'}")
+    app = results["app"]
+    print(f"  {'first_run':<20} {app['first_run'] * 1000:>9.1f} ms  （其中 load_data {app['first_load_data'] * 1000:.1f} ms）")
+    print(f"  {'rerun':<20} {app['rerun'] * 1000:>9.1f} ms  （其中 load_data {app['rerun_load_data'] * 1000:.2f} ms）")
+    print(f"  app 執行後已載入：{', '.join(app['heavy']) or '無'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 串流讀取記憶體測試：產生 N 筆的 data/expenses.json，每種讀法在獨立的子行程中執行，
+# 量測耗時與尖峰 RSS 的增加量（pandas 的字串欄位由 Arrow 配置，tracemalloc 看不到，因此用 RSS）：
+#   load        json.load 整份後加總各計畫支出（原本 load_json 的做法）
+#   stream      DataStore.iter_records 逐筆加總
+#   df_full     pd.DataFrame(json.load(...))（原本 load_json_to_df 的做法）
+#   df_stream   data_migration.load_json_to_df（分塊建立 DataFrame）
+
+CASES = ["load", "stream", "df_full", "df_stream"]
+PATH = "data/expenses.json"
+
+def generate(n, projects):
+    rng = random.Random(1)
+    names = [f"{1130000 + p} 智慧農業跨領域整合研究計畫第 {p} 期" for p in range(projects)]
+    with open(PATH, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(n):
+            record = {"project": rng.choice(names), "category": "業務費",
+                      "amount": float(rng.randrange(10, 50000)), "note": f"單據 {i}",
+                      "date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"}
+            f.write(("  " if i == 0 else ",\n  ") + json.dumps(record, ensure_ascii=False))
+        f.write("\n]\n")
+
+def sum_by_project(records):
+    totals = {}
+    for e in records:
+        totals[e["project"]] = totals.get(e["project"], 0.0) + float(e["amount"])
+    return totals
+
+# ru_maxrss 在 Linux 為 KiB、macOS 為 bytes
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def run_case(case):
+    import pandas as pd
+    import data_migration
+    from backends import JsonFileBackend
+    from datastore import DataStore
+
+    before = peak_rss()
+    start = time.perf_counter()
+    if case == "load":
+        with open(PATH, encoding="utf-8") as f:
+            result = sum_by_project(json.load(f))
+    elif case == "stream":
+        result = sum_by_project(DataStore(JsonFileBackend()).iter_records(PATH))
+    elif case == "df_full":
+        with open(PATH, encoding="utf-8") as f:
+            result = len(pd.DataFrame(json.load(f)))
+    else:
+        result = len(data_migration.load_json_to_df(PATH))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "peak": peak_rss() - before,
+                      "check": round(sum(result.values())) if isinstance(result, dict) else result}))
+
+def main():
+    parser = argparse.ArgumentParser(description="串流讀取記憶體測試")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args.case)
+        return
+
+    workdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        os.chdir(workdir)
+        generate(args.rows, args.projects)
+        size = os.path.getsize(PATH)
+        print(f"expenses.json：{args.rows:,} 筆，{size / 2**20:.1f} MiB")
+        print(f"  {'讀法':<10} {'耗時':>9} {'尖峰記憶體增加':>12} {'／檔案大小':>9}")
+        checks = {}
+        for case in CASES:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", case],
+                                 capture_output=True, text=True, check=True, cwd=workdir)
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            checks.setdefault(case.startswith("df"), set()).add(r["check"])
+            print(f"  {case:<10} {r['seconds'] * 1000:>7.0f} ms {r['peak'] / 2**20:>9.1f} MiB {r['peak'] / size:>9.2f}x")
+        assert all(len(v) == 1 for v in checks.values()), f"結果不一致：{checks}"
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+# 端對端效能測試：以 synthetic.py 產生各種規模的資料，量測 app 實際使用的資料路徑，
+# 並與先前存下的基準比較，列出變慢的項目（有退步時結束碼為 1，可放進 CI）。
+# 每個規模、每組測試都在獨立的子行程中執行，模組層級的快取不會互相影響。
+#   data  載入（冷 / 熱）、get_spending、月份彙總、用罄預測、報表、全文搜尋、一致性檢查、逐筆新增 / 修改 / 刪除、整份儲存、
+#         Google Sheets 的 DataFrame 轉換與上傳（對本機的 FakeSpreadsheet）
+#   app   以 streamlit.testing 無頭執行 app.py，依 metrics 記錄各畫面重繪一次的耗時
+# 用法：
+#   python benchmarks/bench_suite.py --sizes 1000,10000,100000 --save benchmarks/baseline.json
+#   python benchmarks/bench_suite.py --sizes 1000,10000,100000 --baseline benchmarks/baseline.json
+
+GROUPS = ["data", "app"]
+# 超過此筆數時略過上傳（FakeSpreadsheet 以 dict 保存每個儲存格，1M 筆會用掉數 GB 記憶體）
+UPLOAD_LIMIT = 200_000
+
+def best(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+# 逐筆寫入的平均耗時；整份重寫的檔案每筆都是 O(n)，大規模時自動減少次數
+def per_op(fn, rows):
+    ops = max(3, min(20, 2_000_000 // max(rows, 1)))
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return (time.perf_counter() - start) / ops
+
+def run_data(rows, repeat):
+    import aggregates
+    import consistency
+    import data_migration
+    import datastore
+    import forecast
+    import reports
+    import rollups
+    import search
+    from constants import BALANCES_PATH, BUDGETS_PATH, EXPENSES_PATH, RECORD_PATHS
+    from fake_gspread import FakeSpreadsheet
+
+    results = {}
+    paths = RECORD_PATHS + [BALANCES_PATH]
+
+    def cold_load():
+        datastore.invalidate()
+        for path in paths:
+            datastore.snapshot(path)
+
+    results["load_cold"] = best(cold_load, repeat)
+    results["load_json"] = best(lambda: [datastore.load(p) for p in RECORD_PATHS], repeat)
+
+    names = [b["name"] for b in datastore.snapshot(BUDGETS_PATH)]
+    results["totals_build"] = best(lambda: aggregates.totals.spent(names[0]), 1)
+    results["get_spending"] = best(lambda: [(aggregates.totals.spent(n), aggregates.totals.planned(n)) for n in names], repeat)
+    results["rollups_build"] = best(rollups.rollups.refresh, 1)
+    results["rollup_range"] = best(lambda: rollups.rollups.total(EXPENSES_PATH, names[0], None, "2024-01", "2024-12"), repeat)
+    results["rollup_quarterly"] = best(lambda: rollups.rollups.quarterly("2022-01", "2025-12"), repeat)
+    results["forecast_build"] = best(forecast.forecaster.forecast_all, 1)
+    results["forecast_all"] = best(forecast.forecaster.forecast_all, repeat)
+    results["report_frames"] = best(reports.current_execution_rates, 1)
+    results["execution_rates"] = best(reports.current_execution_rates, repeat)
+    # 先建好搜尋索引，之後的逐筆寫入也一併量到索引的增量更新
+    results["search_build"] = best(lambda: search.index.search("試劑", limit=1), 1)
+    results["search_common"] = best(lambda: search.index.search("試劑"), repeat)
+    results["search_rare"] = best(lambda: search.index.search("單據0000123"), repeat)
+    results["search_facets"] = best(lambda: search.index.search("文具", project=names[0], category="業務費",
+                                                               start="2024-01-01", end="2024-12-31"), repeat)
+    results["consistency_build"] = best(consistency.checker.check, 1)
+    results["consistency_check"] = best(consistency.checker.check, repeat)
+
+    rng = random.Random(0)
+
+    def record(i):
+        return {"project": rng.choice(names), "category": "業務費", "amount": float(rng.randrange(10, 5000)),
+                "note": f"bench {i}", "date": "2025-06-01"}
+
+    def some_id():
+        return rng.choice(datastore.snapshot(EXPENSES_PATH).ids)
+
+    results["append"] = per_op(lambda i: datastore.append(EXPENSES_PATH, record(i)), rows)
+    results["update_by_id"] = per_op(lambda i: datastore.update_by_id(EXPENSES_PATH, some_id(), record(i)), rows)
+    results["delete_by_id"] = per_op(lambda i: datastore.delete_by_id(EXPENSES_PATH, some_id()), rows)
+    # 逐筆寫入後的檢查只需套用增量，不會整份重建
+    results["consistency_after_writes"] = best(consistency.checker.check, 1)
+    results["save_json"] = best(lambda: datastore.save(EXPENSES_PATH, datastore.snapshot(EXPENSES_PATH)), repeat)
+
+    frame = data_migration.load_json_to_df(EXPENSES_PATH)
+    results["sheet_frame"] = best(lambda: data_migration.sheet_rows(data_migration.load_json_to_df(EXPENSES_PATH)), 1)
+    if rows <= UPLOAD_LIMIT:
+        results["upload_to_sheet"] = best(lambda: data_migration.upload_to_sheet(FakeSpreadsheet(), "expenses", frame), 1)
+    return results
+
+def run_app(rows, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    import metrics
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=3600)
+    at.session_state["jarvis_authenticated"] = True
+    at.session_state["jarvis_username"] = "admin"
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    results = {"app_cold": metrics.recorder.recent()[-1]["seconds"]}
+    for label in at.radio(key="main_nav").options:
+        at.radio(key="main_nav").set_value(label)
+        at.run()
+        view = list(metrics.recorder.recent()[-1]["views"])[-1]
+        samples = []
+        for _ in range(repeat):
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+            samples.append(metrics.recorder.recent()[-1]["views"][view]["seconds"])
+        results[f"view:{view}"] = min(samples)
+    return results
+
+# 與基準比較，回傳退步的項目
+def report(size, results, baseline, threshold, min_delta):
+    regressions = []
+    print(f"\n== {size:,} 筆支出 ==")
+    print(f"  {'項目':<24} {'目前 ms':>10} {'基準 ms':>10} {'變化':>8}")
+    for case, seconds in results.items():
+        base = baseline.get(case)
+        line = f"  {case:<26} {seconds * 1000:>10.1f}"
+        if base:
+            change = seconds / base - 1
+            line += f" {base * 1000:>10.1f} {change:>+8.1%}"
+            if change > threshold and (seconds - base) * 1000 > min_delta:
+                line += "  ⚠️ 退步"
+                regressions.append((size, case, base, seconds))
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="以合成資料量測 app 的資料路徑並比較基準")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="以逗號分隔的支出筆數")
+    parser.add_argument("--groups", default=",".join(GROUPS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="比較用的基準 JSON")
+    parser.add_argument("--save", help="把這次的結果存成基準 JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="比基準慢超過此比例視為退步")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="差距小於此毫秒數不視為退步")
+    parser.add_argument("--group", choices=GROUPS, help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.group:
+        run = run_data if args.group == "data" else run_app
+        print(json.dumps(run(args.rows, args.repeat)))
+        return
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    all_results, regressions = {}, []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        workdir = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            synthetic.generate(os.path.join(workdir, "data"), size)
+            print(f"\n產生 {size:,} 筆資料 {time.perf_counter() - start:.1f}s", end="")
+            results = {}
+            for group in args.groups.split(","):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--group", group,
+                                      "--rows", str(size), "--repeat", str(args.repeat)],
+                                     capture_output=True, text=True, cwd=workdir)
+                if out.returncode != 0:
+                    print(f"\n{group} 測試失敗：\n{out.stderr[-2000:]}")
+                    raise SystemExit(2)
+                results.update(json.loads(out.stdout.strip().splitlines()[-1]))
+        finally:
+            shutil.rmtree(workdir)
+        all_results[str(size)] = results
+        regressions += report(size, results, baseline.get(str(size), {}), args.threshold, args.min_delta_ms)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "results": all_results}, f, indent=2)
+        print(f"\n已存成基準：{args.save}")
+    if baseline:
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} 項比基準慢超過 {args.threshold:.0%}：")
+            for size, case, base, seconds in regressions:
+                print(f"  {size:>9,} 筆  {case:<24} {base * 1000:.1f} → {seconds * 1000:.1f} ms")
+            raise SystemExit(1)
+        print("\n沒有退步的項目")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from balances import LAB_LOG_NAME, apply_log, cash_delta  # noqa: E402
+from constants import CATEGORIES  # noqa: E402
+
+# 合成資料產生器：依 --rows（支出筆數，1k～1M）產生一整套 data/*.json，
+# 欄位與 app 寫入的完全相同（含紀錄 ID），分類使用 constants.CATEGORIES。
+#   budgets        rows / 2000 個計畫（5～300），每個計畫 1～3 年，部分分類有預算
+#   expenses       rows 筆，依日期排序，只落在計畫期間內、且只用有預算的分類；少數計畫特別活躍
+#   plans          rows / 10 筆，日期在 TODAY 之後
+#   students / student_cash_log / lab_cash / balances
+#                  學生代墊、報銷、發獎金與金庫收支；學生餘額與金庫餘額等於重播紀錄的結果
+#   vendors / notes / login_log
+# 同一組參數與 seed 產生的內容完全相同。檔案逐筆串流寫入，1M 筆也不必先在記憶體中建好整份串列。
+
+TODAY = date(2025, 6, 30)
+TOPICS = [
+    "智慧農業創新平台：以多重精準檢測晶片與AI為基礎的跨領域整合研究",
+    "畜牧場汙水處理系統水質監控",
+    "益生菌對肉雞腸道菌相與生長性能之影響",
+    "乳牛熱緊迫之營養調控策略",
+    "水產飼料中植物性蛋白替代魚粉之研究",
+    "豬隻營養基因體學與精準飼養",
+    "反芻動物甲烷減量飼糧開發",
+    "蛋雞蛋殼品質與微量元素需求",
+    "寵物食品功能性成分評估",
+    "循環農業副產物飼料化利用",
+]
+NOTES = ["實驗耗材", "試劑", "研究獎助金", "國內差旅", "文具", "儀器維修", "論文發表費",
+         "郵資", "電腦周邊", "飼料原料", "分析檢測費", "臨時工資", "印刷裝訂", "會議註冊費"]
+SURNAMES = "陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周"
+GIVEN = "宇承亭誼妡家豪雅婷冠廷佳蓉柏翰詩涵品睿子晴"
+CITIES = ["台北市", "新北市", "台中市", "台南市", "高雄市", "桃園市", "屏東縣"]
+
+def make_id(rng):
+    return f"{rng.getrandbits(64):016x}"
+
+def _iso(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+def _amount(rng, scale=8.0):
+    return float(max(10, round(rng.lognormvariate(scale, 1.2))))
+
+# 逐筆寫成 JSON 陣列（每筆一行），回傳筆數
+def write_array(path, records):
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for record in records:
+            f.write(("\n  " if n == 0 else ",\n  ") + json.dumps(record, ensure_ascii=False))
+            n += 1
+        f.write("\n]\n")
+    return n
+
+def make_budgets(rng, count):
+    budgets = []
+    for i in range(count):
+        start = date(rng.randrange(2022, 2025), rng.randrange(1, 13), 1)
+        end = date(start.year + rng.randrange(1, 4), start.month, 1) - timedelta(days=1)
+        funded = {"業務費"} | set(rng.sample(CATEGORIES, rng.randrange(1, 4)))
+        budgets.append({
+            "id": make_id(rng),
+            "name": f"{1110000 + i * 37} {TOPICS[i % len(TOPICS)]}（第 {i // len(TOPICS) + 1} 期）",
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "categories": {c: float(rng.randrange(10, 500) * 1000) if c in funded else 0.0 for c in CATEGORIES},
+        })
+    return budgets
+
+def _ledger(rng, budgets, n, lo, hi):
+    # 依日期排序產生，只選在該日仍在執行期間的計畫；權重讓少數計畫特別活躍
+    periods = [(date.fromisoformat(b["start_date"]).toordinal(), date.fromisoformat(b["end_date"]).toordinal())
+               for b in budgets]
+    weights = [rng.paretovariate(1.5) for _ in budgets]
+    funded = [[c for c, v in b["categories"].items() if v > 0] for b in budgets]
+    days = sorted(rng.randrange(lo, hi + 1) for _ in range(n))
+    choices = {}
+    for seq, day in enumerate(days):
+        choice = choices.get(day)
+        if choice is None:
+            active = [i for i, (s, e) in enumerate(periods) if s <= day <= e] or list(range(len(budgets)))
+            choice = choices[day] = (active, list(itertools.accumulate(weights[i] for i in active)))
+        p = rng.choices(choice[0], cum_weights=choice[1])[0]
+        yield {
+            "id": make_id(rng),
+            "project": budgets[p]["name"],
+            "category": rng.choice(funded[p]),
+            "amount": _amount(rng),
+            "note": f"{rng.choice(NOTES)} 單據{seq:07d}",
+            "date": _iso(day),
+        }
+
+def make_students(rng, count):
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(SURNAMES) + "".join(rng.sample(GIVEN, 2)))
+    return sorted(names)
+
+# 學生資金異動與金庫收支交錯產生，回傳 (學生紀錄, 金庫紀錄, 學生餘額, 金庫餘額)
+def make_cash(rng, students, n, lo, hi):
+    log, cash = [], []
+    balance = {name: 0.0 for name in students}
+    lab = 0.0
+    for day in sorted(rng.randrange(lo, hi + 1) for _ in range(n)):
+        when = _iso(day)
+        kind = rng.random()
+        if kind < 0.15 or lab < 20000:
+            amount = float(rng.randrange(20, 60) * 1000)
+            entry = {"id": make_id(rng), "amount": amount, "type": "inflow", "note": "計畫薪資轉入", "date": when}
+            cash.append(entry)
+            lab += cash_delta(entry)
+            log.append({"id": make_id(rng), "name": LAB_LOG_NAME, "action": "Adjustment",
+                        "amount": amount, "note": "計畫薪資轉入", "date": when})
+            continue
+        name = rng.choice(students)
+        amount = float(round(rng.lognormvariate(6.5, 0.8)))
+        if kind < 0.6:
+            entry = {"id": make_id(rng), "name": name, "action": "代墊", "amount": -amount,
+                     "note": rng.choice(NOTES), "date": when}
+        else:
+            action = "報銷" if kind < 0.9 else "發獎金"
+            amount = min(amount, lab)
+            verb = "報銷給" if action == "報銷" else "發獎金給"
+            out = {"id": make_id(rng), "amount": amount, "type": "outflow", "note": f"{verb} {name}", "date": when}
+            cash.append(out)
+            lab += cash_delta(out)
+            entry = {"id": make_id(rng), "name": name, "action": action, "amount": amount,
+                     "note": rng.choice(NOTES), "date": when}
+        balance[name] = apply_log(balance[name], entry)
+        log.append(entry)
+    return log, cash, balance, lab
+
+def make_vendors(rng, count):
+    for i in range(count):
+        yield {
+            "id": make_id(rng),
+            "name": f"{rng.choice(['生合', '信德', '台灣', '東洋', '永豐', '大成'])}{rng.choice(['生物科技', '儀器', '化學', '飼料', '貿易'])}股份有限公司 {i}",
+            "vat": f"{rng.randrange(10**7, 10**8)}",
+            "address": f"{rng.choice(CITIES)}{rng.choice(['中正', '中山', '北屯', '路竹', '東區'])}區{rng.randrange(1, 300)}號",
+            "phone": f"0{rng.randrange(2, 9)}-{rng.randrange(1000000, 9999999)}",
+            "email": f"service{i}@example.com.tw",
+            "website": f"https://vendor{i}.example.com.tw/",
+            "representative": f"{rng.choice(SURNAMES)}先生 {rng.choice(NOTES)}",
+            "note": rng.choice(["無", "月結 30 天", "需先匯款", "可開立電子發票", ""]),
+            "deposit": float(rng.choice([0, 0, 0, rng.randrange(1, 50) * 1000])),
+        }
+
+def make_notes(rng, count, lo, hi):
+    for day in sorted(rng.randrange(lo, hi + 1) for _ in range(count)):
+        words = "、".join(rng.sample(NOTES, 3))
+        yield {
+            "id": make_id(rng),
+            "date": _iso(day),
+            "content": f"規劃 {words} 的支出，預計 {rng.randrange(1, 12)} 月前核銷，金額約 {rng.randrange(1, 90) * 1000} 元。",
+            "created_at": f"{_iso(day)} {rng.randrange(8, 19):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+        }
+
+def make_logins(rng, count, lo, hi):
+    for day in sorted(rng.randrange(lo, hi + 1) for _ in range(count)):
+        yield {"id": make_id(rng), "username": "admin",
+               "login_time": f"{_iso(day)} {rng.randrange(8, 23):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"}
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, value))
+
+# 在 directory 產生全套資料檔，回傳 {檔名: 筆數}
+def generate(directory, rows, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    def path(name):
+        return os.path.join(directory, name)
+
+    lo, today = date(2022, 1, 1).toordinal(), TODAY.toordinal()
+    counts = {}
+
+    budgets = make_budgets(rng, _clamp(rows // 2000, 5, 300))
+    counts["budgets.json"] = write_array(path("budgets.json"), budgets)
+    counts["expenses.json"] = write_array(path("expenses.json"), _ledger(rng, budgets, rows, lo, today))
+    counts["plans.json"] = write_array(path("plans.json"), _ledger(rng, budgets, rows // 10, today + 1, today + 365))
+
+    students = make_students(rng, _clamp(rows // 5000, 5, 200))
+    log, cash, balance, lab = make_cash(rng, students, max(rows // 10, 20), lo, today)
+    counts["students.json"] = write_array(path("students.json"),
+                                          ({"id": make_id(rng), "name": n, "balance": balance[n]} for n in students))
+    counts["student_cash_log.json"] = write_array(path("student_cash_log.json"), log)
+    counts["lab_cash.json"] = write_array(path("lab_cash.json"), cash)
+    with open(path("balances.json"), "w", encoding="utf-8") as f:
+        json.dump({"lab_cash": {"balance": lab, "entries": len(cash)}}, f)
+
+    counts["vendors.json"] = write_array(path("vendors.json"), make_vendors(rng, _clamp(rows // 1000, 10, 2000)))
+    counts["notes.json"] = write_array(path("notes.json"), make_notes(rng, _clamp(rows // 100, 5, 10000), lo, today))
+    counts["login_log.json"] = write_array(path("login_log.json"), make_logins(rng, _clamp(rows // 100, 5, 1000), lo, today))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成的 data/*.json 供效能測試")
+    parser.add_argument("--rows", type=int, default=100_000, help="支出筆數（其他檔案依比例）")
+    parser.add_argument("--dir", required=True, help="輸出目錄；為避免覆蓋正式資料，必須明確指定")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    start = datetime.now()
+    counts = generate(args.dir, args.rows, args.seed)
+    for name, n in counts.items():
+        print(f"  {name:<24} {n:>9,} 筆")
+    print(f"已寫入 {args.dir}（{(datetime.now() - start).total_seconds():.1f}s）")
+
+if __name__ == "__main__":
+    main()
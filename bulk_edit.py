@@ -0,0 +1,83 @@
+import math
+from datetime import date, datetime
+
+import pandas as pd
+
+FIELDS = ["project", "category", "amount", "note", "date"]
+
+# 批次編輯：把 (原始索引, 紀錄) 轉成 data_editor 用的 DataFrame，
+# 並把編輯後的表格與原始紀錄比對，轉成 datastore.batch_by_id 的 ops（一次寫入）。
+# _id 欄保存紀錄 ID，寫入時才在鎖內換成當下的位置；新增的列 _id 為空。沒有 ID 的紀錄不列入表格。
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def _missing(value):
+    if value is None or value is pd.NaT or value is pd.NA:
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+def _records(rows):
+    return [r for _, r in rows if isinstance(r, dict) and r.get("id")]
+
+def to_frame(rows):
+    records = _records(rows)
+    return pd.DataFrame({
+        "_id": [r["id"] for r in records],
+        "project": [r.get("project") for r in records],
+        "category": [r.get("category") for r in records],
+        "amount": [float(r.get("amount", 0)) for r in records],
+        "note": [r.get("note", "") for r in records],
+        "date": [_parse_date(r.get("date")) for r in records],
+    }, columns=["_id"] + FIELDS)
+
+def _format_date(value):
+    if isinstance(value, str):
+        return value if _parse_date(value) else None
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return value.strftime("%Y-%m-%d")
+    return None
+
+def _normalize(row, projects, categories):
+    if row.get("project") not in projects:
+        return None, f"計畫「{row.get('project')}」不存在"
+    if row.get("category") not in categories:
+        return None, f"分類「{row.get('category')}」不存在"
+    if _missing(row.get("amount")):
+        return None, "金額不可為空"
+    day = _format_date(row.get("date"))
+    if day is None:
+        return None, "日期格式錯誤"
+    note = row.get("note")
+    return {
+        "project": row["project"],
+        "category": row["category"],
+        "amount": float(row["amount"]),
+        "note": "" if _missing(note) else str(note),
+        "date": day,
+    }, None
+
+# 回傳 (ops, errors)；有任何一列不合法時呼叫端應整批放棄，不做部分寫入
+def diff_frame(rows, edited, projects, categories):
+    original = {r["id"]: r for r in _records(rows)}
+    projects, categories = set(projects), set(categories)
+    updates, appends, errors = [], [], []
+    seen = set()
+    for n, row in enumerate(edited.to_dict("records"), start=1):
+        values, error = _normalize(row, projects, categories)
+        if error:
+            errors.append(f"第 {n} 列：{error}")
+            continue
+        rid = row.get("_id")
+        if _missing(rid) or rid == "":
+            appends.append(("append", None, values))
+            continue
+        seen.add(rid)
+        old = original[rid]
+        if any(old.get(f) != values[f] for f in FIELDS):
+            updates.append(("update", rid, dict(old, **values)))
+    deletes = [("delete", rid, None) for rid in original if rid not in seen]
+    return updates + deletes + appends, errors
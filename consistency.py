@@ -0,0 +1,320 @@
+import argparse
+
+import balances
+import datastore
+from constants import (BALANCES_PATH, BUDGETS_PATH, EXPENSES_PATH, LAB_CASH_PATH, PLANS_PATH, RECORD_PATHS,
+                       STUDENT_LOG_PATH, STUDENTS_PATH)
+from ledger import Ledger, day_string
+
+# 跨檔一致性檢查
+# 資料分散在數個以名稱互相參照的 JSON 檔，本模組一次檢查所有跨檔不變量：
+#   orphan_project    支出 / 規劃的計畫名稱不在 budgets.json 中（例如計畫改名或刪除後留下的紀錄）
+#   orphan_log        student_cash_log.json 中沒有對應學生的姓名
+#   lab_cash/student  金庫與學生的物化餘額與重播紀錄的結果不符（同 balances.verify）
+#   duplicate_id      同一檔案中重複的紀錄 ID；missing_id 為沒有 ID 的紀錄
+#   duplicate_record  支出 / 規劃中 (計畫, 分類, 金額, 日期, 備註) 完全相同的紀錄
+#   duplicate_name    budgets / students 中重複的名稱（以名稱參照時無法分辨）
+# 計畫參照次數、ID 與紀錄的重複計數、學生紀錄的重播餘額與金庫收支都預先算好並隨寫入增量更新；
+# 檢查時只比對這些計數與 budgets / students / balances 等小檔，每次存檔後執行也只需數毫秒。
+# repair 在同一個 transaction 內補 ID、重建餘額、把孤兒紀錄改到指定的計畫，並可移除重複紀錄。
+
+LEDGER_PATHS = (EXPENSES_PATH, PLANS_PATH)
+# 以名稱作為參照鍵的檔案
+NAMED_PATHS = (BUDGETS_PATH, STUDENTS_PATH)
+TOLERANCE = 0.005
+
+class ProjectNameError(ValueError):
+    pass
+
+def record_key(record):
+    try:
+        return (record.get("project"), record.get("category"), float(record.get("amount")),
+                record.get("date"), record.get("note", ""))
+    except (TypeError, ValueError):
+        return None
+
+def _count(counts, dups, key, sign):
+    n = counts.get(key, 0) + sign
+    if n > 0:
+        counts[key] = n
+    else:
+        counts.pop(key, None)
+    if n > 1:
+        dups.add(key)
+    else:
+        dups.discard(key)
+
+def _counted(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts, {k for k, n in counts.items() if n > 1}
+
+# 欄式帳本的紀錄鍵以代碼表示，同一份帳本內與名稱一一對應
+def _ledger_keys(rows):
+    return zip(rows.project, rows.category, rows.amount, rows.day, rows.note)
+
+def _id_values(rows):
+    if isinstance(rows, Ledger):
+        return rows.ids
+    return [r.get("id") for r in rows if isinstance(r, dict)]
+
+class ConsistencyChecker(datastore.DerivedIndex):
+    def __init__(self, store, engine):
+        self.engine = engine
+        keys = [store.key(path) for path in RECORD_PATHS]
+        self.ledger_keys = {store.key(path) for path in LEDGER_PATHS}
+        self.log_key = store.key(STUDENT_LOG_PATH)
+        self.lab_key = store.key(LAB_CASH_PATH)
+        # 每個檔案：ID -> 次數（None 為沒有 ID）與重複的 ID
+        self._ids = {key: {} for key in keys}
+        self._dup_ids = {key: set() for key in keys}
+        # 支出 / 規劃：計畫 -> 參照次數、紀錄鍵 -> 次數與重複的紀錄鍵
+        self._refs = {key: {} for key in self.ledger_keys}
+        self._records = {key: {} for key in self.ledger_keys}
+        self._dup_records = {key: set() for key in self.ledger_keys}
+        # 學生紀錄依序重播的餘額；被修改或刪除的學生紀錄只標記姓名，檢查時才重播該學生
+        self._replayed = {}
+        self._dirty = set()
+        self._lab = [0.0, 0]
+        super().__init__(store, RECORD_PATHS)
+
+    def _transaction(self):
+        return self.store.transaction(*RECORD_PATHS, BALANCES_PATH)
+
+    def _apply(self, key, record, sign):
+        if not isinstance(record, dict):
+            return
+        _count(self._ids[key], self._dup_ids[key], record.get("id"), sign)
+        if key in self.ledger_keys:
+            refs = self._refs[key]
+            project = record.get("project")
+            refs[project] = refs.get(project, 0) + sign
+            if not refs[project]:
+                del refs[project]
+            rkey = record_key(record)
+            if rkey is not None:
+                _count(self._records[key], self._dup_records[key], rkey, sign)
+        elif key == self.lab_key:
+            self._lab[0] += balances.cash_delta(record) * sign
+            self._lab[1] += sign
+
+    # 整份重建；欄式帳本直接讀代碼欄位，不必逐筆展開 dict
+    def _rebuild(self, key, rows):
+        self._ids[key], self._dup_ids[key] = _counted(_id_values(rows))
+        if key in self.ledger_keys:
+            if isinstance(rows, Ledger) and not rows.has_raw():
+                projects, categories = rows.projects, rows.categories
+                refs, _ = _counted(rows.project)
+                self._refs[key] = {projects[p]: n for p, n in refs.items()}
+                counts, _ = _counted(_ledger_keys(rows))
+                self._records[key] = {(projects[p], categories[c], amount, day_string(day), note): n
+                                      for (p, c, amount, day, note), n in counts.items()}
+                self._dup_records[key] = {k for k, n in self._records[key].items() if n > 1}
+            else:
+                dicts = [r for r in rows if isinstance(r, dict)]
+                self._refs[key], _ = _counted(r.get("project") for r in dicts)
+                self._records[key], self._dup_records[key] = _counted(
+                    k for k in map(record_key, dicts) if k is not None)
+        elif key == self.log_key:
+            self._replayed = self._replay(rows)
+            self._dirty.clear()
+        elif key == self.lab_key:
+            self._lab = [sum(balances.cash_delta(c) for c in rows), len(rows)]
+
+    def _replay(self, rows, names=None):
+        replayed = {}
+        for r in rows:
+            name = r.get("name")
+            if name == balances.LAB_LOG_NAME or (names is not None and name not in names):
+                continue
+            replayed[name] = balances.apply_log(replayed.get(name, 0.0), r)
+        return replayed
+
+    def _update(self, key, op, index, old, new):
+        if old is not None:
+            self._apply(key, old, -1)
+        if new is not None:
+            self._apply(key, new, 1)
+        if key == self.log_key:
+            # 新增只會接在最後，直接套用；修改與刪除會改變之後的重播結果，標記給檢查時重播
+            if op == "append" and new.get("name") not in self._dirty:
+                name = new.get("name")
+                if name != balances.LAB_LOG_NAME:
+                    self._replayed[name] = balances.apply_log(self._replayed.get(name, 0.0), new)
+            else:
+                self._dirty.update(r.get("name") for r in (old, new) if isinstance(r, dict))
+
+    # 呼叫端須持有 paths 的鎖；學生紀錄因此在 refresh 之後不會變動，被標記的學生可直接重播
+    def _refresh(self, paths=RECORD_PATHS):
+        self.refresh(paths)
+        if STUDENT_LOG_PATH not in paths:
+            return
+        with self._lock:
+            if self._dirty:
+                replayed = self._replay(self.store.snapshot(STUDENT_LOG_PATH), self._dirty)
+                for name in self._dirty:
+                    self._replayed.pop(name, None)
+                self._replayed.update(replayed)
+                self._dirty.clear()
+
+    # 回傳所有不一致項目的清單；在各資料檔的鎖內檢查，不會看到其他人寫到一半的結果
+    def check(self, tolerance=TOLERANCE):
+        issues = []
+        with self._transaction():
+            self._refresh()
+            named = {path: self.store.snapshot(path) for path in NAMED_PATHS}
+            stored_lab = self.engine.lab_balance()
+            stored_entries = self.store.snapshot(BALANCES_PATH)["lab_cash"]["entries"]
+            with self._lock:
+                names = {}
+                for path, rows in named.items():
+                    counts, dups = _counted(r.get("name") for r in rows)
+                    names[path] = counts
+                    issues.extend({"kind": "duplicate_name", "path": path, "name": name, "count": counts[name]}
+                                  for name in sorted(dups, key=str))
+                for path in LEDGER_PATHS:
+                    for project, n in self._refs[self.store.key(path)].items():
+                        if project not in names[BUDGETS_PATH]:
+                            issues.append({"kind": "orphan_project", "path": path, "name": project, "count": n})
+                if abs(stored_lab - self._lab[0]) > tolerance or stored_entries != self._lab[1]:
+                    issues.append({"kind": "lab_cash", "name": "金庫", "stored": stored_lab, "replayed": self._lab[0]})
+                for s in named[STUDENTS_PATH]:
+                    expected = self._replayed.get(s["name"], 0.0)
+                    if abs(float(s["balance"]) - expected) > tolerance:
+                        issues.append({"kind": "student", "name": s["name"],
+                                       "stored": float(s["balance"]), "replayed": expected})
+                for name in sorted(set(self._replayed) - set(names[STUDENTS_PATH]), key=str):
+                    issues.append({"kind": "orphan_log", "name": name, "stored": None, "replayed": self._replayed[name]})
+                for key, path in self._paths.items():
+                    missing = self._ids[key].get(None)
+                    if missing:
+                        issues.append({"kind": "missing_id", "path": path, "count": missing})
+                    issues.extend({"kind": "duplicate_id", "path": path, "id": rid, "count": self._ids[key][rid]}
+                                  for rid in sorted(self._dup_ids[key], key=str) if rid is not None)
+                for path in LEDGER_PATHS:
+                    counts = self._records[self.store.key(path)]
+                    issues.extend({"kind": "duplicate_record", "path": path, "key": k, "count": counts[k]}
+                                  for k in sorted(self._dup_records[self.store.key(path)], key=str))
+        return issues
+
+    # 計畫 -> 支出與規劃中參照它的筆數；只鎖支出與規劃兩個檔案，畫面每次 rerun 呼叫一次即可查所有計畫
+    def references(self):
+        with self.store.transaction(*LEDGER_PATHS):
+            self._refresh(LEDGER_PATHS)
+            with self._lock:
+                refs = {}
+                for path in LEDGER_PATHS:
+                    for project, n in self._refs[self.store.key(path)].items():
+                        refs[project] = refs.get(project, 0) + n
+                return refs
+
+    # 把支出與規劃中的計畫名稱 old 改為 new，每個檔案只寫一次；呼叫端須持有相關檔案的鎖
+    def _cascade(self, old, new):
+        moved = 0
+        for path in LEDGER_PATHS:
+            records = self.store.snapshot(path)
+            # select 把空的計畫名稱當作不篩選，這種紀錄逐筆比對
+            if isinstance(records, Ledger) and old:
+                indices = records.select(project=old)
+            else:
+                indices = [i for i, r in enumerate(records) if isinstance(r, dict) and r.get("project") == old]
+            moved += self.store.batch(path, [("update", i, dict(records[i], project=new)) for i in indices])
+        return moved
+
+    # 修改計畫；改名時在同一個 transaction 內一併更新支出與規劃，回傳跟著改名的紀錄筆數。
+    # 新名稱已被其他計畫使用時丟出 ProjectNameError，不寫入任何資料
+    def update_project(self, rid, record):
+        with self.store.transaction(BUDGETS_PATH, *LEDGER_PATHS):
+            old = self.store.get(BUDGETS_PATH, rid)
+            new = record["name"]
+            if new != old["name"] and any(b.get("name") == new for b in self.store.snapshot(BUDGETS_PATH)):
+                raise ProjectNameError(f"計畫名稱「{new}」已存在")
+            self.store.update_by_id(BUDGETS_PATH, rid, record)
+            if new == old["name"]:
+                return 0
+            return self._cascade(old["name"], new)
+
+    # 依 check 的結果修復：補上缺少或重複的 ID、依紀錄重建餘額；renames（{孤兒計畫: 既有計畫}）
+    # 把孤兒紀錄改到指定的計畫；drop_duplicates 時每組重複的紀錄只保留第一筆。
+    # 全部在同一個 transaction 內完成，回傳各項修復的筆數
+    def repair(self, renames=None, drop_duplicates=False):
+        fixed = {"ids": 0, "balances": 0, "renamed": 0, "removed": 0}
+        with self._transaction():
+            issues = self.check()
+            kinds = {i["kind"] for i in issues}
+            for path in {i["path"] for i in issues if i["kind"] in ("duplicate_id", "missing_id")}:
+                fixed["ids"] += self.store.assign_ids(path)
+            if kinds & {"lab_cash", "student"}:
+                fixed["balances"] = sum(1 for i in issues if i["kind"] in ("lab_cash", "student"))
+                self.engine.rebuild()
+            names = {b.get("name") for b in self.store.snapshot(BUDGETS_PATH)}
+            orphans = {i["name"] for i in issues if i["kind"] == "orphan_project"}
+            for old, new in (renames or {}).items():
+                if old in orphans and new in names:
+                    fixed["renamed"] += self._cascade(old, new)
+            if drop_duplicates:
+                for path in LEDGER_PATHS:
+                    fixed["removed"] += self._drop_duplicates(path)
+        return fixed
+
+    def _drop_duplicates(self, path):
+        with self._lock:
+            if not self._dup_records[self.store.key(path)]:
+                return 0
+        rows = self.store.snapshot(path)
+        if isinstance(rows, Ledger) and not rows.has_raw():
+            keys = _ledger_keys(rows)
+        else:
+            keys = (record_key(r) if isinstance(r, dict) else None for r in rows)
+        seen = set()
+        drop = []
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            if key in seen:
+                drop.append(i)
+            seen.add(key)
+        # 由後往前刪，前面的索引不會位移
+        return self.store.batch(path, [("delete", i, None) for i in reversed(drop)])
+
+checker = ConsistencyChecker(datastore.store, balances.engine)
+
+def describe(issue):
+    kind = issue["kind"]
+    if kind == "orphan_project":
+        return f"[找不到計畫] {issue['path']}：「{issue['name']}」有 {issue['count']} 筆紀錄"
+    if kind == "orphan_log":
+        return f"[紀錄無對應學生] {issue['name']}：紀錄重播餘額 {issue['replayed']:,.0f}"
+    if kind in ("lab_cash", "student"):
+        return f"[餘額不一致] {issue['name']}：目前 {issue['stored']:,.0f}，重播結果 {issue['replayed']:,.0f}"
+    if kind == "missing_id":
+        return f"[缺少 ID] {issue['path']}：{issue['count']} 筆"
+    if kind == "duplicate_id":
+        return f"[重複 ID] {issue['path']}：{issue['id']} 出現 {issue['count']} 次"
+    if kind == "duplicate_name":
+        return f"[重複名稱] {issue['path']}：「{issue['name']}」出現 {issue['count']} 次"
+    project, category, amount, day, note = issue["key"]
+    return f"[重複紀錄] {issue['path']}：{project} | {category} | {amount:,.0f} | {day} | {note}（{issue['count']} 筆）"
+
+def main():
+    parser = argparse.ArgumentParser(description="檢查或修復資料檔之間的一致性")
+    parser.add_argument("command", choices=["verify", "repair"])
+    parser.add_argument("--rename", action="append", default=[], metavar="舊計畫=新計畫",
+                        help="把孤兒紀錄改到既有的計畫（可重複指定）")
+    parser.add_argument("--drop-duplicates", action="store_true", help="重複的支出 / 規劃只保留第一筆")
+    args = parser.parse_args()
+    if args.command == "repair":
+        renames = dict(item.split("=", 1) for item in args.rename)
+        fixed = checker.repair(renames, args.drop_duplicates)
+        print(f"補上 ID {fixed['ids']} 筆、重建餘額 {fixed['balances']} 項、"
+              f"改到既有計畫 {fixed['renamed']} 筆、移除重複紀錄 {fixed['removed']} 筆")
+    issues = checker.check()
+    for issue in issues:
+        print(describe(issue))
+    if not issues:
+        print("資料一致")
+    raise SystemExit(1 if issues else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# 全局常量
+CATEGORIES = [
+    "人事費", "業務費", "行政管理費", "雜支費",
+    "設備費", "國外差旅費", "國內旅費", "資本門", "經常門"
+]
+
+# 資料檔路徑
+BUDGETS_PATH = "data/budgets.json"
+EXPENSES_PATH = "data/expenses.json"
+PLANS_PATH = "data/plans.json"
+STUDENTS_PATH = "data/students.json"
+LAB_CASH_PATH = "data/lab_cash.json"
+STUDENT_LOG_PATH = "data/student_cash_log.json"
+VENDORS_PATH = "data/vendors.json"
+NOTES_PATH = "data/notes.json"
+LOGIN_LOG_PATH = "data/login_log.json"
+BALANCES_PATH = "data/balances.json"
+
+# 以紀錄串列保存的資料檔；每筆紀錄都有 datastore 指派的穩定 ID
+RECORD_PATHS = [
+    BUDGETS_PATH, EXPENSES_PATH, PLANS_PATH, STUDENTS_PATH, LAB_CASH_PATH,
+    STUDENT_LOG_PATH, VENDORS_PATH, NOTES_PATH, LOGIN_LOG_PATH,
+]
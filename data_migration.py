@@ -1,12 +1,21 @@
-import streamlit as st
-import gspread
+import hashlib
 import json
-from oauth2client.service_account import ServiceAccountCredentials
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import pandas as pd
+
+import datastore
+
+# streamlit、pandas 與 Google 用戶端都很慢才載入完（合計超過 1 秒），
+# 只在實際用到的函式內匯入：只用增量比對、重試等工具函式時不必付這個成本
 
 # 初始化 Google Sheet 客戶端
 def get_sheet_client():
+    import gspread
+    import streamlit as st
+    from oauth2client.service_account import ServiceAccountCredentials
+
     scope = [
         "https://spreadsheets.google.com/feeds",
         "https://www.googleapis.com/auth/drive"
@@ -16,22 +25,220 @@ def get_sheet_client():
     client = gspread.authorize(credentials)
     return client
 
-# 載入 JSON 檔案並轉成 DataFrame
-def load_json_to_df(json_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return pd.DataFrame(data)
+CHUNK_ROWS = 10000
+
+# 載入 JSON 檔案並轉成 DataFrame（經由 datastore，JSON 與 SQLite 後端皆適用）
+# 逐筆串流讀取，每 CHUNK_ROWS 筆轉成一個 DataFrame 區塊再合併，不必先建立整份 dict 串列
+def load_json_to_df(json_path, chunk_size=CHUNK_ROWS):
+    import pandas as pd
+
+    chunks, rows = [], []
+    for record in datastore.iter_records(str(json_path)):
+        rows.append(record)
+        if len(rows) >= chunk_size:
+            chunks.append(pd.DataFrame(rows))
+            rows = []
+    if rows or not chunks:
+        chunks.append(pd.DataFrame(rows))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+# 與 upload_to_sheet 相同的轉換：第一列為欄名，其餘為字串化的資料列
+def sheet_rows(df):
+    return [df.columns.tolist()] + df.fillna("").astype(str).values.tolist()
 
 def upload_to_sheet(sheet, sheet_name, df):
     try:
         worksheet = sheet.worksheet(sheet_name)
         sheet.del_worksheet(worksheet)
-    except:
-        pass
+    except Exception as e:
+        # 工作表不存在時直接新增；配額錯誤要往外丟，交給重試
+        if is_retryable(e):
+            raise
     worksheet = sheet.add_worksheet(title=sheet_name, rows=str(len(df)+10), cols=str(len(df.columns)+5))
-    worksheet.update([df.columns.tolist()] + df.fillna("").astype(str).values.tolist())
+    worksheet.update(sheet_rows(df))
+
+# 增量同步
+# data/sheet_sync.json 依試算表 ID 記錄每張工作表上次同步的內容雜湊、欄數與每列指紋。
+# 內容雜湊相同就跳過整個檔案；否則依位置比對列指紋，只把變動的連續區段
+# 以一次 batch_update 寫入，多出的舊列 / 舊欄以一次 batch_clear 清掉，工作表不會被刪除重建。
+# 若有人直接在 Google Sheet 上改了內容，記錄會與實際不符，此時用完整上傳重設。
+SYNC_STATE_PATH = "data/sheet_sync.json"
+
+def fingerprint(row):
+    return hashlib.blake2b(json.dumps(row, ensure_ascii=False).encode("utf-8"), digest_size=8).hexdigest()
+
+def content_hash(header, fingerprints):
+    digest = hashlib.blake2b(json.dumps(header, ensure_ascii=False).encode("utf-8"), digest_size=16)
+    for fp in fingerprints:
+        digest.update(fp.encode("ascii"))
+    return digest.hexdigest()
+
+def column_letter(n):
+    letters = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+def a1_range(row1, col1, row2, col2):
+    return f"{column_letter(col1)}{row1}:{column_letter(col2)}{row2}"
+
+# 依位置比對新舊指紋，回傳變動的連續區段 [(start, stop)]（0 起算，不含 stop）
+def changed_ranges(old, new):
+    ranges = []
+    start = None
+    for i, fp in enumerate(new):
+        if i < len(old) and old[i] == fp:
+            if start is not None:
+                ranges.append((start, i))
+                start = None
+        elif start is None:
+            start = i
+    if start is not None:
+        ranges.append((start, len(new)))
+    return ranges
+
+# 同步一張工作表，回傳 (新的同步記錄, 寫入的區段數)；內容未變動時區段數為 0
+def sync_sheet(sheet, worksheets, sheet_name, rows, entry):
+    fps = [fingerprint(r) for r in rows]
+    digest = content_hash(rows[0], fps)
+    width = len(rows[0])
+    worksheet = worksheets.get(sheet_name)
+    if entry and worksheet is not None and entry["hash"] == digest:
+        return entry, 0
+    if worksheet is None:
+        worksheet = sheet.add_worksheet(title=sheet_name, rows=str(len(rows)+10), cols=str(width+5))
+        worksheets[sheet_name] = worksheet
+        old, old_rows, old_width = [], 0, 0
+    elif entry is None:
+        # 沒有同步記錄：整張重寫，並清掉工作表原有範圍內多出的部分
+        old, old_rows, old_width = [], worksheet.row_count, worksheet.col_count
+    else:
+        old, old_rows, old_width = entry["rows"], len(entry["rows"]), entry["width"]
+    if width != old_width:
+        old = []
+    if len(rows) > worksheet.row_count or width > worksheet.col_count:
+        worksheet.resize(rows=max(len(rows)+10, worksheet.row_count), cols=max(width+5, worksheet.col_count))
+    data = []
+    if width:
+        data = [{"range": a1_range(start+1, 1, stop, width), "values": rows[start:stop]}
+                for start, stop in changed_ranges(old, fps)]
+    if data:
+        worksheet.batch_update(data)
+    clears = []
+    if old_rows > len(rows) and max(width, old_width):
+        clears.append(a1_range(len(rows)+1, 1, old_rows, max(width, old_width)))
+    if old_width > width and min(old_rows, len(rows)):
+        clears.append(a1_range(1, width+1, min(old_rows, len(rows)), old_width))
+    if clears:
+        worksheet.batch_clear(clears)
+    return {"hash": digest, "width": width, "rows": fps}, len(data) + len(clears)
+
+# 並行匯出
+# 每個檔案是一個獨立的工作，由 ThreadPoolExecutor 同時執行（每個工作大多在等網路），
+# 總耗時接近最慢的單一檔案。遇到 429 / 5xx 時以指數退避（含隨機抖動，優先採用 Retry-After）
+# 重試同一個工作；其他錯誤或重試用盡只讓該檔案失敗，不中斷其他檔案。
+MAX_WORKERS = 4
+RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def is_retryable(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in RETRY_STATUS
+
+def backoff_delay(error, attempt, base_delay=BASE_DELAY):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(MAX_DELAY, float(headers["Retry-After"]))
+    except (KeyError, TypeError, ValueError):
+        return min(MAX_DELAY, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+# 執行 fn，遇到可重試的錯誤時退避後重來；report 會記錄嘗試次數
+def with_retry(fn, retries=RETRIES, base_delay=BASE_DELAY, report=None):
+    for attempt in range(1, retries + 2):
+        if report is not None:
+            report["attempts"] = attempt
+        try:
+            return fn()
+        except Exception as e:
+            if attempt > retries or not is_retryable(e):
+                raise
+            time.sleep(backoff_delay(e, attempt, base_delay))
+
+# 以 task(file, sheet_name) -> (狀態, 寫入量) 並行處理 file_map，依完成順序逐一產生結果：
+# {"file", "sheet", "status", "written", "attempts", "seconds", "error"}
+def run_export(file_map, task, max_workers=MAX_WORKERS, retries=RETRIES, base_delay=BASE_DELAY):
+    def run(file, sheet_name):
+        result = {"file": file, "sheet": sheet_name, "status": "failed", "written": 0,
+                  "attempts": 0, "error": None}
+        start = time.perf_counter()
+        try:
+            result["status"], result["written"] = with_retry(
+                lambda: task(file, sheet_name), retries, base_delay, result)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run, file, sheet_name) for file, sheet_name in file_map.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+# 增量同步 file_map 中的所有檔案；狀態為 synced / unchanged / missing / failed
+def sync_all(sheet, sheet_id, file_map, json_dir, **options):
+    worksheets = {ws.title: ws for ws in with_retry(sheet.worksheets)}
+    state = datastore.snapshot(SYNC_STATE_PATH) if datastore.exists(SYNC_STATE_PATH) else {}
+    entries = state.get(sheet_id, {})
+
+    def task(file, sheet_name):
+        json_path = str(Path(json_dir) / file)
+        if not datastore.exists(json_path):
+            return "missing", 0
+        rows = sheet_rows(load_json_to_df(json_path))
+        entry, written = sync_sheet(sheet, worksheets, sheet_name, rows, entries.get(sheet_name))
+        if entry is not entries.get(sheet_name):
+            save_sync_entry(sheet_id, sheet_name, entry)
+        return ("synced" if written else "unchanged"), written
+
+    return run_export(file_map, task, **options)
+
+# 完整上傳：刪除並重建每張工作表
+def upload_all(sheet, sheet_id, file_map, json_dir, **options):
+    reset_sync_state(sheet_id)
+
+    def task(file, sheet_name):
+        json_path = str(Path(json_dir) / file)
+        if not datastore.exists(json_path):
+            return "missing", 0
+        df = load_json_to_df(json_path)
+        upload_to_sheet(sheet, sheet_name, df)
+        return "synced", len(df)
+
+    return run_export(file_map, task, **options)
+
+# 每張工作表同步完成就寫入記錄，中途失敗時已完成的檔案下次不必重傳
+def save_sync_entry(sheet_id, sheet_name, entry):
+    with datastore.transaction(SYNC_STATE_PATH):
+        state = datastore.load(SYNC_STATE_PATH) if datastore.exists(SYNC_STATE_PATH) else {}
+        state.setdefault(sheet_id, {})[sheet_name] = entry
+        datastore.save(SYNC_STATE_PATH, state)
+
+# 完整上傳後清掉同步記錄，下次增量同步會先整張比對重寫
+def reset_sync_state(sheet_id):
+    with datastore.transaction(SYNC_STATE_PATH):
+        if datastore.exists(SYNC_STATE_PATH):
+            state = datastore.load(SYNC_STATE_PATH)
+            if state.pop(sheet_id, None) is not None:
+                datastore.save(SYNC_STATE_PATH, state)
 
 def main():
+    import streamlit as st
+
     st.title("📤 上傳本地 JSON 到 Google Sheet")
     sheet_id = "1GnoZuEm6PI8421qSJ471vrsINsAulApXsmYvBQz6gHU"
     sheet = get_sheet_client().open_by_key(sheet_id)
@@ -51,18 +258,34 @@ def main():
     }
 
     json_dir = Path("data")  # 改成與 app.py 一致的路徑
-    if not json_dir.exists():
+    if datastore.store.backend.name == "json" and not json_dir.exists():
         st.error("⚠️ 找不到 data 目錄，請上傳資料或建資料夾")
         return
 
-    for file, sheet_name in file_map.items():
-        json_path = json_dir / file
-        if json_path.exists():
-            df = load_json_to_df(json_path)
-            upload_to_sheet(sheet, sheet_name, df)
-            st.success(f"✅ 上傳 {file} -> Sheet: {sheet_name}")
+    mode = st.radio("上傳模式", ["增量同步", "完整上傳"], horizontal=True)
+    export = sync_all if mode == "增量同步" else upload_all
+    unit = "個區段" if mode == "增量同步" else "列"
+
+    progress = st.progress(0.0, text="上傳中…")
+    start = time.perf_counter()
+    report = []
+    for n, r in enumerate(export(sheet, sheet_id, file_map, json_dir), start=1):
+        progress.progress(n / len(file_map), text=f"{n}/{len(file_map)} {r['file']}")
+        retry_note = f"，重試 {r['attempts'] - 1} 次" if r["attempts"] > 1 else ""
+        if r["status"] == "missing":
+            st.warning(f"⚠️ 缺少 {r['file']}")
+        elif r["status"] == "failed":
+            st.error(f"❌ {r['file']} 上傳失敗{retry_note}：{r['error']}")
+        elif r["status"] == "unchanged":
+            st.info(f"➖ {r['file']} 未變動，略過")
         else:
-            st.warning(f"⚠️ 缺少 {file}")
+            st.success(f"✅ 上傳 {r['file']} -> Sheet: {r['sheet']}（{r['written']} {unit}，{r['seconds']:.1f} 秒{retry_note}）")
+        report.append({"檔案": r["file"], "工作表": r["sheet"], "狀態": r["status"],
+                       "嘗試次數": r["attempts"], "秒數": round(r["seconds"], 2)})
+    elapsed = time.perf_counter() - start
+    serial = sum(row["秒數"] for row in report)
+    progress.progress(1.0, text=f"完成：總耗時 {elapsed:.1f} 秒（逐一上傳約 {serial:.1f} 秒）")
+    st.dataframe(report, hide_index=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,655 @@
+import argparse
+import os
+import secrets
+import threading
+
+import locks
+from backends import CorruptDataError, RecordNotFoundError, make_backend
+from constants import RECORD_PATHS
+from ledger import Ledger, is_columnar
+
+# 共用資料存取層
+# 解析過的資料以 (路徑, 後端 stamp) 為鍵快取在行程內，JSON 檔的 stamp 是
+# (mtime, 檔案大小)，SQLite 則是該檔的 revision；同一份資料在內容變更前只會被解析一次。
+# 每個檔案有一個版本號，內容每變動一次就加一；衍生索引（DerivedIndex 的子類別）
+# 以版本號判斷是否需要重建，並透過 subscribe 收到逐筆異動以增量更新。
+# 所有寫入都在該檔的建議鎖（locks.py）內完成：先在鎖內重新讀取最新內容再修改，
+# 多個工作階段 / 行程同時寫入也不會互相覆蓋；跨檔案的讀改寫以 transaction() 包起來。
+# 支出與規劃（ledger.COLUMNAR_FILES）在快取中以欄式的 Ledger 保存，對外仍是串列介面。
+# 串列檔案中的每筆紀錄都有穩定的 ID（第一個鍵 "id"），新增或整份儲存時自動指派；
+# 畫面以 ID 指定要修改 / 刪除的紀錄，位置由 ID 索引對照，不受其他人同時新增或刪除影響。
+
+# JSON 結構的快速深拷貝（只處理 dict / list / Ledger，其餘為不可變值）
+def clone(value):
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    if isinstance(value, Ledger):
+        return value.copy()
+    return value
+
+# 放進快取前的表示方式：欄式檔案轉成 Ledger（Ledger 會自行複製內容），其餘深拷貝
+def _cached_form(path, data):
+    if is_columnar(path) and isinstance(data, list):
+        return Ledger(data)
+    return clone(data)
+
+def new_id():
+    return secrets.token_hex(8)
+
+# 回傳帶有 ID 的紀錄（ID 放在第一個鍵）；已有 ID 的紀錄原樣回傳，非 dict 不處理
+def with_id(record, rid=None):
+    if not isinstance(record, dict) or record.get("id"):
+        return record
+    return {"id": rid or new_id(), **{k: v for k, v in record.items() if k != "id"}}
+
+# 補上缺少或重複的 ID，回傳 (紀錄串列, 補上的筆數)；沒有需要補的就回傳原本的物件
+def assign_ids(records):
+    if not isinstance(records, (list, Ledger)):
+        return records, 0
+    if isinstance(records, Ledger):
+        ids = records.ids
+    else:
+        ids = [r.get("id") if isinstance(r, dict) else None for r in records]
+    seen = set()
+    fixes = []
+    for i, rid in enumerate(ids):
+        if rid and rid not in seen:
+            seen.add(rid)
+        elif rid or isinstance(records[i], dict):
+            fixes.append(i)
+    if not fixes:
+        return records, 0
+    records = list(records)
+    for i in fixes:
+        rid = new_id()
+        while rid in seen:
+            rid = new_id()
+        seen.add(rid)
+        records[i] = {"id": rid, **{k: v for k, v in records[i].items() if k != "id"}}
+    return records, len(fixes)
+
+# ID → 索引對照，綁定一份快照。新增與修改直接調整對照表；
+# 刪除會讓之後的紀錄位移，只記下最前面的失效位置，下次查詢時才從那裡往後補建
+class _IdIndex:
+    def __init__(self, data):
+        self.data = data
+        self.positions = {}
+        # 索引小於 valid 的對照都是正確的
+        self.valid = 0
+
+    def _ids(self, start):
+        if isinstance(self.data, Ledger):
+            return self.data.ids[start:]
+        return [r.get("id") if isinstance(r, dict) else None for r in self.data[start:]]
+
+    def find(self, rid):
+        index = self.positions.get(rid)
+        if index is not None and index < self.valid:
+            return index
+        if self.valid < len(self.data):
+            for index, value in enumerate(self._ids(self.valid), self.valid):
+                if value is not None:
+                    self.positions[value] = index
+            self.valid = len(self.data)
+            return self.positions.get(rid)
+        return None
+
+    def apply(self, changes):
+        for op, index, old, new in changes:
+            old_id = old.get("id") if isinstance(old, dict) else None
+            new_id = new.get("id") if isinstance(new, dict) else None
+            if op == "delete":
+                self.positions.pop(old_id, None)
+                self.valid = min(self.valid, index)
+            elif op == "update":
+                if old_id != new_id:
+                    self.positions.pop(old_id, None)
+                if new_id is not None and index < self.valid:
+                    self.positions[new_id] = index
+            elif index == self.valid:
+                if new_id is not None:
+                    self.positions[new_id] = index
+                self.valid += 1
+
+class DataStore:
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+        self._entries = {}
+        self._versions = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._corrupt = {}
+        self._indexes = {}
+        self._ids_checked = set()
+        self._bootstrapped = False
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path):
+        return os.path.normpath(path)
+
+    def _cached(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry
+            return None
+
+    # 取得共用的解析結果；呼叫端不可修改回傳值
+    def snapshot(self, path):
+        key = self.key(path)
+        entry = self._cached(key, self.backend.stamp(path))
+        if entry is not None:
+            return entry[1]
+        # 快取失效時在鎖內讀取，確保不會讀到其他行程寫到一半的日誌壓縮
+        with locks.locked(path):
+            stamp = self.backend.stamp(path)
+            entry = self._cached(key, stamp)
+            if entry is not None:
+                return entry[1]
+            try:
+                data = self.backend.read(path)
+                if is_columnar(path) and isinstance(data, list):
+                    data = Ledger(data)
+            except ValueError as e:
+                with self._lock:
+                    self._corrupt[key] = str(e)
+                    self._entries.pop(key, None)
+                raise CorruptDataError(f"{path} 內容無法解析：{e}") from e
+            with self._lock:
+                self.misses += 1
+                self._corrupt.pop(key, None)
+                self._entries[key] = (stamp, data)
+                self._bump(key)
+        return data
+
+    # 逐筆讀取：已有快取時走訪快取（淺拷貝，不受迭代期間的異動影響）；
+    # 否則由後端串流解析，不建立整份串列、也不放進快取，
+    # 匯出、核對等一次性掃描因此只需常數記憶體。迭代期間持有該檔的鎖。
+    def iter_records(self, path):
+        key = self.key(path)
+        entry = self._cached(key, self.backend.stamp(path))
+        if entry is not None:
+            data = entry[1]
+            if isinstance(data, Ledger):
+                yield from data.copy()
+            else:
+                yield from (list(data) if isinstance(data, list) else [data])
+            return
+        reader = getattr(self.backend, "iter_records", None)
+        if reader is None:
+            data = self.snapshot(path)
+            yield from (data if isinstance(data, (list, Ledger)) else [data])
+            return
+        with locks.locked(path):
+            try:
+                yield from reader(path)
+            except ValueError as e:
+                with self._lock:
+                    self._corrupt[key] = str(e)
+                raise CorruptDataError(f"{path} 內容無法解析：{e}") from e
+
+    # 每次 rerun 開始時呼叫：之後同一個執行緒以 pinned() 讀到的是同一版快照，
+    # 其他工作階段在這期間發布的新版本要到下次 rerun 才看得到；自己寫入的檔案則立即改讀新版本
+    def begin_view(self):
+        self._local.pins = {}
+
+    def pinned(self, path):
+        pins = getattr(self._local, "pins", None)
+        if pins is None:
+            return self.snapshot(path)
+        key = self.key(path)
+        data = pins.get(key)
+        if data is None:
+            data = pins[key] = self.snapshot(path)
+        return data
+
+    def _unpin(self, key):
+        pins = getattr(self._local, "pins", None)
+        if pins:
+            pins.pop(key, None)
+
+    # 讀取失敗過的檔案在修復前拒絕任何寫入，避免以預設值（空串列）蓋掉原本的帳本
+    def _check_writable(self, path):
+        error = self._corrupt.get(self.key(path))
+        if error is not None:
+            raise CorruptDataError(f"{path} 內容無法解析，為避免覆蓋資料已停止寫入：{error}")
+
+    # 跨檔案的讀改寫：鎖住所有相關檔案，區塊內讀到的都是最新內容
+    def transaction(self, *paths):
+        return locks.locked(*paths)
+
+    # 同時取得資料與其版本號，兩者保證對應同一份內容
+    def versioned(self, path):
+        key = self.key(path)
+        while True:
+            data = self.snapshot(path)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is data:
+                    return data, self._versions.get(key, 0)
+
+    def version(self, path):
+        return self._versions.get(self.key(path), 0)
+
+    def _bump(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return self._versions[key]
+
+    def exists(self, path):
+        return self.backend.exists(path)
+
+    # 檔案不存在時以預設內容建立
+    def ensure(self, path, default):
+        if self.backend.exists(path):
+            return
+        with locks.locked(path):
+            if not self.backend.exists(path):
+                self.backend.write(path, default)
+
+    # 取得可自由修改的副本
+    def load(self, path):
+        return clone(self.snapshot(path))
+
+    def save(self, path, data):
+        key = self.key(path)
+        with locks.locked(path):
+            self._check_writable(path)
+            data = _cached_form(path, assign_ids(data)[0])
+            self._write(key, lambda: self.backend.write(path, data))
+            stamp = self.backend.stamp(path)
+            with self._lock:
+                # 寫入的內容即為最新版本，直接放回快取，下次讀取不必重新解析
+                self._entries[key] = (stamp, data)
+                self._bump(key)
+        self._unpin(key)
+
+    # 後端寫入（含 fsync）不持有 self._lock，其他檔案的快取命中不必等待；
+    # 同一檔案的寫入者由該檔的鎖互斥，讀者看到檔案 stamp 已變而快取還沒更新時，
+    # 會在 snapshot 中等該檔的鎖，寫入完成後拿到新版本。寫入失敗時丟棄快取，下次讀取重新載入
+    def _write(self, key, write):
+        try:
+            write()
+        except Exception:
+            with self._lock:
+                self._entries.pop(key, None)
+            raise
+
+    # 寫入時複製：異動套用在目前快照的副本上（串列只複製參照，Ledger 複製欄位），
+    # 後端寫入成功後才把副本發布為新的快照。其他工作階段手上的舊快照不會在讀取途中被改動，
+    # 下次讀取（或下次 rerun）直接拿到已解析好的新版本，不必重新解析檔案。
+    # 寫入失敗時不發布副本，並丟棄快取，下次讀取會重新載入。
+    def _fork(self, path):
+        data = self.snapshot(path)
+        return data.fork() if isinstance(data, Ledger) else list(data)
+
+    def _publish(self, path, data, changes, write):
+        key = self.key(path)
+        self._write(key, write)
+        stamp = self.backend.stamp(path)
+        with self._lock:
+            # ID 索引跟著移到新的快照上，只調整異動的紀錄
+            base = self._entries.get(key)
+            index = self._indexes.get(key)
+            if index is not None and base is not None and index.data is base[1]:
+                index.data = data
+                index.apply(changes)
+            else:
+                self._indexes.pop(key, None)
+            self._entries[key] = (stamp, data)
+            events = [(key, op, index, old, new, self._bump(key)) for op, index, old, new in changes]
+        self._unpin(key)
+        return events
+
+    # 通知訂閱者時不持有任何鎖，訂閱者可在回呼中讀取資料而不會互相等待；
+    # 訂閱者以版本號判斷事件是否接續自己手上的版本
+    def _notify(self, events):
+        with self._lock:
+            listeners = list(self._listeners)
+        for event in events:
+            for listener in listeners:
+                listener(*event)
+
+    # 目前快照的 ID 索引；呼叫端須持有 self._lock
+    def _id_index(self, key, data):
+        index = self._indexes.get(key)
+        if index is None or index.data is not data:
+            index = self._indexes[key] = _IdIndex(data)
+        return index
+
+    def _locate(self, path, rid):
+        data = self.snapshot(path)
+        with self._lock:
+            index = self._id_index(self.key(path), data).find(rid) if rid else None
+        if index is None:
+            raise RecordNotFoundError(f"{path} 找不到紀錄 {rid}，可能已被其他工作階段刪除")
+        return data, index
+
+    # 紀錄目前的位置；找不到時丟出 RecordNotFoundError
+    def index_of(self, path, rid):
+        return self._locate(path, rid)[1]
+
+    def get(self, path, rid):
+        data, index = self._locate(path, rid)
+        return clone(data[index])
+
+    # 新增的紀錄沒有 ID、或 ID 已被同一檔案的其他紀錄使用時，指派新的 ID
+    def _new_record(self, key, data, record):
+        rid = record.get("id") if isinstance(record, dict) else None
+        if rid:
+            with self._lock:
+                if self._id_index(key, data).find(rid) is None:
+                    return record
+            record = {k: v for k, v in record.items() if k != "id"}
+        return with_id(record)
+
+    # 修改時沿用原本的 ID
+    def _replacement(self, old, record):
+        if isinstance(old, dict) and old.get("id"):
+            return {"id": old["id"], **{k: v for k, v in record.items() if k != "id"}}
+        return with_id(record)
+
+    def append(self, path, record):
+        record = clone(record)
+        with locks.locked(path):
+            record = self._new_record(self.key(path), self.snapshot(path), record)
+            data = self._fork(path)
+            self._check_writable(path)
+            data.append(record)
+            events = self._publish(path, data, [("append", len(data) - 1, None, record)],
+                                   lambda: self.backend.append(path, data, record))
+        self._notify(events)
+
+    def update(self, path, index, record):
+        record = clone(record)
+        with locks.locked(path):
+            data = self._fork(path)
+            self._check_writable(path)
+            old = data[index]
+            if isinstance(record, dict):
+                record = self._replacement(old, record)
+            data[index] = record
+            events = self._publish(path, data, [("update", index, old, record)],
+                                   lambda: self.backend.update(path, data, index, record))
+        self._notify(events)
+
+    # 以 ID 指定紀錄的修改 / 刪除：在鎖內由 ID 索引找出目前的位置
+    def update_by_id(self, path, rid, record):
+        with locks.locked(path):
+            self.update(path, self.index_of(path, rid), record)
+
+    def delete_by_id(self, path, rid):
+        with locks.locked(path):
+            self.delete(path, self.index_of(path, rid))
+
+    def delete(self, path, index):
+        with locks.locked(path):
+            data = self._fork(path)
+            self._check_writable(path)
+            old = data.pop(index)
+            events = self._publish(path, data, [("delete", index, old, None)],
+                                   lambda: self.backend.delete(path, data, index))
+        self._notify(events)
+
+    # 批次異動：ops 為依序套用的 ("append", None, record) / ("update", index, record) / ("delete", index, None)，
+    # 後端只寫入一次；每一筆仍各自遞增版本號並通知訂閱者，衍生索引照常增量更新
+    def batch(self, path, ops):
+        ops = [(kind, index, clone(record) if record is not None else None) for kind, index, record in ops]
+        if not ops:
+            return 0
+        with locks.locked(path):
+            base = self.snapshot(path)
+            data = self._fork(path)
+            self._check_writable(path)
+            changes = []
+            applied = []
+            for kind, index, record in ops:
+                if kind == "append":
+                    record = self._new_record(self.key(path), base, record)
+                    data.append(record)
+                    changes.append(("append", len(data) - 1, None, record))
+                elif kind == "update":
+                    old = data[index]
+                    if isinstance(record, dict):
+                        record = self._replacement(old, record)
+                    changes.append(("update", index, old, record))
+                    data[index] = record
+                else:
+                    changes.append(("delete", index, data.pop(index), None))
+                applied.append((kind, index, record))
+            events = self._publish(path, data, changes, lambda: self.backend.apply(path, data, applied))
+        self._notify(events)
+        return len(ops)
+
+    # 以 ID 指定的批次異動：ops 為 ("append", None, record) / ("update", rid, record) / ("delete", rid, None)。
+    # 在該檔的鎖內把 ID 換成目前的位置再交給 batch：先更新、再由後往前刪除、最後新增，
+    # 其他工作階段同時新增或刪除也不會改到別筆；有任何 ID 已不存在時丟出 RecordNotFoundError，整批不寫入
+    def batch_by_id(self, path, ops):
+        with locks.locked(path):
+            data = self.snapshot(path)
+            with self._lock:
+                index = self._id_index(self.key(path), data)
+                positions = {rid: index.find(rid) for kind, rid, _ in ops if kind != "append"}
+            for rid, position in positions.items():
+                if position is None:
+                    raise RecordNotFoundError(f"{path} 找不到紀錄 {rid}，可能已被其他工作階段刪除")
+            updates = [("update", positions[rid], record) for kind, rid, record in ops if kind == "update"]
+            deletes = sorted((positions[rid] for kind, rid, _ in ops if kind == "delete"), reverse=True)
+            appends = [op for op in ops if op[0] == "append"]
+            return self.batch(path, updates + [("delete", i, None) for i in deletes] + appends)
+
+    # 讀最後 n 筆：已有快取就直接切片，否則交給後端從尾端讀，不必解析整份歷史
+    def tail(self, path, n=1):
+        key = self.key(path)
+        stamp = self.backend.stamp(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1][-n:]
+        tail = getattr(self.backend, "tail", None)
+        rows = tail(path, n) if tail else None
+        if rows is None:
+            return self.snapshot(path)[-n:]
+        return rows
+
+    def subscribe(self, listener):
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._indexes.clear()
+            else:
+                self._entries.pop(self.key(path), None)
+                self._indexes.pop(self.key(path), None)
+
+    # 替既有資料中沒有 ID（或 ID 重複）的紀錄補上 ID，回傳補上的筆數；已全部有 ID 時不寫入
+    def assign_ids(self, path):
+        if not self.backend.exists(path):
+            return 0
+        with locks.locked(path):
+            records, count = assign_ids(self.snapshot(path))
+            if count:
+                self.save(path, records)
+        return count
+
+    # 每個行程只檢查一次；無法解析的檔案不影響其他檔案補 ID，全部檢查完才丟出第一個錯誤，
+    # 該檔修復後的下次呼叫會再檢查
+    def ensure_ids(self, paths=RECORD_PATHS):
+        error = None
+        for path in paths:
+            key = self.key(path)
+            if key in self._ids_checked:
+                continue
+            try:
+                self.assign_ids(path)
+            except CorruptDataError as e:
+                error = error or e
+                continue
+            self._ids_checked.add(key)
+        if error is not None:
+            raise error
+
+    # 建立缺少的資料檔（空串列）並補上紀錄 ID。app 每次 rerun 都會呼叫，
+    # 但每個行程只在第一次成功時實際檢查，之後直接返回，不再逐檔 stat；
+    # 有檔案無法解析時不算成功，下次 rerun 只重試尚未補過 ID 的檔案
+    def bootstrap(self, paths=RECORD_PATHS):
+        if self._bootstrapped:
+            return
+        for path in paths:
+            self.ensure(path, [])
+        self.ensure_ids(paths)
+        self._bootstrapped = True
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "backend": self.backend.name,
+                "files": sorted(self._entries),
+            }
+
+# 由資料檔衍生的記憶體索引（aggregates、rollups、search 等）的共用部分。
+# 每個檔案記錄索引建立在哪一版：讀取前版本不一致才整份重建（_rebuild），
+# 收到建立在前一版之上的逐筆異動時直接套用（_update），否則留給下次讀取時重建。
+# 讀取資料時不持有索引的鎖，避免與正在通知異動的寫入端互相等待。
+class DerivedIndex:
+    def __init__(self, store, paths):
+        self.store = store
+        self._paths = {store.key(path): path for path in paths}
+        self._built = {key: None for key in self._paths}
+        self._lock = threading.RLock()
+        self.rebuilds = 0
+        store.subscribe(self._on_change)
+
+    # 以整份資料重建 key 的部分；呼叫時已持有 self._lock
+    def _rebuild(self, key, rows):
+        raise NotImplementedError
+
+    # 套用一筆異動（old / new 為 None 表示新增 / 刪除）；呼叫時已持有 self._lock
+    def _update(self, key, op, index, old, new):
+        raise NotImplementedError
+
+    # 確認 paths（預設為全部）的索引與資料版本一致，回傳各檔目前建立在哪一版
+    def refresh(self, paths=None):
+        for path in self._paths.values() if paths is None else paths:
+            key = self.store.key(path)
+            rows, version = self.store.versioned(path)
+            with self._lock:
+                if self._built[key] != version:
+                    self._rebuild(key, rows)
+                    self._built[key] = version
+                    self.rebuilds += 1
+        with self._lock:
+            return dict(self._built)
+
+    def _on_change(self, key, op, index, old, new, version):
+        if key not in self._built:
+            return
+        with self._lock:
+            if self._built[key] != version - 1:
+                self._built[key] = None
+                return
+            self._update(key, op, index, old, new)
+            self._built[key] = version
+
+# 行程層級的預設實例：Streamlit 每次 rerun 都會重新執行 app.py，
+# 但已匯入的模組只載入一次，因此快取可跨 rerun 保留，並由所有工作階段共用同一份解析結果。
+store = DataStore()
+
+def snapshot(path):
+    return store.snapshot(path)
+
+def begin_view():
+    store.begin_view()
+
+def pinned(path):
+    return store.pinned(path)
+
+def iter_records(path):
+    return store.iter_records(path)
+
+def exists(path):
+    return store.exists(path)
+
+def ensure(path, default):
+    store.ensure(path, default)
+
+def load(path):
+    return store.load(path)
+
+def save(path, data):
+    store.save(path, data)
+
+def append(path, record):
+    store.append(path, record)
+
+def update(path, index, record):
+    store.update(path, index, record)
+
+def delete(path, index):
+    store.delete(path, index)
+
+def index_of(path, rid):
+    return store.index_of(path, rid)
+
+def get(path, rid):
+    return store.get(path, rid)
+
+def update_by_id(path, rid, record):
+    store.update_by_id(path, rid, record)
+
+def delete_by_id(path, rid):
+    store.delete_by_id(path, rid)
+
+def ensure_ids(paths=RECORD_PATHS):
+    store.ensure_ids(paths)
+
+def bootstrap(paths=RECORD_PATHS):
+    store.bootstrap(paths)
+
+def batch(path, ops):
+    return store.batch(path, ops)
+
+def batch_by_id(path, ops):
+    return store.batch_by_id(path, ops)
+
+def tail(path, n=1):
+    return store.tail(path, n)
+
+def transaction(*paths):
+    return store.transaction(*paths)
+
+def version(path):
+    return store.version(path)
+
+def invalidate(path=None):
+    store.invalidate(path)
+
+def stats():
+    return store.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description="替資料檔中沒有 ID 的紀錄補上穩定的 ID")
+    parser.add_argument("command", choices=["assign-ids"])
+    parser.add_argument("paths", nargs="*", default=RECORD_PATHS)
+    args = parser.parse_args()
+    for path in args.paths:
+        if not store.exists(path):
+            continue
+        count = store.assign_ids(path)
+        print(f"{path}：{'補上 ' + str(count) + ' 筆 ID' if count else '已全部有 ID'}")
+
+if __name__ == "__main__":
+    main()
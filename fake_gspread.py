@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from collections import Counter
+
+# 本機模擬的 gspread Spreadsheet / Worksheet
+# 只實作 data_migration 用到的方法，資料存在記憶體中，並記錄每種 API 呼叫的次數，
+# 讓 Google Sheets 同步不必連網就能驗證內容與呼叫量。
+# latency 模擬每次呼叫的網路延遲；rate_limit_every = N 時每第 N 次呼叫回傳 429，用來驗證退避重試。
+
+_CELL = re.compile(r"^([A-Z]+)(\d+)$")
+
+def _column_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+def parse_range(a1):
+    parts = a1.split(":")
+    cells = []
+    for part in parts:
+        m = _CELL.match(part)
+        if not m:
+            raise ValueError(f"不支援的範圍：{a1}")
+        cells.append((int(m.group(2)), _column_number(m.group(1))))
+    if len(cells) == 1:
+        cells.append(cells[0])
+    (r1, c1), (r2, c2) = cells
+    return r1, c1, r2, c2
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+# 與 gspread.exceptions.APIError 一樣帶有 response.status_code
+class FakeAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.response = FakeResponse(status_code)
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows, cols):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self.cells = {}
+
+    def _call(self, name):
+        self.spreadsheet._call(name)
+
+    def _check(self, row, col):
+        if row > self.row_count or col > self.col_count:
+            raise ValueError(f"超出工作表範圍：{row},{col}（{self.row_count}x{self.col_count}）")
+
+    def _write(self, row, col, values):
+        written = 0
+        for i, line in enumerate(values):
+            for j, value in enumerate(line):
+                self._check(row + i, col + j)
+                if value == "":
+                    self.cells.pop((row + i, col + j), None)
+                else:
+                    self.cells[(row + i, col + j)] = str(value)
+                written += 1
+        with self.spreadsheet._lock:
+            self.spreadsheet.cells_written += written
+
+    def update(self, values, range_name="A1"):
+        self._call("update")
+        r1, c1, _, _ = parse_range(range_name)
+        self._write(r1, c1, values)
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        for item in data:
+            r1, c1, _, _ = parse_range(item["range"])
+            self._write(r1, c1, item["values"])
+
+    def batch_clear(self, ranges):
+        self._call("batch_clear")
+        for a1 in ranges:
+            r1, c1, r2, c2 = parse_range(a1)
+            for key in [k for k in self.cells if r1 <= k[0] <= r2 and c1 <= k[1] <= c2]:
+                del self.cells[key]
+
+    def resize(self, rows=None, cols=None):
+        self._call("resize")
+        if rows is not None:
+            self.row_count = int(rows)
+        if cols is not None:
+            self.col_count = int(cols)
+        self.cells = {k: v for k, v in self.cells.items() if k[0] <= self.row_count and k[1] <= self.col_count}
+
+    def clear(self):
+        self._call("clear")
+        self.cells = {}
+
+    # 與 gspread 相同：去掉尾端的空列與空欄
+    def get_all_values(self):
+        self._call("get_all_values")
+        if not self.cells:
+            return []
+        rows = max(r for r, _ in self.cells)
+        cols = max(c for _, c in self.cells)
+        return [[self.cells.get((r, c), "") for c in range(1, cols + 1)] for r in range(1, rows + 1)]
+
+class FakeSpreadsheet:
+    def __init__(self, latency=0.0, rate_limit_every=0):
+        self.sheets = {}
+        self.calls = Counter()
+        self.cells_written = 0
+        self.rate_limited = 0
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            limited = self.rate_limit_every and self.total_calls() % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if limited:
+            raise FakeAPIError(429, "Quota exceeded")
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        if title not in self.sheets:
+            raise KeyError(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self._call("add_worksheet")
+        if title in self.sheets:
+            raise ValueError(f"工作表已存在：{title}")
+        self.sheets[title] = FakeWorksheet(self, title, rows, cols)
+        return self.sheets[title]
+
+    def del_worksheet(self, worksheet):
+        self._call("del_worksheet")
+        del self.sheets[worksheet.title]
+
+    def total_calls(self):
+        return sum(self.calls.values())
@@ -0,0 +1,125 @@
+from datetime import date
+
+import datastore
+import rollups
+from constants import BUDGETS_PATH, CATEGORIES, EXPENSES_PATH, PLANS_PATH
+from rollups import month_index, month_label
+
+# 燃燒率預測
+# 依支出紀錄計算各計畫 / 分類最近 window 個月的平均月支出（燃燒率），
+# 加上 plans.json 中排定的規劃支出，逐月推算餘額何時用罄，並與計畫結束日比較。
+# 每月支出與規劃取自 rollups 的月份彙總（隨 datastore 的逐筆異動增量更新）；預測結果依計畫快取，
+# 只有被異動到的計畫、預算變更或換日時才重新計算。
+
+HORIZON_MONTHS = 120
+
+def _project_of(record):
+    return record.get("project") if record else None
+
+class BurnForecaster(datastore.DerivedIndex):
+    def __init__(self, store, rollup, window=3):
+        self.rollup = rollup
+        self.window = window
+        self.expenses_key = store.key(EXPENSES_PATH)
+        self.plans_key = store.key(PLANS_PATH)
+        self._results = {}
+        self._result_key = None
+        super().__init__(store, (EXPENSES_PATH, PLANS_PATH))
+
+    # 漏接異動而整份重建時，所有計畫的預測都要重算
+    def _rebuild(self, key, rows):
+        self._results.clear()
+
+    # 只丟掉受影響計畫的預測，月份桶由 rollups 自己增量更新
+    def _update(self, key, op, index, old, new):
+        self._results.pop(_project_of(old), None)
+        self._results.pop(_project_of(new), None)
+
+    def _refresh(self):
+        self.rollup.refresh()
+        self.refresh()
+
+    def _series(self, key, project, category):
+        return self.rollup.series(self._paths[key], project, category, refresh=False)
+
+    # 視窗不早於計畫開始、不晚於計畫結束；計畫開始不滿 window 個月時以實際月數平均
+    def _burn_rate(self, spend, current, start, end):
+        last = min(current, end) if end is not None else current
+        first = last - self.window + 1
+        if start is not None:
+            first = max(first, start)
+        months = last - first + 1
+        if months <= 0:
+            return 0.0
+        return sum(v for m, v in spend.items() if first <= m <= last) / months
+
+    # 逐月扣除燃燒率與排定的規劃，回傳第一個餘額為負的月份；HORIZON_MONTHS 內不會用罄則為 None
+    def _deplete(self, remaining, burn, plans, current):
+        if remaining < 0:
+            return current
+        overdue = sum(v for m, v in plans.items() if m < current)
+        balance = remaining - overdue
+        for month in range(current, current + HORIZON_MONTHS):
+            balance -= burn + plans.get(month, 0.0)
+            if balance < 0:
+                return month
+        return None
+
+    def _forecast(self, budget, current):
+        name = budget["name"]
+        start = month_index(budget.get("start_date"))
+        end = month_index(budget.get("end_date"))
+        allocations = budget.get("categories", {})
+        categories = {}
+        total = {"allocated": 0.0, "spent": 0.0, "burn": 0.0, "plans": {}}
+        for cat in CATEGORIES:
+            spend = self._series(self.expenses_key, name, cat)
+            plans = self._series(self.plans_key, name, cat)
+            allocated = float(allocations.get(cat, 0.0))
+            if not allocated and not spend and not plans:
+                continue
+            spent = sum(spend.values())
+            burn = self._burn_rate(spend, current, start, end)
+            depletes = self._deplete(allocated - spent, burn, plans, current)
+            categories[cat] = self._result(allocated, spent, burn, depletes, end)
+            total["allocated"] += allocated
+            total["spent"] += spent
+            total["burn"] += burn
+            for m, v in plans.items():
+                total["plans"][m] = total["plans"].get(m, 0.0) + v
+        depletes = self._deplete(total["allocated"] - total["spent"], total["burn"], total["plans"], current)
+        result = self._result(total["allocated"], total["spent"], total["burn"], depletes, end)
+        result["project"] = name
+        result["end_month"] = month_label(end) if end is not None else None
+        result["categories"] = categories
+        return result
+
+    def _result(self, allocated, spent, burn, depletes, end):
+        return {
+            "allocated": allocated,
+            "spent": spent,
+            "burn": burn,
+            "depletes": month_label(depletes) if depletes is not None else None,
+            # 在計畫結束前就會用罄
+            "before_end": depletes is not None and end is not None and depletes <= end,
+        }
+
+    def forecast(self, project, today=None):
+        return self.forecast_all(today).get(project)
+
+    def forecast_all(self, today=None):
+        today = today or date.today()
+        self._refresh()
+        budgets, version = self.store.versioned(BUDGETS_PATH)
+        current = today.year * 12 + today.month - 1
+        with self._lock:
+            key = (version, current)
+            if self._result_key != key:
+                self._results.clear()
+                self._result_key = key
+            for budget in budgets:
+                if budget["name"] not in self._results:
+                    self._results[budget["name"]] = self._forecast(budget, current)
+            return dict(self._results)
+
+forecaster = BurnForecaster(datastore.store, rollups.rollups)
@@ -0,0 +1,197 @@
+import csv
+import io
+import re
+from datetime import date, datetime
+
+import datastore
+from ledger import Ledger, day_string
+
+# 批次匯入：把會計系統匯出的 CSV / XLSX 轉成支出或規劃紀錄。
+# 檔案逐列讀取並驗證（計畫須存在於 budgets.json、分類須在 CATEGORIES 中、金額與日期可解析），
+# 以 (計畫, 分類, 金額, 日期, 備註) 比對既有紀錄與檔案內較早的列找出重複，
+# 預覽後以 datastore.batch 一次寫入，不論幾列都只寫檔一次、重新整理一次。
+# XLSX 需要 openpyxl（pip install openpyxl），只在匯入 Excel 檔時才匯入。
+
+# 欄位名稱 -> 可接受的表頭（不分大小寫，前後空白忽略）
+HEADERS = {
+    "project": ("project", "計畫", "計畫名稱"),
+    "category": ("category", "分類", "經費類別", "科目"),
+    "amount": ("amount", "金額", "支出金額"),
+    "note": ("note", "備註", "摘要", "說明"),
+    "date": ("date", "日期", "支出日期", "預計日期"),
+}
+REQUIRED = ("project", "category", "amount", "date")
+# 表頭之前允許的標題 / 說明列數
+HEADER_SCAN = 20
+
+OK, DUPLICATE, ERROR = "ok", "duplicate", "error"
+
+_ALIASES = {alias.lower(): field for field, aliases in HEADERS.items() for alias in aliases}
+_DATE_PARTS = re.compile(r"^(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})$")
+
+class ImportFormatError(ValueError):
+    pass
+
+def _cell(value):
+    return value.strip() if isinstance(value, str) else value
+
+def _csv_rows(data):
+    # 先試 UTF-8（含 Excel 另存的 BOM），失敗再以 Big5（cp950）解碼
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("cp950")
+    yield from csv.reader(io.StringIO(text, newline=""))
+
+def _xlsx_rows(data):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFormatError("匯入 Excel 檔需要 openpyxl（pip install openpyxl），或改存成 CSV")
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+# 逐列產生 (列號, {欄位: 值})；第一個含有所有必要欄位的列為表頭（之前的標題列略過），
+# 列號與試算表上看到的一致
+def read_rows(data, filename):
+    name = filename.lower()
+    if name.endswith(".csv"):
+        rows = _csv_rows(data)
+    elif name.endswith((".xlsx", ".xlsm")):
+        rows = _xlsx_rows(data)
+    else:
+        raise ImportFormatError("只支援 .csv 與 .xlsx 檔")
+    columns = None
+    for line, row in enumerate(rows, start=1):
+        row = [_cell(v) for v in row]
+        if not any(v not in (None, "") for v in row):
+            continue
+        if columns is None:
+            found = [_ALIASES.get(str(v).lower()) if v is not None else None for v in row]
+            if all(f in found for f in REQUIRED):
+                columns = found
+            elif line >= HEADER_SCAN:
+                break
+            continue
+        yield line, {f: v for f, v in zip(columns, row) if f is not None}
+    if columns is None:
+        names = "、".join(f"「{HEADERS[f][1]}」" for f in REQUIRED)
+        raise ImportFormatError(f"找不到表頭：需有 {names} 欄")
+
+def parse_amount(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value.replace(",", "").replace("$", "").replace("NT", "").strip())
+    except ValueError:
+        return None
+
+# 接受 YYYY-MM-DD、YYYY/M/D、YYYY.MM.DD 與民國年（113/05/01），以及 Excel 的日期儲存格
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if not isinstance(value, str):
+        return None
+    match = _DATE_PARTS.match(value.split(" ")[0])
+    if not match:
+        return None
+    year, month, day = (int(p) for p in match.groups())
+    if year < 1000:
+        year += 1911
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+def record_key(record):
+    return (record["project"], record["category"], float(record["amount"]), record["date"], record["note"])
+
+# 既有紀錄的重複比對鍵；欄式帳本直接讀欄位，不必逐筆展開 dict
+def existing_keys(records):
+    if isinstance(records, Ledger) and not records.has_raw():
+        projects, categories = records.projects, records.categories
+        return {(projects[p], categories[c], amount, day_string(day), note)
+                for p, c, amount, day, note in zip(records.project, records.category, records.amount,
+                                                   records.day, records.note)}
+    keys = set()
+    for r in records:
+        try:
+            keys.add((r.get("project"), r.get("category"), float(r.get("amount")), r.get("date"), r.get("note", "")))
+        except (TypeError, ValueError):
+            continue
+    return keys
+
+def _normalize(values, projects, categories):
+    project = values.get("project")
+    if project in (None, ""):
+        return None, "計畫不可為空"
+    if str(project) not in projects:
+        return None, f"計畫「{project}」不存在"
+    category = values.get("category")
+    if category not in categories:
+        return None, f"分類「{category}」不存在"
+    amount = parse_amount(values.get("amount"))
+    if amount is None:
+        return None, f"金額「{values.get('amount')}」無法解析"
+    if amount < 0:
+        return None, "金額不可為負數"
+    day = parse_date(values.get("date"))
+    if day is None:
+        return None, f"日期「{values.get('date')}」格式錯誤"
+    note = values.get("note")
+    return {
+        "project": str(project),
+        "category": category,
+        "amount": amount,
+        "note": "" if note is None else str(note),
+        "date": day,
+    }, None
+
+# 回傳每一列的 {"line", "status", "record", "message"}；status 為 OK / DUPLICATE / ERROR
+def validate(rows, projects, categories, existing=()):
+    projects, categories = set(projects), set(categories)
+    existing = set(existing)
+    seen = {}
+    result = []
+    for line, values in rows:
+        record, error = _normalize(values, projects, categories)
+        if error:
+            result.append({"line": line, "status": ERROR, "record": None, "message": error})
+            continue
+        key = record_key(record)
+        if key in existing:
+            status, message = DUPLICATE, "與既有紀錄重複"
+        elif key in seen:
+            status, message = DUPLICATE, f"與第 {seen[key]} 列重複"
+        else:
+            status, message = OK, ""
+            seen[key] = line
+        result.append({"line": line, "status": status, "record": record, "message": message})
+    return result
+
+def parse(data, filename, path, projects, categories):
+    return validate(read_rows(data, filename), projects, categories, existing_keys(datastore.snapshot(path)))
+
+# 一次寫入；在該檔的鎖內重新比對既有紀錄，預覽之後才被別人新增的相同紀錄也會略過。
+# 回傳 (新增筆數, 略過筆數)
+def commit(path, rows, include_duplicates=False):
+    wanted = [r["record"] for r in rows
+              if r["status"] == OK or (include_duplicates and r["status"] == DUPLICATE)]
+    with datastore.transaction(path):
+        skipped = 0
+        if not include_duplicates:
+            existing = existing_keys(datastore.snapshot(path))
+            fresh = [r for r in wanted if record_key(r) not in existing]
+            skipped = len(wanted) - len(fresh)
+            wanted = fresh
+        datastore.batch(path, [("append", None, r) for r in wanted])
+    return len(wanted), skipped
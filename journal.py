@@ -0,0 +1,207 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import metrics
+
+# 只增不減的帳本（login_log、student_cash_log、lab_cash）改以 JSON-Lines 日誌記錄異動：
+#   X.json   最近一次壓縮後的完整內容
+#   X.jsonl  之後的異動，一行一筆；一般紀錄即代表新增，
+#            修改 / 刪除則以 {"_op": "update" | "delete", "index": i, ...} 表示
+# 新增只需在日誌尾端寫一行（O(1)），fsync 以批次進行；
+# 日誌超過 compact_every 行時由後端整份寫回 X.json 並清空日誌。
+
+JOURNALED_FILES = ("login_log.json", "student_cash_log.json", "lab_cash.json")
+
+def journal_path(path):
+    return os.path.splitext(path)[0] + ".jsonl"
+
+class Journal:
+    def __init__(self, path, fsync_every=16, fsync_interval=1.0, compact_every=1000):
+        self.base = path
+        self.path = journal_path(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.lines = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    # 依序把日誌中的異動套用到 data 上
+    def replay(self, data):
+        count = 0
+        if not self.exists():
+            self.lines = 0
+            return data
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        metrics.count(self.base, "bytes_read", sum(len(line) for line in lines))
+        offset = 0
+        for n, raw in enumerate(lines):
+            start = offset
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # 最後一行可能因當機只寫了一半：截掉這段殘行，避免下一筆接在它後面；
+                # 中間的壞行則是真的損毀
+                if n == len(lines) - 1:
+                    with open(self.path, "r+b") as f:
+                        f.truncate(start)
+                    break
+                raise
+            count += 1
+            op = entry.get("_op") if isinstance(entry, dict) else None
+            if op == "update":
+                data[entry["index"]] = entry["record"]
+            elif op == "delete":
+                del data[entry["index"]]
+            else:
+                data.append(entry)
+        self.lines = count
+        return data
+
+    # 日誌中的所有項目（不套用）；尾端寫到一半的殘行略過，留給 replay 截掉
+    def entries(self):
+        if not self.exists():
+            return []
+        entries = []
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        metrics.count(self.base, "bytes_read", sum(len(line) for line in lines))
+        for n, raw in enumerate(lines):
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                if n == len(lines) - 1:
+                    break
+                raise
+        return entries
+
+    def _write_line(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        metrics.count(self.base, "bytes_written", len(line.encode("utf-8")))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            self._unsynced += 1
+            now = time.monotonic()
+            # 批次 fsync：累積一定筆數或超過時間間隔才強制落盤
+            if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+                self._last_sync = now
+        self.lines += 1
+
+    def append(self, record):
+        self._write_line(record)
+
+    def update(self, index, record):
+        self._write_line({"_op": "update", "index": index, "record": record})
+
+    def delete(self, index):
+        self._write_line({"_op": "delete", "index": index})
+
+    def needs_compaction(self):
+        return self.lines >= self.compact_every
+
+    # 壓縮開始：日誌改名為 .old，之後的新增會寫到新的日誌
+    def retire(self):
+        if os.path.exists(self.path):
+            os.replace(self.path, self.path + ".old")
+        self.lines = 0
+        self._unsynced = 0
+
+    # 壓縮完成：正式檔已包含 .old 的內容
+    def discard_retired(self):
+        try:
+            os.remove(self.path + ".old")
+        except FileNotFoundError:
+            pass
+
+    # 復原中斷的壓縮：暫存檔還在代表正式檔尚未被取代，把 .old 接回日誌；否則只需刪除 .old
+    def recover(self, base_path):
+        retired = self.path + ".old"
+        if not os.path.exists(retired):
+            return
+        tmp = base_path + ".tmp"
+        if os.path.exists(tmp):
+            if os.path.exists(self.path):
+                with open(retired, "ab") as dst, open(self.path, "rb") as src:
+                    dst.write(src.read())
+            os.replace(retired, self.path)
+            os.remove(tmp)
+        else:
+            os.remove(retired)
+
+    # 從檔尾往回讀最後 n 筆；日誌筆數不足或尾端含修改 / 刪除時回傳 None，由呼叫端改讀完整內容
+    def tail(self, n=1):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            while pos > 0 and buf.count(b"\n") <= n:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = [l for l in buf.split(b"\n") if l.strip()]
+        if pos > 0:
+            lines = lines[1:]
+        records = []
+        for line in lines[-n:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                return None
+            if isinstance(entry, dict) and "_op" in entry:
+                return None
+            records.append(entry)
+        if len(records) < n:
+            return None
+        return records
+
+# 輪替：帳本超過 2 * keep 筆時，把較舊的紀錄移到 archive_dir 下的封存檔，只保留最後 keep 筆。
+# 只適用於像 login_log 這種舊資料不影響餘額計算的紀錄。
+# 讀取、封存與寫回都在該檔的鎖內完成，期間其他人新增的紀錄不會遺失；
+# 封存檔先寫到暫存檔並 fsync，再以 os.replace 換上，中斷時不會留下寫到一半的封存檔。
+def rotate(store, path, keep, archive_dir="data/archive"):
+    with store.transaction(path):
+        data = store.snapshot(path)
+        if len(data) < 2 * keep:
+            return None
+        os.makedirs(archive_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        base = os.path.join(archive_dir, f"{stem}-{datetime.now().strftime('%Y%m%d%H%M%S')}")
+        archive, n = base + ".json", 1
+        while os.path.exists(archive):
+            archive, n = f"{base}-{n}.json", n + 1
+        tmp = archive + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data[:-keep], f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, archive)
+        store.save(path, data[-keep:])
+    return archive
@@ -0,0 +1,277 @@
+import copy
+import os
+from array import array
+from collections.abc import MutableSequence, Sequence
+from datetime import date
+
+from constants import CATEGORIES
+
+# 欄式帳本
+# 支出與規劃在記憶體中以欄位儲存，不再是一筆一個 dict：
+#   project / category   int32 代碼，名稱只在 projects / categories 字典中各存一次
+#   amount               array('d')
+#   day                  array('i')，date.toordinal()
+#   note                 字串串列
+#   ids                  紀錄 ID（datastore 指派，放在紀錄的第一個鍵；沒有 ID 的舊紀錄為 None）
+# 對外仍是串列介面（len、索引、切片、迭代、append / insert / pop / del），
+# 取出的每一筆都是新建立的 dict，與原本的紀錄內容完全相同；
+# 修改取出的 dict 不會改變帳本，須以 ledger[i] = record 寫回。
+# 欄位順序不同、型別不符（如金額為整數）或日期不是 YYYY-MM-DD 的紀錄整筆原樣保存，
+# 五個欄位以外的鍵則另存於 extra，寫回檔案時內容不會改變。
+
+FIELDS = ("project", "category", "amount", "note", "date")
+COLUMNAR_FILES = ("expenses.json", "plans.json")
+
+_DAYS = {}
+
+def day_string(ordinal):
+    text = _DAYS.get(ordinal)
+    if text is None:
+        text = _DAYS[ordinal] = date.fromordinal(ordinal).isoformat()
+    return text
+
+def parse_day(text):
+    if type(text) is not str or len(text) != 10 or text[4] != "-" or text[7] != "-":
+        return None
+    try:
+        return date.fromisoformat(text).toordinal()
+    except ValueError:
+        return None
+
+# 原樣保存的紀錄
+class _Raw:
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+class Ledger(MutableSequence):
+    def __init__(self, records=(), categories=CATEGORIES):
+        self.projects = []
+        self.categories = []
+        self._project_codes = {}
+        self._category_codes = {}
+        for name in categories:
+            self._code(self.categories, self._category_codes, name)
+        self.project = array("i")
+        self.category = array("i")
+        self.amount = array("d")
+        self.day = array("i")
+        self.note = []
+        self.extra = []
+        self.ids = []
+        self._raw = 0
+        self.extend(records)
+
+    def _code(self, names, codes, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    # 回傳 (project, category, amount, day, note, extra, id)；無法編碼的紀錄以 _Raw 放在 extra。
+    # 不論是否能編碼，id 欄都記錄該筆的 ID，datastore 的 ID 索引只需走訪這一欄
+    def _encode(self, record):
+        rid = record.get("id") if type(record) is dict else None
+        if type(record) is dict and len(record) >= 5:
+            keys = list(record)
+            start = 1 if keys[0] == "id" and type(rid) is str else 0
+            project, category, amount, note, day = (record.get(f) for f in FIELDS)
+            ordinal = parse_day(day)
+            if (tuple(keys[start:start + 5]) == FIELDS and type(project) is str and type(category) is str
+                    and type(amount) is float and type(note) is str and ordinal is not None):
+                extra = None
+                if len(keys) > start + 5:
+                    extra = {k: copy.deepcopy(record[k]) for k in keys[start + 5:]}
+                return (self._code(self.projects, self._project_codes, project),
+                        self._code(self.categories, self._category_codes, category),
+                        amount, ordinal, note, extra, rid)
+        return (-1, -1, 0.0, -1, "", _Raw(copy.deepcopy(record)), rid)
+
+    def _decode(self, i):
+        extra = self.extra[i]
+        if type(extra) is _Raw:
+            return copy.deepcopy(extra.record)
+        record = {}
+        rid = self.ids[i]
+        # ID 不在第一個鍵的紀錄，ID 仍留在 extra 中原本的位置
+        if rid is not None and not (extra and "id" in extra):
+            record["id"] = rid
+        record.update({
+            "project": self.projects[self.project[i]],
+            "category": self.categories[self.category[i]],
+            "amount": self.amount[i],
+            "note": self.note[i],
+            "date": day_string(self.day[i]),
+        })
+        if extra:
+            record.update(copy.deepcopy(extra))
+        return record
+
+    def __len__(self):
+        return len(self.amount)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ledger index out of range")
+        return self._decode(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    def __setitem__(self, index, record):
+        if isinstance(index, slice):
+            rows = self[:]
+            rows[index] = record
+            self._reset(rows)
+            return
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ledger assignment index out of range")
+        values = self._encode(record)
+        self._raw += (type(values[5]) is _Raw) - (type(self.extra[index]) is _Raw)
+        (self.project[index], self.category[index], self.amount[index],
+         self.day[index], self.note[index], self.extra[index], self.ids[index]) = values
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            rows = self[:]
+            del rows[index]
+            self._reset(rows)
+            return
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ledger assignment index out of range")
+        self._raw -= type(self.extra[index]) is _Raw
+        for column in self._columns():
+            del column[index]
+
+    def insert(self, index, record):
+        values = self._encode(record)
+        self._raw += type(values[5]) is _Raw
+        for column, value in zip(self._columns(), values):
+            column.insert(index, value)
+
+    def append(self, record):
+        values = self._encode(record)
+        self._raw += type(values[5]) is _Raw
+        for column, value in zip(self._columns(), values):
+            column.append(value)
+
+    def _columns(self):
+        return (self.project, self.category, self.amount, self.day, self.note, self.extra, self.ids)
+
+    def _reset(self, rows):
+        for column in self._columns():
+            del column[:]
+        self._raw = 0
+        self.extend(rows)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, Ledger)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Ledger({len(self)} 筆，{len(self.projects)} 個計畫)"
+
+    # 複製欄位與字典；原樣保存的紀錄深拷貝，修改副本不影響原本的帳本
+    def copy(self):
+        other = self.fork()
+        other.extra = [copy.deepcopy(e) if e else e for e in self.extra]
+        return other
+
+    # 淺複製：欄位各自複製，原樣保存的紀錄與 extra 共用（快取中的紀錄只會被整筆取代、不會被修改），
+    # 供 DataStore 寫入時複製使用
+    def fork(self):
+        other = Ledger.__new__(Ledger)
+        other.projects = list(self.projects)
+        other.categories = list(self.categories)
+        other._project_codes = dict(self._project_codes)
+        other._category_codes = dict(self._category_codes)
+        other.project = array("i", self.project)
+        other.category = array("i", self.category)
+        other.amount = array("d", self.amount)
+        other.day = array("i", self.day)
+        other.note = list(self.note)
+        other.extra = list(self.extra)
+        other.ids = list(self.ids)
+        other._raw = self._raw
+        return other
+
+    # 第 index 筆的日期（datetime.date），由載入時已換算的整數日取得，不解析字串；原樣保存的紀錄才解析
+    def date_at(self, index):
+        extra = self.extra[index]
+        ordinal = parse_day(extra.record.get("date")) if type(extra) is _Raw else self.day[index]
+        return date.fromordinal(ordinal) if ordinal is not None else None
+
+    def has_raw(self):
+        return self._raw > 0
+
+    # 依計畫 / 分類 / 日期區間（含端點，YYYY-MM-DD）篩選，只比對代碼與整數日期，回傳符合的索引
+    def select(self, project=None, category=None, start=None, end=None):
+        if self.has_raw():
+            return [i for i, r in enumerate(self) if _matches(r, project, category, start, end)]
+        p = self._project_codes.get(project, -2) if project else None
+        c = self._category_codes.get(category, -2) if category else None
+        lo = parse_day(start) if start else None
+        hi = parse_day(end) if end else None
+        # 每個條件各用一次 list comprehension 縮小候選範圍
+        if p is not None:
+            result = [i for i, v in enumerate(self.project) if v == p]
+        else:
+            result = range(len(self))
+        if c is not None:
+            category = self.category
+            result = [i for i in result if category[i] == c]
+        if lo is not None or hi is not None:
+            day = self.day
+            lo = lo if lo is not None else 0
+            hi = hi if hi is not None else 2 ** 31 - 1
+            result = [i for i in result if lo <= day[i] <= hi]
+        return list(result)
+
+# select 結果的延遲視圖：元素為 (索引, 紀錄)，只有實際取用（例如分頁後的這一頁）才展開紀錄
+class Rows(Sequence):
+    def __init__(self, ledger, indices):
+        self.ledger = ledger
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(i, self.ledger[i]) for i in self.indices[index]]
+        i = self.indices[index]
+        return (i, self.ledger[i])
+
+def _matches(record, project, category, start, end):
+    if project and record.get("project") != project:
+        return False
+    if category and record.get("category") != category:
+        return False
+    d = record.get("date", "")
+    if start and d < start:
+        return False
+    if end and d > end:
+        return False
+    return True
+
+# 串列或欄式帳本中第 index 筆的日期；日期不合法時為 None
+def record_date(records, index):
+    if isinstance(records, Ledger):
+        return records.date_at(index)
+    ordinal = parse_day(records[index].get("date"))
+    return date.fromordinal(ordinal) if ordinal is not None else None
+
+def is_columnar(path):
+    return os.path.basename(path) in COLUMNAR_FILES
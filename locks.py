@@ -0,0 +1,69 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能做到同一行程內互斥
+    fcntl = None
+
+# 資料檔的建議鎖（advisory lock）
+# 每個資料檔對應同目錄下的 .<檔名>.lock；同一行程內以 RLock 互斥且可重入，
+# 跨行程（多個 Streamlit 伺服器 / 腳本）則以 flock 互斥。
+# 多個檔案一起上鎖時一律依路徑排序，避免互相等待造成死結。
+
+def lock_path(path):
+    path = os.path.normpath(path)
+    return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".lock")
+
+class PathLock:
+    def __init__(self, path):
+        self.path = lock_path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except Exception:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get_lock(path):
+    key = os.path.normpath(path)
+    with _registry_lock:
+        lock = _registry.get(key)
+        if lock is None:
+            lock = _registry[key] = PathLock(key)
+        return lock
+
+@contextmanager
+def locked(*paths):
+    held = []
+    try:
+        for key in sorted({os.path.normpath(p) for p in paths}):
+            lock = get_lock(key)
+            lock.acquire()
+            held.append(lock)
+        yield
+    finally:
+        for lock in reversed(held):
+            lock.release()
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# 效能量測
+# 每次 rerun 記錄各畫面的耗時與元件數，以及每個檔案的 load / save 呼叫次數與實際讀寫的位元組數。
+# 進行中的 rerun 存在執行緒區域變數中（Streamlit 每次 rerun 都在自己的執行緒執行），
+# 後端在同一個執行緒內回報的讀寫量就算在這次 rerun 上；另外累計整個行程的總量。
+# 最近 HISTORY 次 rerun 留在記憶體中給管理面板顯示，也可寫成 JSON Lines 供離線分析；
+# 設定環境變數 LAB_BUDGET_METRICS=<路徑> 時，每次 rerun 結束就自動附加一行。
+# 本模組不依賴 Streamlit，後端與日誌也可直接回報讀寫量。
+
+METRICS_PATH = "data/metrics.jsonl"
+HISTORY = 200
+COUNTERS = ("loads", "saves", "bytes_read", "bytes_written")
+
+def _new_io():
+    return dict.fromkeys(COUNTERS, 0)
+
+class Recorder:
+    def __init__(self, history=HISTORY, path=None):
+        self.runs = deque(maxlen=history)
+        self.totals = {}
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin_run(self, session=None):
+        self._local.run = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "session": session,
+            "seconds": 0.0,
+            "widgets": 0,
+            "views": {},
+            "io": {},
+        }
+        self._local.started = time.perf_counter()
+
+    def current(self):
+        return getattr(self._local, "run", None)
+
+    def end_run(self, widgets=0):
+        run = self.current()
+        if run is None:
+            return None
+        self._local.run = None
+        run["seconds"] = time.perf_counter() - self._local.started
+        run["widgets"] = widgets
+        with self._lock:
+            self.runs.append(run)
+        if self.path:
+            self.dump([run], self.path)
+        return run
+
+    # 量測一個畫面：耗時與期間新增的元件數；widgets 為回傳本次 rerun 目前元件數的函式
+    @contextmanager
+    def view(self, name, widgets=None):
+        start = time.perf_counter()
+        before = widgets() if widgets else 0
+        try:
+            yield
+        finally:
+            run = self.current()
+            if run is not None:
+                view = run["views"].setdefault(name, {"seconds": 0.0, "widgets": 0})
+                view["seconds"] += time.perf_counter() - start
+                view["widgets"] += (widgets() if widgets else 0) - before
+
+    def count(self, path, field, amount=1):
+        key = os.path.normpath(path)
+        with self._lock:
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = _new_io()
+            totals[field] += amount
+        run = self.current()
+        if run is not None:
+            counters = run["io"].get(key)
+            if counters is None:
+                counters = run["io"][key] = _new_io()
+            counters[field] += amount
+
+    def recent(self):
+        with self._lock:
+            return list(self.runs)
+
+    # 各畫面在最近幾次 rerun 的耗時統計（毫秒），依平均耗時由大到小排列
+    def view_summary(self):
+        samples = {}
+        for run in self.recent():
+            for name, view in run["views"].items():
+                samples.setdefault(name, []).append(view)
+        rows = []
+        for name, views in samples.items():
+            ms = sorted(v["seconds"] * 1000 for v in views)
+            rows.append({
+                "view": name,
+                "runs": len(ms),
+                "mean_ms": sum(ms) / len(ms),
+                "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+                "max_ms": ms[-1],
+                "last_ms": views[-1]["seconds"] * 1000,
+                "widgets": views[-1]["widgets"],
+            })
+        rows.sort(key=lambda r: r["mean_ms"], reverse=True)
+        return rows
+
+    def io_summary(self):
+        with self._lock:
+            return [{"file": key, **counters} for key, counters in sorted(self.totals.items())]
+
+    # 以 JSON Lines 附加寫入，回傳寫入的筆數
+    def dump(self, runs=None, path=METRICS_PATH):
+        runs = self.recent() if runs is None else runs
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for run in runs:
+                f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        return len(runs)
+
+    def reset(self):
+        with self._lock:
+            self.runs.clear()
+            self.totals.clear()
+
+# 行程層級的預設實例，與 datastore.store 一樣跨 rerun 保留
+recorder = Recorder(path=os.environ.get("LAB_BUDGET_METRICS") or None)
+
+def count(path, field, amount=1):
+    recorder.count(path, field, amount)
+
+def view(name, widgets=None):
+    return recorder.view(name, widgets)
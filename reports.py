@@ -0,0 +1,136 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import datastore
+from constants import BUDGETS_PATH, CATEGORIES, EXPENSES_PATH, PLANS_PATH
+from ledger import Ledger
+
+# 向量化報表引擎
+# 支出 / 規劃 / 預算轉成型別固定的 DataFrame：計畫與分類為 categorical（整數代碼），
+# 金額為 float64，日期為 datetime64；所有統計都以 groupby 一次算完，不逐筆迴圈。
+
+# 0001-01-01 的 ordinal 為 1；datetime64[D] 以 1970-01-01 為 0
+EPOCH_ORDINAL = 719163
+
+# 欄式帳本的代碼對應到報表的 categories 順序（帳本字典中沒有的名稱為 -1，即 NaN）
+def _recode(codes, names, categories):
+    index = {name: i for i, name in enumerate(categories)}
+    lookup = np.array([index.get(name, -1) for name in names] + [-1], dtype=np.int32)
+    return lookup[np.array(codes, dtype=np.int32)]
+
+# categorical 的 categories 不可重複；同名的計畫（例如兩個空白名稱）合併成一個
+def unique_names(names):
+    return list(dict.fromkeys(names))
+
+def ledger_frame(records, projects, categories=CATEGORIES):
+    projects = unique_names(projects)
+    # 欄式帳本不必逐筆展開 dict，直接由欄位建立
+    if isinstance(records, Ledger) and not records.has_raw():
+        return pd.DataFrame({
+            "project": pd.Categorical.from_codes(_recode(records.project, records.projects, projects),
+                                                 categories=projects),
+            "category": pd.Categorical.from_codes(_recode(records.category, records.categories, categories),
+                                                  categories=categories),
+            "amount": np.array(records.amount, dtype="float64"),
+            "date": (np.array(records.day, dtype="int64") - EPOCH_ORDINAL).astype("datetime64[D]")
+                    .astype("datetime64[ns]"),
+        })
+    frame = pd.DataFrame.from_records(records, columns=["project", "category", "amount", "date"])
+    return typed_frame(frame["project"], frame["category"], frame["amount"], frame["date"], projects, categories)
+
+# 由欄位直接建立；benchmark 以 NumPy 陣列產生大量資料時也走這裡
+def typed_frame(project, category, amount, date, projects, categories=CATEGORIES):
+    return pd.DataFrame({
+        "project": pd.Categorical(project, categories=unique_names(projects)),
+        "category": pd.Categorical(category, categories=categories),
+        "amount": pd.to_numeric(amount, errors="coerce").astype("float64"),
+        "date": pd.to_datetime(date, format="%Y-%m-%d", errors="coerce"),
+    })
+
+# 同名計畫的預算依名稱加總，與支出 / 規劃以名稱對應的方式一致
+def budget_frame(budgets, categories=CATEGORIES):
+    allocated = {}
+    for b in budgets:
+        for cat in categories:
+            key = (b["name"], cat)
+            allocated[key] = allocated.get(key, 0.0) + float(b.get("categories", {}).get(cat, 0.0))
+    rows = [(name, cat, amount) for (name, cat), amount in allocated.items()]
+    frame = pd.DataFrame(rows, columns=["project", "category", "allocated"])
+    frame["project"] = pd.Categorical(frame["project"], categories=unique_names(b["name"] for b in budgets))
+    frame["category"] = pd.Categorical(frame["category"], categories=categories)
+    return frame
+
+def _sum_by(frame, keys, name):
+    return frame.groupby(keys, observed=False)["amount"].sum().rename(name)
+
+# 各計畫 / 分類的預算、已花、預計與執行率
+def execution_rates(expenses, plans, budgets):
+    keys = ["project", "category"]
+    table = budgets.set_index(keys)["allocated"].to_frame()
+    table = table.join(_sum_by(expenses, keys, "spent")).join(_sum_by(plans, keys, "planned"))
+    table = table.fillna(0.0)
+    allocated = table["allocated"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        table["spent_rate"] = np.where(allocated > 0, table["spent"].to_numpy() / allocated, 0.0)
+        table["planned_rate"] = np.where(allocated > 0, table["planned"].to_numpy() / allocated, 0.0)
+    table["total_rate"] = table["spent_rate"] + table["planned_rate"]
+    return table.reset_index()
+
+def project_rates(expenses, plans, budgets):
+    table = execution_rates(expenses, plans, budgets)
+    totals = table.groupby("project", observed=False)[["allocated", "spent", "planned"]].sum()
+    allocated = totals["allocated"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        totals["spent_rate"] = np.where(allocated > 0, totals["spent"].to_numpy() / allocated, 0.0)
+        totals["planned_rate"] = np.where(allocated > 0, totals["planned"].to_numpy() / allocated, 0.0)
+    totals["remaining"] = totals["allocated"] - totals["spent"] - totals["planned"]
+    return totals.reset_index()
+
+# 各計畫每月支出（列為計畫、欄為月份）
+def monthly_burn(expenses):
+    month = expenses["date"].dt.to_period("M")
+    burn = expenses.groupby([expenses["project"], month], observed=True)["amount"].sum()
+    return burn.unstack(fill_value=0.0).sort_index(axis=1)
+
+# 各分類剩餘額度 = 預算 - 已花 - 預計（列為計畫、欄為 CATEGORIES）
+def remaining_by_category(expenses, plans, budgets):
+    table = execution_rates(expenses, plans, budgets)
+    table["remaining"] = table["allocated"] - table["spent"] - table["planned"]
+    return table.pivot(index="project", columns="category", values="remaining")
+
+# 依三個檔案的版本號快取 DataFrame，資料未變動時不重建
+class ReportCache:
+    def __init__(self, store):
+        self.store = store
+        self._key = None
+        self._frames = None
+        self._lock = threading.Lock()
+
+    def frames(self):
+        expenses, ev = self.store.versioned(EXPENSES_PATH)
+        plans, pv = self.store.versioned(PLANS_PATH)
+        budgets, bv = self.store.versioned(BUDGETS_PATH)
+        key = (ev, pv, bv)
+        with self._lock:
+            if self._key != key:
+                projects = [b["name"] for b in budgets]
+                self._frames = (ledger_frame(expenses, projects), ledger_frame(plans, projects),
+                                budget_frame(budgets))
+                self._key = key
+            return self._frames
+
+cache = ReportCache(datastore.store)
+
+def current_execution_rates():
+    return execution_rates(*cache.frames())
+
+def current_project_rates():
+    return project_rates(*cache.frames())
+
+def current_monthly_burn():
+    return monthly_burn(cache.frames()[0])
+
+def current_remaining_by_category():
+    return remaining_by_category(*cache.frames())
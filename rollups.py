@@ -0,0 +1,131 @@
+import datastore
+from constants import EXPENSES_PATH, PLANS_PATH
+from ledger import Ledger, day_string
+
+# 月份彙總
+# 支出與規劃依 (計畫, 分類, 月份) 預先加總，另外保留 (計畫, 全部分類)、(全部計畫, 分類) 與總計，
+# 查詢「某計畫在兩個月份之間的支出」只需走訪區間內的月份桶，不必重新掃描紀錄或解析日期。
+# 月份以 year * 12 + (month - 1) 的整數表示，直接從 YYYY-MM-DD 字串切出，不呼叫 strptime；
+# 季則為 month // 3。
+
+def month_index(day):
+    try:
+        return int(day[:4]) * 12 + int(day[5:7]) - 1
+    except (TypeError, ValueError):
+        return None
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def quarter_label(quarter):
+    return f"{quarter // 4:04d} Q{quarter % 4 + 1}"
+
+# 月份參數可為整數或 YYYY-MM / YYYY-MM-DD 字串
+def _month(value):
+    if value is None or isinstance(value, int):
+        return value
+    return month_index(value)
+
+class Rollups(datastore.DerivedIndex):
+    def __init__(self, store, paths=(EXPENSES_PATH, PLANS_PATH)):
+        self._buckets = {store.key(path): {} for path in paths}
+        super().__init__(store, paths)
+
+    # (計畫或 None, 分類或 None) -> {月份: 金額}；None 表示不分
+    def _apply(self, key, record, sign):
+        month = month_index(record.get("date"))
+        if month is None:
+            return
+        amount = float(record["amount"]) * sign
+        buckets = self._buckets[key]
+        project, category = record.get("project"), record.get("category")
+        for bucket in ((project, category), (project, None), (None, category), (None, None)):
+            months = buckets.get(bucket)
+            if months is None:
+                months = buckets[bucket] = {}
+            months[month] = months.get(month, 0.0) + amount
+
+    # 整份重建：先依 (計畫, 分類, 月份) 加總，再展開到較粗的三層，每筆紀錄只處理一次；
+    # 欄式帳本直接讀代碼與整數日期，不必逐筆展開 dict
+    def _rebuild(self, key, rows):
+        fine = {}
+        if isinstance(rows, Ledger) and not rows.has_raw():
+            months = {}
+            for p, c, amount, day in zip(rows.project, rows.category, rows.amount, rows.day):
+                month = months.get(day)
+                if month is None:
+                    month = months[day] = month_index(day_string(day))
+                bucket = (p, c, month)
+                fine[bucket] = fine.get(bucket, 0.0) + amount
+            fine = {(rows.projects[p], rows.categories[c], m): v for (p, c, m), v in fine.items()}
+        else:
+            for r in rows:
+                month = month_index(r.get("date"))
+                if month is None:
+                    continue
+                bucket = (r.get("project"), r.get("category"), month)
+                fine[bucket] = fine.get(bucket, 0.0) + float(r["amount"])
+        buckets = self._buckets[key] = {}
+        for (project, category, month), amount in fine.items():
+            for bucket in ((project, category), (project, None), (None, category), (None, None)):
+                months = buckets.get(bucket)
+                if months is None:
+                    months = buckets[bucket] = {}
+                months[month] = months.get(month, 0.0) + amount
+
+    def _update(self, key, op, index, old, new):
+        if old is not None:
+            self._apply(key, old, -1)
+        if new is not None:
+            self._apply(key, new, 1)
+
+    # 呼叫端須持有 self._lock
+    def _months(self, path, project, category):
+        return self._buckets[self.store.key(path)].get((project, category), {})
+
+    # 每月金額 {月份: 金額} 的副本；呼叫端剛 refresh 過時可傳 refresh=False 省去檢查版本
+    def series(self, path=EXPENSES_PATH, project=None, category=None, refresh=True):
+        if refresh:
+            self.refresh()
+        with self._lock:
+            return dict(self._months(path, project, category))
+
+    # start / end（含）之間的總額；只走訪區間內的月份與實際有資料的月份中較少的一邊
+    def total(self, path=EXPENSES_PATH, project=None, category=None, start=None, end=None):
+        start, end = _month(start), _month(end)
+        self.refresh()
+        with self._lock:
+            months = self._months(path, project, category)
+            if start is None or end is None or len(months) < end - start + 1:
+                return sum(v for m, v in months.items()
+                           if (start is None or m >= start) and (end is None or m <= end))
+            return sum(months.get(m, 0.0) for m in range(start, end + 1))
+
+    # [(月份標籤, 金額)]，區間內沒有資料的月份為 0
+    def monthly(self, start, end, path=EXPENSES_PATH, project=None, category=None):
+        start, end = _month(start), _month(end)
+        self.refresh()
+        with self._lock:
+            months = self._months(path, project, category)
+            return [(month_label(m), months.get(m, 0.0)) for m in range(start, end + 1)]
+
+    def quarterly(self, start, end, path=EXPENSES_PATH, project=None, category=None):
+        start, end = _month(start), _month(end)
+        self.refresh()
+        with self._lock:
+            months = self._months(path, project, category)
+            quarters = {}
+            for m in range(start, end + 1):
+                quarters[m // 3] = quarters.get(m // 3, 0.0) + months.get(m, 0.0)
+            return [(quarter_label(q), v) for q, v in quarters.items()]
+
+    # 支出與規劃中有資料的第一個與最後一個月份；都沒有資料時為 None
+    def bounds(self, project=None, category=None):
+        self.refresh()
+        with self._lock:
+            found = [m for path in self._paths.values() for m in self._months(path, project, category)]
+        if not found:
+            return None
+        return min(found), max(found)
+
+rollups = Rollups(datastore.store)
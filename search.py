@@ -0,0 +1,224 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from operator import itemgetter
+
+import datastore
+from backends import RecordNotFoundError
+from constants import EXPENSES_PATH, NOTES_PATH, PLANS_PATH, VENDORS_PATH
+
+# 全文與分面搜尋索引
+# 在記憶體中以倒排索引（詞 -> 文件集合）收錄筆記內容、支出 / 規劃的備註，以及廠商的名稱、統編、業務與備註。
+# 中文沒有空白分詞，連續的中日韓文字切成單字與相鄰兩字（bigram），英數字以整個字為一個詞；
+# 查詢以空白分隔多個關鍵字，每個關鍵字的詞都必須出現，再以原文比對排除詞序不符的結果。
+# 另以計畫、分類與來源建立分面集合，日期區間直接比較 YYYY-MM-DD 字串。
+# 新增、修改、刪除只調整該筆紀錄的詞，不必重新掃描其他紀錄。
+
+# 來源 -> (資料檔, 收錄的文字欄位)
+SOURCES = {
+    "notes": (NOTES_PATH, ("content",)),
+    "expenses": (EXPENSES_PATH, ("note",)),
+    "plans": (PLANS_PATH, ("note",)),
+    "vendors": (VENDORS_PATH, ("name", "vat", "representative", "note")),
+}
+SOURCE_LABELS = {"notes": "筆記", "expenses": "支出", "plans": "規劃", "vendors": "廠商"}
+FACETS = ("source", "project", "category", "month")
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_RUNS = re.compile(f"[{_CJK}]+|[0-9a-z]+")
+
+# 全形轉半形並轉小寫，索引與查詢使用相同的正規化
+def normalize(text):
+    return unicodedata.normalize("NFKC", str(text)).lower()
+
+# 已正規化文字的詞集合
+def tokens(text):
+    result = set()
+    for run in _RUNS.findall(text):
+        if run[0] <= "z":
+            result.add(run)
+            continue
+        result.update(run)
+        result.update(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+# 查詢只需相鄰兩字：兩字詞已涵蓋其中的每一個字
+def _query_tokens(term):
+    result = set()
+    for run in _RUNS.findall(term):
+        if run[0] <= "z" or len(run) == 1:
+            result.add(run)
+        else:
+            result.update(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+class _Doc:
+    __slots__ = ("source", "rid", "text", "date", "facets")
+
+    def __init__(self, source, rid, text, date, project, category):
+        self.source = source
+        self.rid = rid
+        self.text = text
+        self.date = date
+        # 依 FACETS 的順序
+        self.facets = (source, project, category, date[:7] or None)
+
+class SearchIndex(datastore.DerivedIndex):
+    def __init__(self, store, sources=SOURCES):
+        self.sources = sources
+        self._keys = {store.key(path): source for source, (path, _) in sources.items()}
+        self._docs = {}
+        self._doc_of = {}
+        self._next = 0
+        self._postings = {}
+        self._facets = {}
+        super().__init__(store, [path for path, _ in sources.values()])
+
+    def _make(self, source, record):
+        fields = self.sources[source][1]
+        text = normalize(" ".join(str(record.get(f) or "") for f in fields))
+        return _Doc(source, record.get("id"), text, str(record.get("date") or ""),
+                    record.get("project"), record.get("category"))
+
+    def _add(self, source, record):
+        if not isinstance(record, dict) or not record.get("id"):
+            return
+        doc = self._make(source, record)
+        self._remove(source, doc.rid)
+        n = self._next
+        self._next += 1
+        self._docs[n] = doc
+        self._doc_of[(source, doc.rid)] = n
+        for token in tokens(doc.text):
+            self._postings.setdefault(token, set()).add(n)
+        for name, value in zip(FACETS[:3], doc.facets):
+            if value is not None:
+                self._facets.setdefault((name, value), set()).add(n)
+
+    def _remove(self, source, rid):
+        n = self._doc_of.pop((source, rid), None)
+        if n is None:
+            return
+        doc = self._docs.pop(n)
+        for token in tokens(doc.text):
+            docs = self._postings.get(token)
+            if docs is not None:
+                docs.discard(n)
+                if not docs:
+                    del self._postings[token]
+        for key in zip(FACETS[:3], doc.facets):
+            docs = self._facets.get(key)
+            if docs is not None:
+                docs.discard(n)
+                if not docs:
+                    del self._facets[key]
+
+    def _rebuild(self, key, rows):
+        source = self._keys[key]
+        for n in list(self._facets.get(("source", source), ())):
+            self._remove(source, self._docs[n].rid)
+        for record in rows:
+            self._add(source, record)
+
+    def _update(self, key, op, index, old, new):
+        source = self._keys[key]
+        if old is not None:
+            self._remove(source, old.get("id"))
+        if new is not None:
+            self._add(source, new)
+
+    def _refresh(self, sources):
+        self.refresh([self.sources[source][0] for source in sources])
+
+    # 回傳 (各詞的文件集合, 需以原文比對的關鍵字)；有任何詞不在索引中時回傳 None
+    def _match(self, query):
+        sets, checks = [], []
+        for term in (normalize(t) for t in query.split()):
+            found = _query_tokens(term)
+            if not found:
+                continue
+            for token in found:
+                docs = self._postings.get(token)
+                if docs is None:
+                    return None
+                sets.append(docs)
+            # 關鍵字本身就是單一個詞時，索引命中即代表原文包含它
+            if found != {term}:
+                checks.append(term)
+        return sets, checks
+
+    # 從最小的集合開始取交集，再過濾來源、日期區間並以原文比對關鍵字；沒有任何條件時走訪全部文件
+    def _candidates(self, sets, checks, sources=None, start=None, end=None):
+        docs = self._docs
+        if sets:
+            sets.sort(key=len)
+            candidates = sets[0].intersection(*sets[1:])
+        else:
+            candidates = docs
+        if sources is None and not start and not end and not checks:
+            yield from candidates
+            return
+        for n in candidates:
+            doc = docs[n]
+            if sources is not None and doc.source not in sources:
+                continue
+            if start and doc.date < start:
+                continue
+            if end and doc.date > end:
+                continue
+            if checks and not all(term in doc.text for term in checks):
+                continue
+            yield n
+
+    # query 以空白分隔多個關鍵字（皆須出現）；sources / project / category 為 None 表示不限，
+    # start / end 為 YYYY-MM-DD 字串。回傳符合的總筆數、依日期由新到舊的前 limit 筆，以及各分面的筆數
+    def search(self, query="", sources=None, project=None, category=None, start=None, end=None, limit=50):
+        sources = list(sources or self.sources)
+        self._refresh(sources)
+        with self._lock:
+            match = self._match(query)
+            if match is None:
+                return {"total": 0, "hits": [], "facets": {name: {} for name in FACETS}}
+            sets, checks = match
+            # 只有一個來源時以該來源的集合縮小候選；多個來源逐筆比對，不必先合併集合
+            if len(sources) == 1:
+                sets.append(self._facets.get(("source", sources[0]), set()))
+            for name, value in (("project", project), ("category", category)):
+                if value is not None:
+                    sets.append(self._facets.get((name, value), set()))
+            docs = self._docs
+            wanted = None if len(sources) == len(self.sources) else set(sources)
+            matched = list(self._candidates(sets, checks, wanted, start, end))
+            values = [docs[n].facets for n in matched]
+            facets = {}
+            for i, name in enumerate(FACETS):
+                counts = Counter(map(itemgetter(i), values))
+                counts.pop(None, None)
+                facets[name] = dict(counts.most_common())
+            top = [docs[n] for n in heapq.nlargest(limit, matched, key=lambda n: (docs[n].date, n))]
+        hits = []
+        for doc in top:
+            try:
+                record = self.store.get(self.sources[doc.source][0], doc.rid)
+            except RecordNotFoundError:
+                continue
+            hits.append({"source": doc.source, "id": doc.rid, "record": record})
+        return {"total": len(matched), "hits": hits, "facets": facets}
+
+    # 只取符合關鍵字的紀錄 ID（不展開紀錄），供畫面以關鍵字縮小清單
+    def ids(self, query, source):
+        self._refresh([source])
+        with self._lock:
+            match = self._match(query)
+            if match is None:
+                return set()
+            sets, checks = match
+            sets.append(self._facets.get(("source", source), set()))
+            return {self._docs[n].rid for n in self._candidates(sets, checks)}
+
+    def stats(self):
+        with self._lock:
+            return {"docs": len(self._docs), "tokens": len(self._postings), "rebuilds": self.rebuilds}
+
+index = SearchIndex(datastore.store)
@@ -0,0 +1,144 @@
+import bisect
+from datetime import date
+
+import datastore
+from constants import BUDGETS_PATH
+from ledger import parse_day
+
+# 計畫期間索引
+# 每個計畫的開始 / 結束日在載入或寫入時解析一次，存成整數日（ordinal）與 datetime.date，
+# 並依結束日預先排序（沒有結束日或日期不合法的排在最後，同一天依原本的先後），畫面不必每次 rerun 重新解析。
+# 距結束還有幾個月與到期分組依「目前月份」計算，同一個月內只算一次；換月或預算異動後才重算。
+
+# 距結束月份數 0～WARN_MONTHS 時在總覽標示警告
+WARN_MONTHS = 2
+_NO_END = float("inf")
+
+def _month(ordinal):
+    if ordinal is None:
+        return None
+    d = date.fromordinal(ordinal)
+    return d.year * 12 + d.month - 1
+
+class Entry:
+    __slots__ = ("id", "record", "start", "end", "end_day", "end_month", "months_left", "seq")
+
+    def __init__(self, record, seq):
+        start = parse_day(record.get("start_date"))
+        end = parse_day(record.get("end_date"))
+        self.id = record.get("id")
+        self.record = record
+        self.start = date.fromordinal(start) if start is not None else None
+        self.end = date.fromordinal(end) if end is not None else None
+        self.end_day = end
+        self.end_month = _month(end)
+        self.months_left = None
+        self.seq = seq
+
+    @property
+    def name(self):
+        return self.record.get("name")
+
+    def sort_key(self):
+        return (self.end_day if self.end_day is not None else _NO_END, self.seq)
+
+    # 距結束 0～WARN_MONTHS 個月時回傳 ⚠️（越接近越多個）
+    @property
+    def warning(self):
+        if self.months_left is None or not 0 <= self.months_left <= WARN_MONTHS:
+            return ""
+        return " ⚠️" * (WARN_MONTHS + 1 - self.months_left)
+
+class BudgetTimeline(datastore.DerivedIndex):
+    def __init__(self, store, path=BUDGETS_PATH):
+        self._entries = []
+        self._keys = []
+        self._by_id = {}
+        self._seq = 0
+        self._current = None
+        self._groups = None
+        super().__init__(store, (path,))
+
+    def _insert(self, record, seq=None):
+        if seq is None:
+            seq = self._seq
+            self._seq += 1
+        entry = Entry(record, seq)
+        key = entry.sort_key()
+        i = bisect.bisect(self._keys, key)
+        self._keys.insert(i, key)
+        self._entries.insert(i, entry)
+        if entry.id is not None:
+            self._by_id[entry.id] = entry
+        return entry
+
+    def _remove(self, record):
+        entry = self._by_id.pop(record.get("id"), None)
+        if entry is None:
+            return None
+        i = bisect.bisect_left(self._keys, entry.sort_key())
+        del self._keys[i]
+        del self._entries[i]
+        return entry
+
+    def _rebuild(self, key, rows):
+        entries = [Entry(r, seq) for seq, r in enumerate(rows)]
+        entries.sort(key=Entry.sort_key)
+        self._entries = entries
+        self._keys = [e.sort_key() for e in entries]
+        self._by_id = {e.id: e for e in entries if e.id is not None}
+        self._seq = len(entries)
+        self._current = None
+
+    def _update(self, key, op, index, old, new):
+        seq = None
+        if old is not None:
+            removed = self._remove(old)
+            # 修改時保留原本的先後，結束日相同的計畫不會換位置
+            if removed is not None and new is not None:
+                seq = removed.seq
+        if new is not None:
+            self._insert(new, seq)
+        self._current = None
+
+    # 各計畫距結束的月份數與到期分組，同一個月內只算一次
+    def _refresh(self, today):
+        self.refresh()
+        current = today.year * 12 + today.month - 1
+        with self._lock:
+            if self._current != current:
+                groups = {"expired": [], "later": [], "undated": []}
+                groups.update({m: [] for m in range(WARN_MONTHS + 1)})
+                for e in self._entries:
+                    if e.end_month is None:
+                        e.months_left = None
+                        groups["undated"].append(e)
+                        continue
+                    e.months_left = e.end_month - current
+                    if e.months_left < 0:
+                        groups["expired"].append(e)
+                    elif e.months_left <= WARN_MONTHS:
+                        groups[e.months_left].append(e)
+                    else:
+                        groups["later"].append(e)
+                self._groups = groups
+                self._current = current
+
+    # 依結束日排序的所有計畫（Entry 與其 record 皆不可修改）
+    def ordered(self, today=None):
+        self._refresh(today or date.today())
+        with self._lock:
+            return list(self._entries)
+
+    def entry(self, rid, today=None):
+        self._refresh(today or date.today())
+        with self._lock:
+            return self._by_id.get(rid)
+
+    # 到期分組：已結束、距結束 0～WARN_MONTHS 個月（各一組）、之後、未設定結束日；各組依結束日排序
+    def buckets(self, today=None):
+        self._refresh(today or date.today())
+        with self._lock:
+            return {name: list(entries) for name, entries in self._groups.items()}
+
+timeline = BudgetTimeline(datastore.store)